@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from georef_ar_py import codec
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+class ResponseCache:
+    """
+        Caché persistente, en un archivo SQLite, de las respuestas de la API.
+
+    Las respuestas se guardan bajo una clave derivada del método, la URL, el endpoint, los parámetros (normalizados)
+    y el cuerpo de la petición. Cada registro vence luego de un tiempo (ttl) y, cuando el archivo supera el tamaño
+    máximo, se eliminan primero los registros vencidos y luego los menos usados recientemente.
+
+    Con split_bulk, las peticiones POST por lotes se guardan elemento por elemento, de modo que un lote con una
+    sola consulta nueva solo envía esa consulta a la API.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, split_bulk=False, evict_every=100) -> None:
+        """
+        :param path: ruta al archivo de la base de datos.
+        :param ttl: segundos de validez de cada respuesta guardada.
+        :param max_size: tamaño máximo en bytes de las respuestas guardadas.
+        :param split_bulk: guarda por separado cada elemento de una petición POST por lotes.
+        :param evict_every: cantidad de escrituras entre cada control de tamaño.
+        """
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.split_bulk = split_bulk
+        self._evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def conn(self):
+        # Cada proceso abre su propia conexión (ProcessPoolExecutor hereda el objeto al hacer fork).
+        if self._conn is None or self._pid != os.getpid():
+            dirname = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(dirname, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def make_key(method, url, endpoint, params=None, data=None):
+        """
+            Genera la clave de una petición. Los parámetros se normalizan (orden y tipo) para que consultas
+        equivalentes compartan la misma clave.
+        """
+        params = {k: str(v) for k, v in (params or {}).items() if v is not None}
+        raw = json.dumps([method, url, endpoint, params, data], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+            Devuelve la respuesta guardada bajo la clave o None si no existe o está vencida.
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return codec.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """
+            Guarda una respuesta bajo la clave.
+        """
+        now = time.time()
+        raw = codec.dumps(value)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, raw, len(raw), now + (self.ttl if ttl is None else ttl), now)
+            )
+            self._writes += 1
+            if self._writes % self._evict_every == 0:
+                self._evict()
+
+    def _evict(self):
+        self.conn.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+        size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if size <= self.max_size:
+            return
+        excess = size - self.max_size
+        keys = []
+        for key, row_size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            keys.append((key,))
+            excess -= row_size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def evict(self):
+        """ Elimina los registros vencidos y, si se supera el tamaño máximo, los menos usados. """
+        with self._lock:
+            self._evict()
+
+    @property
+    def size(self):
+        """ Tamaño en bytes de las respuestas guardadas. """
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def plan_post(self, url, endpoint, data):
+        """
+            Prepara una petición POST contra la caché.
+        :return: Un objeto CachedPost con los datos que restan consultar a la API (pending).
+        """
+        return CachedPost(self, url, endpoint, data)
+
+
+class CachedPost:
+    """
+        Resuelve una petición POST a partir de la caché. Si quedan consultas sin respuesta guardada, pending contiene
+    el cuerpo a enviar a la API y la respuesta obtenida se debe entregar a resolve().
+    """
+
+    def __init__(self, cache, url, endpoint, data) -> None:
+        super().__init__()
+        self._cache = cache
+        self._url = url
+        self._endpoint = endpoint
+        self._name = None
+        self.pending = None
+        self.result = None
+
+        if cache.split_bulk and isinstance(data, dict) and len(data) == 1:
+            (name, items), = data.items()
+            if isinstance(items, list):
+                self._split(name, items)
+                return
+
+        self._keys = [cache.make_key('POST', url, endpoint, data=data)]
+        self.result = cache.get(self._keys[0])
+        if self.result is None:
+            self.pending = data
+
+    def _split(self, name, items):
+        self._name = name
+        self._keys = [self._cache.make_key('POST', self._url, self._endpoint, data={name: item}) for item in items]
+        self._results = [self._cache.get(key) for key in self._keys]
+        self._missing = [i for i, result in enumerate(self._results) if result is None]
+        if self._missing:
+            self.pending = {name: [items[i] for i in self._missing]}
+        else:
+            self.result = {'resultados': self._results}
+
+    def resolve(self, response):
+        """
+            Guarda la respuesta obtenida para las consultas pendientes y completa el resultado.
+        """
+        if self._name is None:
+            self._cache.set(self._keys[0], response)
+            self.result = response
+        elif 'resultados' in response and len(response['resultados']) == len(self._missing):
+            for i, result in zip(self._missing, response['resultados']):
+                self._cache.set(self._keys[i], result)
+                self._results[i] = result
+            self.result = {'resultados': self._results}
+        elif len(self._missing) == len(self._keys):
+            self.result = response
+        else:
+            raise ValueError("La respuesta no coincide con las consultas pendientes enviadas")
+        self.pending = None
+        return self.result
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+
+from georef_ar_py.cache import ResponseCache
+from georef_ar_py.georequests import API_BASE_URL, CircuitBreaker, ConnectionPool, RateLimiter, RetryPolicy, \
+    SingleFlight, get_json_async, get_json_post_async, get_json_stream_async
+from georef_ar_py.info import consume_entity, get_entity_number_async
+from georef_ar_py.metrics import Metrics
+from georef_ar_py.normalization import Address
+
+log = logging.getLogger(__name__)
+
+MAX_BULK = 1000
+
+
+class GeorefClient:
+    """
+        Cliente asincrónico de la API de georef-ar.
+
+    Reúne la URL, el token, el pool de conexiones, el limitador de peticiones, la caché, la política de reintentos,
+    el circuito que pausa las peticiones si la API falla y las métricas en un solo objeto de larga duración. Un
+    proceso que atiende consultas continuas mantiene así las conexiones abiertas y el estado del limitador entre
+    llamadas, en lugar de recrearlos en cada una. Cada cliente es independiente de los globales de georequests
+    (TOKEN, POOL, CACHE, METRICS, CIRCUIT_BREAKER).
+
+    Uso:
+        async with GeorefClient(token=token) as client:
+            normalization = await client.normalize('Av. Corrientes 1234', provincia='CABA')
+    """
+
+    def __init__(
+            self, url=API_BASE_URL, token=None, pool=None, rate_limiter=None, cache=None, metrics=None,
+            retry_policy=None, concurrency=10, rps=None, bulk_size=500, circuit_breaker=None
+    ) -> None:
+        """
+        :param url: URL de la API.
+        :param token: token a enviar en el encabezado de cada petición.
+        :param pool: un objeto ConnectionPool; por defecto se crea uno propio.
+        :param rate_limiter: un objeto RateLimiter; por defecto se crea uno que se calibra con los encabezados
+        x-ratelimit-* de las respuestas.
+        :param cache: un objeto ResponseCache o la ruta a su archivo.
+        :param metrics: un objeto Metrics; por defecto se crea uno propio.
+        :param retry_policy: un objeto RetryPolicy; por defecto se crea uno propio.
+        :param concurrency: cantidad máxima de peticiones simultáneas del limitador por defecto.
+        :param rps: tope opcional de peticiones por segundo del limitador por defecto.
+        :param bulk_size: cantidad de consultas por petición POST en las operaciones por lotes.
+        :param circuit_breaker: un objeto CircuitBreaker; por defecto se crea uno propio.
+        """
+        super().__init__()
+        if not 0 < bulk_size <= MAX_BULK:
+            raise ValueError(f"bulk_size debe estar entre 1 y {MAX_BULK}")
+        self.url = url
+        self.token = token
+        self.pool = pool or ConnectionPool()
+        self.rate_limiter = rate_limiter or RateLimiter({'second': rps}, concurrency=concurrency)
+        self.cache = ResponseCache(cache) if isinstance(cache, str) else cache
+        self.metrics = metrics or Metrics()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.single_flight = SingleFlight()
+        self.bulk_size = bulk_size
+
+    @property
+    def session(self):
+        return self.pool.async_session()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """ Cierra las conexiones del pool y la caché. """
+        await self.pool.close_async()
+        self.pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    # Peticiones
+
+    async def get(self, endpoint, **params):
+        """
+            Consulta un endpoint por GET.
+        :return: Un diccionario con la respuesta obtenida.
+        """
+        return await get_json_async(
+            self.session, self.url, endpoint, rate_limiter=self.rate_limiter, client=self, **params
+        )
+
+    async def post(self, endpoint, data):
+        """
+            Consulta un endpoint por POST.
+        :return: Un diccionario con la respuesta obtenida.
+        """
+        return await get_json_post_async(
+            self.session, self.url, endpoint, data, rate_limiter=self.rate_limiter, client=self
+        )
+
+    async def post_bulk(self, endpoint, key, queries):
+        """
+            Envía una lista de consultas en peticiones POST de a lo sumo bulk_size consultas, en simultáneo.
+        :param endpoint: endpoint a consultar.
+        :param key: clave de la lista de consultas en el cuerpo de la petición.
+        :param queries: lista de diccionarios con los parámetros de cada consulta.
+        :return: La lista de resultados, en el mismo orden que las consultas.
+        """
+        chunks = [queries[i:i + self.bulk_size] for i in range(0, len(queries), self.bulk_size)]
+        responses = await asyncio.gather(*[self.post(endpoint, {key: chunk}) for chunk in chunks])
+        return [result for response in responses for result in response['resultados']]
+
+    def stream(self, endpoint, entity_key=None, **params):
+        """
+            Obtiene los registros de una consulta uno a uno, a medida que se recibe la respuesta.
+        :return: Un generador asincrónico de diccionarios.
+        """
+        return get_json_stream_async(
+            self.session, self.url, endpoint, entity_key or endpoint.replace('-', '_'),
+            rate_limiter=self.rate_limiter, client=self, **params
+        )
+
+    # Operaciones
+
+    async def normalize(self, direccion, provincia=None, departamento=None, localidad_censal=None, localidad=None):
+        """
+            Normaliza una dirección.
+        :return: Un diccionario con la dirección normalizada o vacío si no se encontró.
+        """
+        address = Address(direccion, provincia, departamento, localidad_censal, localidad)
+        response = await self.get('direcciones', **address.get_params_query())
+        return response['direcciones'][0] if response['direcciones'] else {}
+
+    async def normalize_bulk(self, addresses):
+        """
+            Normaliza una lista de direcciones.
+        :param addresses: lista de textos, diccionarios con las claves de normalization.SOURCE_TEMPLATE u objetos
+        Address.
+        :return: Una lista de diccionarios con cada dirección normalizada o vacíos si no se encontró.
+        """
+        queries = []
+        for address in addresses:
+            if isinstance(address, str):
+                address = Address(address)
+            elif isinstance(address, dict):
+                address = Address(**address)
+            queries.append(address.get_params_query())
+        results = await self.post_bulk('direcciones', 'direcciones', queries)
+        return [result['direcciones'][0] if result['direcciones'] else {} for result in results]
+
+    async def similar(self, endpoint, nombre, **params):
+        """
+            Busca las entidades de una capa con nombre similar.
+        :return: La lista de entidades encontradas.
+        """
+        response = await self.get(endpoint, nombre=nombre, **params)
+        return response[endpoint.replace('-', '_')]
+
+    async def similar_bulk(self, endpoint, nombres):
+        """
+            Normaliza una lista de nombres de alguna de las entidades geográficas.
+        :return: Una lista con la entidad más probable para cada nombre o vacía cuando no hay.
+        """
+        key = endpoint.replace('-', '_')
+        results = await self.post_bulk(endpoint, key, [{'nombre': nombre, 'max': 1} for nombre in nombres])
+        return [result[key][0] if result[key] else {} for result in results]
+
+    async def territorial_units(self, ubicaciones):
+        """
+            Pide las unidades territoriales que contienen a cada punto de una lista de coordenadas.
+        :param ubicaciones: lista de diccionarios con las claves 'lat' y 'lon'.
+        :return: Una lista con las unidades territoriales de cada punto o vacía cuando no hay.
+        """
+        queries = [{'lat': ubicacion['lat'], 'lon': ubicacion['lon'], 'aplanar': True} for ubicacion in ubicaciones]
+        results = await self.post_bulk('ubicacion', 'ubicaciones', queries)
+        return [result['ubicacion'] or {} for result in results]
+
+    async def entity_number(self, entity, **params):
+        """ Devuelve la cantidad de registros de una entidad. """
+        return await get_entity_number_async(self.session, self.url, entity, self, **params)
+
+    async def consume_entity(self, entity, consumer, limit=5000):
+        """
+            Descarga los registros completos de una entidad y los entrega uno a uno a consumer (ver
+        info.consume_entity).
+        """
+        await consume_entity(self.session, self.url, entity, consumer, limit, client=self)
+
+    async def entities(self, entity, limit=5000):
+        """
+            Descarga los registros completos de una entidad.
+        :return: Una lista de diccionarios.
+        """
+        records = []
+        await self.consume_entity(entity, records.append, limit)
+        return records
+
+
+class GeorefClientSync:
+    """
+        Versión sincrónica de GeorefClient. Ejecuta cada operación en un event loop propio que se mantiene entre
+    llamadas, por lo que las conexiones se reutilizan. No se debe usar desde más de un hilo a la vez.
+
+    Uso:
+        with GeorefClientSync(token=token) as client:
+            normalizations = client.normalize_bulk(['Av. Corrientes 1234', 'San Martín 390'])
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        """
+        :param args: parámetros de GeorefClient.
+        :param kwargs: parámetros de GeorefClient.
+        """
+        super().__init__()
+        self._loop = asyncio.new_event_loop()
+        self.client = GeorefClient(*args, **kwargs)
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if not self._loop.is_closed():
+            self._run(self.client.close())
+            self._loop.close()
+
+    @property
+    def metrics(self):
+        return self.client.metrics
+
+    def get(self, endpoint, **params):
+        return self._run(self.client.get(endpoint, **params))
+
+    def post(self, endpoint, data):
+        return self._run(self.client.post(endpoint, data))
+
+    def normalize(self, direccion, **kwargs):
+        return self._run(self.client.normalize(direccion, **kwargs))
+
+    def normalize_bulk(self, addresses):
+        return self._run(self.client.normalize_bulk(addresses))
+
+    def similar(self, endpoint, nombre, **params):
+        return self._run(self.client.similar(endpoint, nombre, **params))
+
+    def similar_bulk(self, endpoint, nombres):
+        return self._run(self.client.similar_bulk(endpoint, nombres))
+
+    def territorial_units(self, ubicaciones):
+        return self._run(self.client.territorial_units(ubicaciones))
+
+    def entity_number(self, entity, **params):
+        return self._run(self.client.entity_number(entity, **params))
+
+    def entities(self, entity, limit=5000):
+        return self._run(self.client.entities(entity, limit))
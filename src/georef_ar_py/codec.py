@@ -0,0 +1,46 @@
+"""
+    Codificación y decodificación JSON. Si está instalado orjson (pip install "georef-ar-py[fast]") se usa para
+decodificar directamente desde bytes y codificar a bytes; en otro caso se usa el módulo json de la biblioteca
+estándar.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def backend():
+    return 'orjson' if orjson is not None else 'json'
+
+
+def loads(data):
+    """
+        Decodifica un documento JSON.
+    :param data: bytes o str con el documento.
+    :return: El objeto decodificado.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """
+        Codifica un objeto como JSON compacto en UTF-8.
+    :param obj: objeto a codificar.
+    :return: Los bytes del documento.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_str(obj):
+    """
+        Codifica un objeto como JSON compacto.
+    :param obj: objeto a codificar.
+    :return: Un str con el documento.
+    """
+    return dumps(obj).decode('utf-8')
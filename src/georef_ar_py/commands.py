@@ -1,18 +1,22 @@
-import asyncio
-import concurrent.futures
+import io
 import json
 import logging
 import os
+import time
 
 import click
 
 from georef_ar_py import georequests
+from georef_ar_py.client import GeorefClientSync
 from georef_ar_py.constants import ENTITIES
-from georef_ar_py.diff import process
+from georef_ar_py.context import Report
+from georef_ar_py.diff import process_layers
 from georef_ar_py.georequests import API_BASE_URL
 from georef_ar_py.info import get_resume
-from georef_ar_py.normalization import AddressNormalizer, Address
+from georef_ar_py.normalization import AddressNormalizer
 from georef_ar_py.plotter import plot_csv_points
+from georef_ar_py.server import DEFAULT_LIMITS, serve as serve_stand_in
+from georef_ar_py.streets import StreetIndex
 from georef_ar_py.utils import converter
 
 
@@ -22,6 +26,99 @@ def get_logger(level):
     return logger
 
 
+def cache_options(func):
+    options = [
+        click.option(
+            '--cache', required=False, type=click.Path(dir_okay=False), default=None,
+            help="Archivo donde guardar en caché las respuestas de la API"
+        ),
+        click.option(
+            '--cache_ttl', required=False, type=int, show_default=True, default=24 * 60 * 60,
+            help="Segundos de validez de cada respuesta en caché"
+        ),
+        click.option(
+            '--cache_max_size', required=False, type=int, show_default=True, default=512,
+            help="Tamaño máximo de la caché en MB"
+        ),
+        click.option(
+            '--cache_split_bulk', is_flag=True, show_default=False,
+            help="Guarda en caché cada elemento de las peticiones POST por lotes"
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def metrics_option(func):
+    return click.option(
+        '--metrics', required=False, type=click.Path(dir_okay=False, writable=True), default=None,
+        help="Archivo json donde guardar las métricas de las peticiones (latencias, bytes, estados, reintentos)"
+    )(func)
+
+
+def save_metrics(filename, log):
+    if filename:
+        georequests.METRICS.to_json(filename)
+        log.info(f"Métricas guardadas en {filename}")
+
+
+def circuit_breaker_options(func):
+    options = [
+        click.option(
+            '--breaker_error_rate', required=False, type=click.FloatRange(0, 1), show_default=True, default=0.5,
+            help="Proporción de peticiones fallidas (errores de conexión, timeouts y 5xx) a partir de la cual se "
+                 "pausan las peticiones hasta que la API responda a una prueba; 0 lo desactiva"
+        ),
+        click.option(
+            '--breaker_open_time', required=False, type=float, show_default=True, default=1.0,
+            help="Segundos de pausa antes de la primera petición de prueba; se duplican con cada prueba fallida"
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def configure_circuit_breaker(kwargs):
+    georequests.configure_circuit_breaker(kwargs.pop('breaker_error_rate'), open_time=kwargs.pop('breaker_open_time'))
+
+
+def report_option(func):
+    return click.option(
+        '--report_dir', required=False, type=click.Path(file_okay=False, writable=True), default=None,
+        help="Directorio donde guardar un reporte json de la ejecución (etapas, filas por segundo, peticiones hechas "
+             "y evitadas, reintentos, errores, memoria máxima y margen del límite de peticiones)"
+    )(func)
+
+
+def create_report(command, report_dir, log):
+    """ Crea el reporte de un comando. Con report_dir, además captura los mensajes de todos los módulos. """
+    report = Report(log, io.StringIO(), name=f'geoarpy-{command}')
+    if report_dir:
+        report.capture(logging.getLogger(), "%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    return report
+
+
+def save_report(report, report_dir, log):
+    """ Agrega al reporte las métricas de las peticiones y lo guarda en report_dir, si se indicó. """
+    report.release()
+    if report_dir:
+        report.get_data('requests').update(georequests.METRICS.snapshot())
+        if georequests.CIRCUIT_BREAKER is not None:
+            report.get_data('circuit_breaker').update(georequests.CIRCUIT_BREAKER.snapshot())
+        log.info(f"Reporte guardado en {report.write(report_dir)}")
+
+
+def configure_cache(kwargs):
+    georequests.configure_cache(
+        kwargs.pop('cache'),
+        ttl=kwargs.pop('cache_ttl'),
+        max_size=kwargs.pop('cache_max_size') * 1024 * 1024,
+        split_bulk=kwargs.pop('cache_split_bulk')
+    )
+
+
 @click.group()
 def cli():
     pass
@@ -42,6 +139,10 @@ def cli():
     '--extension', required=False, type=click.Choice(['json', 'csv', 'both'], case_sensitive=True),
     show_default=True, default="both"
 )
+@cache_options
+@circuit_breaker_options
+@metrics_option
+@report_option
 @click.option('--debug', is_flag=True, show_default=False)
 def diff(*args, **kwargs):
     """
@@ -54,6 +155,8 @@ def diff(*args, **kwargs):
     """
     debug = kwargs.pop('debug')
     log = get_logger(logging.DEBUG if debug else logging.INFO)
+    report_dir = kwargs.pop('report_dir')
+    report = create_report('diff', report_dir, log)
     log.info("Comenzando la generación de diferencias...")
 
     src_url = kwargs.pop('origin_url')
@@ -61,6 +164,9 @@ def diff(*args, **kwargs):
     ext = kwargs.pop('extension')
     layer = kwargs.pop('layer')
     georequests.__dict__['TOKEN'] = kwargs.pop('token')
+    metrics = kwargs.pop('metrics')
+    configure_cache(kwargs)
+    configure_circuit_breaker(kwargs)
 
     path_dir = os.getcwd()
 
@@ -72,9 +178,17 @@ def diff(*args, **kwargs):
     if isinstance(entities, str):
         entities = [layer]
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        for entity in entities:
-            executor.submit(process, src_url, target_url, entity, path_dir, ext)
+    layers = report.get_data('layers')
+    start = time.monotonic()
+    with report.stage('diff'):
+        for entity, exception in process_layers(src_url, target_url, entities, path_dir, ext):
+            layers[entity] = {'elapsed': time.monotonic() - start, 'ok': exception is None}
+            if exception is not None:
+                log.error(f"Error al procesar una capa: {exception}")
+
+    georequests.close()
+    save_metrics(metrics, log)
+    save_report(report, report_dir, log)
 
 
 @cli.command()
@@ -83,6 +197,10 @@ def diff(*args, **kwargs):
     '--token', required=False, type=str, show_default=True, default=None,
     help="Un token para enviar en el encabezado de cada petición"
 )
+@cache_options
+@circuit_breaker_options
+@metrics_option
+@report_option
 @click.option('--debug', is_flag=True, show_default=False)
 def info(*args, **kwargs):
     """
@@ -94,17 +212,27 @@ def info(*args, **kwargs):
     """
     debug = kwargs.pop('debug')
     log = get_logger(logging.DEBUG if debug else logging.INFO)
+    report_dir = kwargs.pop('report_dir')
+    report = create_report('info', report_dir, log)
     log.info("Comenzando la generación del resumen...")
 
     target_url = kwargs.pop('url')
     georequests.__dict__['TOKEN'] = kwargs.pop('token')
+    metrics = kwargs.pop('metrics')
+    configure_cache(kwargs)
+    configure_circuit_breaker(kwargs)
 
-    resume = asyncio.run(get_resume(target_url))
+    with report.stage('download'):
+        resume = georequests.run_async(get_resume(target_url))
+    georequests.close()
+    save_metrics(metrics, log)
 
     filename = os.path.join(os.getcwd(), 'info.json')
     log.info(f"Guardando archivo en {filename}")
-    with open(filename, '+w') as f:
+    with report.stage('write'), open(filename, '+w') as f:
         json.dump(resume, f)
+    report.get_data('entities').update({entity: data['total'] for entity, data in resume.items()})
+    save_report(report, report_dir, log)
 
 
 @cli.command()
@@ -128,18 +256,19 @@ def normalize(*args, **kwargs):
     url es el path a la API destino que se quiere consultar.
     """
     debug = kwargs.pop('debug')
-    get_logger(logging.DEBUG if debug else logging.INFO)
+    log = get_logger(logging.DEBUG if debug else logging.INFO)
 
     target_url = kwargs.pop('url')
-    georequests.__dict__['TOKEN'] = kwargs.pop('token')
-
-    address = Address(**kwargs)
+    token = kwargs.pop('token')
 
-    address_normalizer = AddressNormalizer(target_url)
+    with GeorefClientSync(target_url, token=token) as client:
+        try:
+            normalization = client.normalize(**kwargs)
+        except Exception as e:
+            log.error(f"No se pudo normalizar la dirección: {e}")
+            normalization = {}
 
-    address_normalizer.normalize(address)
-
-    print(address.nomenclature)
+    print(normalization.get('nomenclatura', ''))
 
 
 @cli.command()
@@ -162,6 +291,50 @@ def normalize(*args, **kwargs):
     '--rps', required=False, type=int, show_default=True, default=None,
     help="Número máximo de peticiones por segundo"
 )
+@click.option(
+    '--concurrency', required=False, type=int, show_default=True, default=10,
+    help="Número máximo de peticiones simultáneas"
+)
+@click.option(
+    '--queue_size', required=False, type=int, show_default=True, default=4,
+    help="Cantidad máxima de chunks leídos en espera de ser consultados o escritos"
+)
+@click.option(
+    '--resume', is_flag=True, show_default=False,
+    help="Continúa una ejecución interrumpida desde la última fila escrita en output_csv"
+)
+@click.option(
+    '--workers', required=False, type=click.IntRange(min=1), show_default=True, default=1,
+    help="Cantidad de procesos entre los que se reparten las filas y el límite de peticiones"
+)
+@click.option(
+    '--geometry', is_flag=True, show_default=False,
+    help="Agrega a un output_csv .parquet una columna geometry con la ubicación (GeoParquet)"
+)
+@click.option(
+    '--adaptive', is_flag=True, show_default=False,
+    help="Ajusta el tamaño de los POST (desde data_size) y la concurrencia según las latencias y los errores"
+)
+@click.option(
+    '--target_latency', required=False, type=float, show_default=True, default=5.0,
+    help="Segundos por respuesta a partir de los cuales --adaptive achica los lotes"
+)
+@click.option(
+    '--street_index', required=False, type=click.Path(exists=True, dir_okay=False), default=None,
+    help="Índice de calles (ver street-index) con el que se resuelven direcciones sin consultar la API"
+)
+@click.option(
+    '--min_score', required=False, type=click.FloatRange(0, 1), show_default=True, default=0.8,
+    help="Puntaje mínimo de similitud del nombre de la calle para usar el índice de calles"
+)
+@click.option(
+    '--resolve_context', is_flag=True, show_default=False,
+    help="Resuelve a IDs los nombres de provincia, departamento y localidad censal antes de consultar"
+)
+@cache_options
+@circuit_breaker_options
+@metrics_option
+@report_option
 @click.option('--debug', is_flag=True, show_default=False)
 def batch_normalize(input_csv, output_csv, **kwargs):
     """
@@ -172,24 +345,90 @@ def batch_normalize(input_csv, output_csv, **kwargs):
      Optativamente, se pueden suministrar columnas con información extra bajo los siguientes encabezados:
         "localidad_censal", "localidad", "departamento", "provincia"
 
-    Escribe los resultados a un archivo csv (output_csv)
+    Escribe los resultados a un archivo csv (output_csv). Mientras dura la ejecución se guarda un checkpoint en
+    output_csv.checkpoint, que permite retomarla con --resume si se interrumpe. Con --workers N el archivo se divide en
+    N partes que se normalizan en procesos separados (output_csv.partK) y se unen en orden al terminar; los campos no
+    deben contener saltos de línea.
+
+    Los archivos con extensión .parquet o .arrow/.feather se leen y escriben en esos formatos (requiere pyarrow). La
+    salida conserva los tipos numéricos y --geometry agrega la ubicación en WKB para leerla con geopandas. Con salidas
+    Parquet o Arrow no se puede usar --resume, y --workers requiere una entrada csv.
+
+    Con --street_index, las direcciones que se encuentran en el índice de calles se resuelven localmente y solo el
+    resto se consulta a la API.
+
+    Con --resolve_context, los valores distintos de provincia, departamento y localidad censal se resuelven a IDs una
+    sola vez, con POST por lotes a sus endpoints, y las direcciones se consultan con esos IDs.
     """
 
     debug = kwargs.pop('debug')
     log = get_logger(logging.DEBUG if debug else logging.INFO)
+    report_dir = kwargs.pop('report_dir')
+    report = create_report('batch-normalize', report_dir, log)
     log.info("Comenzando la normalización...")
 
     target_url = kwargs.pop('url')
     georequests.__dict__['TOKEN'] = kwargs.pop('token')
+    metrics = kwargs.pop('metrics')
+    configure_cache(kwargs)
+    configure_circuit_breaker(kwargs)
 
     normalizer = AddressNormalizer(
         url=target_url,
         chunk_size=kwargs.pop('chunk_size'),
         data_size=kwargs.pop('data_size'),
-        rps=kwargs.pop('rps')
+        rps=kwargs.pop('rps'),
+        concurrency=kwargs.pop('concurrency'),
+        queue_size=kwargs.pop('queue_size'),
+        street_index=kwargs.pop('street_index'),
+        min_score=kwargs.pop('min_score'),
+        adaptive=kwargs.pop('adaptive'),
+        target_latency=kwargs.pop('target_latency'),
+        resolve_context=kwargs.pop('resolve_context')
     )
 
-    normalizer.csv2csv(input_csv, output_csv)
+    with report.stage('normalization'):
+        normalizer.normalize_file(
+            input_csv, output_csv, resume=kwargs.pop('resume'), workers=kwargs.pop('workers'),
+            geometry=kwargs.pop('geometry')
+        )
+    georequests.close()
+    save_metrics(metrics, log)
+    report.get_data('normalization').update(normalizer.summary)
+    save_report(report, report_dir, log)
+
+
+@cli.command()
+@click.argument('output_file', type=click.Path(dir_okay=False, writable=True))
+@click.option('--url', required=False, type=str, show_default=True, default=API_BASE_URL)
+@click.option(
+    '--token', required=False, type=str, show_default=True, default=None,
+    help="Un token para enviar en el encabezado de cada petición"
+)
+@metrics_option
+@click.option('--debug', is_flag=True, show_default=False)
+def street_index(output_file, **kwargs):
+    """
+    geoarpy street index Commandline
+
+    Descarga la capa completa de calles y guarda un índice local (output_file, .npz) con los rangos de alturas y la
+    geometría de cada calle por localidad censal, para normalizar direcciones sin consultar la API
+    (batch-normalize --street_index).
+    """
+    debug = kwargs.pop('debug')
+    log = get_logger(logging.DEBUG if debug else logging.INFO)
+    log.info("Descargando calles...")
+
+    target_url = kwargs.pop('url')
+    georequests.__dict__['TOKEN'] = kwargs.pop('token')
+    metrics = kwargs.pop('metrics')
+
+    index = StreetIndex.download(target_url)
+    georequests.close()
+    index.save(output_file)
+    log.info(f"Índice de {len(index)} calles guardado en {output_file}")
+    save_metrics(metrics, log)
+
 
 @cli.command()
 @click.argument('input_file', type=click.Path(exists=True))
@@ -235,3 +474,55 @@ def plot_file(input_file, **kwargs):
     get_logger(logging.DEBUG if debug else logging.INFO)
 
     plot_csv_points(input_file, output_file, lon_head=kwargs.get('lon'), lat_head=kwargs.get('lat'))
+
+
+@cli.command()
+@click.option('--host', required=False, type=str, show_default=True, default='127.0.0.1')
+@click.option('--port', required=False, type=int, show_default=True, default=8080)
+@click.option(
+    '--prefix', required=False, type=str, show_default=True, default='/',
+    help="Prefijo de las rutas de la API (por ejemplo /georef/api/)"
+)
+@click.option(
+    '--fixtures', required=False, type=click.Path(exists=True, file_okay=False), default=None,
+    help="Directorio con respuestas de la API por entidad (<entidad>.json)"
+)
+@click.option(
+    '--size', required=False, type=int, show_default=True, default=1000,
+    help="Cantidad de registros sintéticos por entidad"
+)
+@click.option(
+    '--latency', required=False, type=float, show_default=True, default=0.0,
+    help="Demora media en segundos de cada respuesta"
+)
+@click.option(
+    '--jitter', required=False, type=float, show_default=True, default=0.0,
+    help="Variación máxima en segundos de la demora"
+)
+@click.option(
+    '--error_rate', required=False, type=float, show_default=True, default=0.0,
+    help="Proporción de peticiones que responden con un error del servidor"
+)
+@click.option(
+    '--limit', 'limits', required=False, type=(click.Choice(list(DEFAULT_LIMITS.keys())), int), multiple=True,
+    help="Peticiones permitidas por período, por ejemplo: --limit second 50"
+)
+@click.option('--no_limits', is_flag=True, show_default=False, help="No limita las peticiones")
+@click.option('--seed', required=False, type=int, show_default=True, default=0)
+@click.option('--debug', is_flag=True, show_default=False)
+def serve(**kwargs):
+    """
+    geoarpy serve Commandline
+
+    Sirve localmente una API de prueba que imita a georef-ar, con datos sintéticos o leídos de archivos,
+    para medir el rendimiento de los demás comandos sin conexión (--url http://127.0.0.1:8080/).
+    """
+
+    debug = kwargs.pop('debug')
+    get_logger(logging.DEBUG if debug else logging.INFO)
+
+    limits = dict(DEFAULT_LIMITS, **dict(kwargs.pop('limits')))
+    if kwargs.pop('no_limits'):
+        limits = {}
+
+    serve_stand_in(limits=limits, **kwargs)
@@ -1,6 +1,49 @@
 import json
+import logging
 import os
+import sys
 import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss():
+    """Devuelve el máximo de memoria residente (RSS) del proceso y de sus
+    procesos hijos terminados, en MB, o None si la plataforma no lo informa.
+
+    """
+    if resource is None:
+        return None
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    return usage / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class _ReportHandler(logging.Handler):
+    """Handler de logging que agrega los mensajes al texto de un reporte y
+    cuenta sus advertencias y errores (ver Report.capture).
+
+    """
+
+    def __init__(self, report):
+        super().__init__()
+        self._report = report
+
+    def emit(self, record):
+        report = self._report
+        # Los mensajes del logger del reporte ya se cuentan en warn() y error()
+        if record.name != report.logger.name:
+            if record.levelno >= logging.ERROR:
+                report._errors += 1
+            elif record.levelno >= logging.WARNING:
+                report._warnings += 1
+        if report._logger_stream is not None:
+            report._logger_stream.write(self.format(record) + '\n')
 
 
 class Report:  # pylint: disable=attribute-defined-outside-init
@@ -13,22 +56,28 @@ class Report:  # pylint: disable=attribute-defined-outside-init
         _logger_stream (io.StringIO): Contenidos del logger en forma de str.
         _errors (int): Cantidad de errores registrados.
         _warnings (int): Cantidad de advertencias registradas.
+        _name (str): Nombre del proceso, usado en el nombre de los archivos.
         _filename_base (str): Nombre base para el archivo de reporte de texto y
             el archivo de datos.
+        _started (float): Momento de inicio del proceso (time.time()).
         _data (dict): Datos varios de la ejecución del proceso.
+        _stages (dict): Segundos acumulados en cada etapa del proceso.
 
     """
 
-    def __init__(self, logger, logger_stream=None):
+    def __init__(self, logger, logger_stream=None, name='georef-etl'):
         """Inicializa un objeto de tipo 'Report'.
 
         Args:
             logger (logging.Logger): Ver atributo '_logger'.
             logger_stream (io.StringIO): Ver atributo '_logger_stream'.
+            name (str): Ver atributo '_name'.
 
         """
         self._logger = logger
         self._logger_stream = logger_stream
+        self._name = name
+        self._captured = []
         self.reset()
 
     def info(self, *args):
@@ -71,15 +120,99 @@ class Report:  # pylint: disable=attribute-defined-outside-init
         self._errors += 1
         self._logger.exception(*args)
 
+    def capture(self, logger, fmt=None):
+        """Agrega al reporte los mensajes de otro logger (por ejemplo, el
+        logger raíz, para incluir los de todos los módulos) y cuenta sus
+        advertencias y errores.
+
+        Args:
+            logger (logging.Logger): Logger a capturar.
+            fmt (str): Formato de los mensajes en el texto del reporte.
+
+        """
+        handler = _ReportHandler(self)
+        handler.setFormatter(logging.Formatter(fmt))
+        logger.addHandler(handler)
+        self._captured.append((logger, handler))
+
+    def release(self):
+        """Deja de capturar los loggers agregados con capture()."""
+        for logger, handler in self._captured:
+            logger.removeHandler(handler)
+        self._captured = []
+
     def reset(self):
         """Reestablece el estado interno del reporte."""
         self._errors = 0
         self._warnings = 0
         self._indent = 0
-        self._filename_base = time.strftime('georef-etl-%Y.%m.%d-%H.%M.%S.{}')
+        self._filename_base = time.strftime(self._name + '-%Y.%m.%d-%H.%M.%S.{}')
+        self._started = time.time()
         self._data = {}
+        self._stages = {}
         self._process_registry = {}
 
+    def get_data(self, creator):
+        """Devuelve la sección de datos de un componente del proceso,
+        creándola si no existe.
+
+        Args:
+            creator (str): Nombre de la sección.
+
+        Returns:
+            dict: Datos de la sección, modificables.
+
+        """
+        return self._data.setdefault(creator, {})
+
+    @contextmanager
+    def stage(self, name):
+        """Mide la duración de una etapa del proceso. Si la etapa se ejecuta
+        varias veces, se acumulan los segundos.
+
+        Args:
+            name (str): Nombre de la etapa.
+
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._stages[name] = self._stages.get(name, 0.0) + \
+                time.monotonic() - start
+
+    def _get_report_txt(self):
+        """Devuelve los registros del logger del reporte.
+
+        Returns:
+            str: Texto del reporte.
+
+        """
+        return self._logger_stream.getvalue()
+
+    def _get_report_json(self):
+        """Arma los datos del reporte: duración, etapas, errores,
+        advertencias, memoria máxima y las secciones de datos.
+
+        Returns:
+            dict: Datos del reporte.
+
+        """
+        finished = time.time()
+        return {
+            'process': self._name,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                     time.localtime(self._started)),
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                      time.localtime(finished)),
+            'elapsed': finished - self._started,
+            'stages': dict(self._stages),
+            'errors': self._errors,
+            'warnings': self._warnings,
+            'peak_rss_mb': peak_rss(),
+            **self._data
+        }
+
     def write(self, dirname):
         """Escribe los contenidos del reporte (texto y datos) a dos archivos
         dentro de un directorio específico.
@@ -87,6 +220,9 @@ class Report:  # pylint: disable=attribute-defined-outside-init
         Args:
             dirname (str): Directorio donde almacenar los archivos.
 
+        Returns:
+            str: Ruta del archivo de datos.
+
         """
         os.makedirs(dirname, exist_ok=True, mode=0o700)
         filename_json = self._filename_base.format('json')
@@ -99,6 +235,8 @@ class Report:  # pylint: disable=attribute-defined-outside-init
         with open(os.path.join(dirname, filename_json), 'w') as f:
             json.dump(self._get_report_json(), f, ensure_ascii=False, indent=4)
 
+        return os.path.join(dirname, filename_json)
+
     @property
     def logger(self):
         return self._logger
@@ -1,17 +1,16 @@
 import asyncio
-import json
+import concurrent.futures
 import logging
 import os
 import re
 
-import aiohttp
 import pandas as pd
 from deepdiff import DeepDiff
 from requests import RequestException
 
-from georef_ar_py import constants
-from georef_ar_py.georequests import get_json_async
-from georef_ar_py.info import get_entity_number, get_departments_ids
+from georef_ar_py import georequests
+from georef_ar_py.georequests import POOL, get_json_stream_async, run_async
+from georef_ar_py.info import get_entity_number, get_regions
 
 log = logging.getLogger(__name__)
 
@@ -38,8 +37,8 @@ class DiffEntity:
         self._max_src = None
         self._max_target = None
 
-    async def _get_response(self, session, url, **kwargs):
-        return await get_json_async(session, url, self._entity, **kwargs)
+    def _iter_response(self, session, url, **kwargs):
+        return get_json_stream_async(session, url, self._entity, self._entity_key, **kwargs)
 
     @property
     def max_src(self):
@@ -56,8 +55,7 @@ class DiffEntity:
     async def _get_registers(self, session, url, **kwargs):
         log.debug(f"Obteniendo registros de {url}")
         try:
-            response = await self._get_response(session, url, **kwargs)
-            return {entity['id']: entity for entity in response[self._entity_key]}
+            return {entity['id']: entity async for entity in self._iter_response(session, url, **kwargs)}
         except asyncio.CancelledError:
             log.error(f"Cancelando la descarga de {url}")
 
@@ -68,19 +66,9 @@ class DiffEntity:
         params = {'campos': 'completo', 'orden': 'id', 'max': limit}
 
         subtasks = []
-        for state_id in constants.PROVINCES_DICT.keys():
-            max_items_province = get_entity_number(url, self._entity, provincia=state_id)
-            if max_items_province <= limit:
-                log.info(f"Consultando {self._entity}:provincia[{state_id}]")
-                params.pop('departamento', None)
-                params.update({'provincia': state_id})
-                subtasks.append(self._get_registers(session, url, **params))
-            else:
-                for dep_id in get_departments_ids(url, state_id):
-                    log.info(f"Consultando {self._entity}:departamento[{dep_id}]")
-                    params.pop('provincia', None)
-                    params.update({'departamento': dep_id})
-                    subtasks.append(self._get_registers(session, url, **params))
+        for region in await get_regions(session, url, self._entity, limit):
+            log.info(f"Consultando {self._entity}:{region}")
+            subtasks.append(self._get_registers(session, url, **params, **region))
 
         responses = await asyncio.gather(*subtasks)
 
@@ -110,12 +98,12 @@ class DiffEntity:
 
     async def _get_diff_as_dict(self):
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                registers = await asyncio.gather(self.get_src_registers(session), self.get_target_registers(session))
-                log.info(f"Recursos descargados")
-            except Exception:
-                log.error(f"Descarga de recursos cancelada!")
+        session = POOL.async_session()
+        try:
+            registers = await asyncio.gather(self.get_src_registers(session), self.get_target_registers(session))
+            log.info(f"Recursos descargados")
+        except Exception:
+            log.error(f"Descarga de recursos cancelada!")
 
         return DeepDiff(
             *registers,
@@ -126,12 +114,13 @@ class DiffEntity:
     @property
     def diff_dict(self):
         if not self._diff_dict:
-            self._diff_dict = asyncio.run(self._get_diff_as_dict())
+            self._diff_dict = run_async(self._get_diff_as_dict())
         return self._diff_dict
 
     def diff_as_json(self, filename):
-        with open(filename, '+w') as f:
-            json.dump(json.loads(self.diff_dict.to_json()), f)
+        # DeepDiff.to_json ya serializa con orjson si está instalado; se escribe sin volver a decodificar.
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(self.diff_dict.to_json())
             log.debug(f"Archivo generado: {filename}")
 
     def diff_as_csv(self, filename):
@@ -193,6 +182,16 @@ def get_diff_object(src_url, target_url, entity):
 
 
 def process(src_url, target_url, layer, path_dir, ext):
+    """
+        Genera los archivos de diferencias de una capa, en un proceso del pool de process_layers.
+    :return: Las métricas de las peticiones realizadas (ver Metrics.merge) y los tiempos del circuito de peticiones
+    (ver CircuitBreaker.merge) o None si está desactivado, para reunirlos en el proceso principal.
+    """
+    # El pool reutiliza sus procesos entre capas: se reinician las métricas y el circuito para devolver solo los
+    # registros de esta capa.
+    georequests.METRICS.reset()
+    if georequests.CIRCUIT_BREAKER is not None:
+        georequests.CIRCUIT_BREAKER.reset()
     try:
         diff_entity = get_diff_object(src_url, target_url, layer)
         if ext == 'both':
@@ -204,3 +203,24 @@ def process(src_url, target_url, layer, path_dir, ext):
             diff_entity.diff_as_csv(os.path.join(path_dir, f'diff_{layer}.csv'))
     except RequestException as rqe:
         logging.error(f'No se pudo procesar la petición {rqe.request}')
+    circuit_breaker = georequests.CIRCUIT_BREAKER
+    return georequests.METRICS.endpoints, circuit_breaker.snapshot() if circuit_breaker is not None else None
+
+
+def process_layers(src_url, target_url, layers, path_dir, ext, max_workers=None):
+    """
+        Genera los archivos de diferencias de cada capa en un pool de procesos (ver process) y suma a METRICS y a
+    CIRCUIT_BREAKER las métricas y los tiempos del circuito de cada una.
+    :param max_workers: cantidad de procesos; por defecto, uno por CPU.
+    :return: Un generador de tuplas (capa, excepción o None), a medida que termina cada capa.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(process, src_url, target_url, layer, path_dir, ext): layer for layer in layers}
+        for future in concurrent.futures.as_completed(futures):
+            exception = future.exception()
+            if exception is None:
+                endpoints, circuit_breaker = future.result()
+                georequests.METRICS.merge(endpoints)
+                if circuit_breaker is not None and georequests.CIRCUIT_BREAKER is not None:
+                    georequests.CIRCUIT_BREAKER.merge(circuit_breaker)
+            yield futures[future], exception
@@ -0,0 +1,357 @@
+"""
+    Lectura por partes y escritura de tablas en csv, Parquet y Arrow IPC (Feather v2) para la normalización por lotes.
+Parquet y Arrow requieren pyarrow (pip install "georef-ar-py[parquet]").
+"""
+import abc
+import contextlib
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CSV, PARQUET, ARROW = 'csv', 'parquet', 'arrow'
+EXTENSIONS = {'.parquet': PARQUET, '.pq': PARQUET, '.arrow': ARROW, '.feather': ARROW, '.ipc': ARROW}
+
+
+def file_format(filename):
+    """ Devuelve el formato de un archivo según su extensión: 'parquet', 'arrow' o, para cualquier otra, 'csv'. """
+    return EXTENSIONS.get(os.path.splitext(filename)[1].lower(), CSV)
+
+
+def _require_pyarrow(fmt):
+    if pa is None:
+        raise ImportError(f'El formato {fmt} requiere pyarrow: pip install "georef-ar-py[parquet]"')
+
+
+class CsvShard(io.RawIOBase):
+    """
+        Vista de solo lectura de un rango de bytes de un csv, precedido por la línea de encabezado del archivo. El
+    rango debe empezar y terminar en un límite de línea (ver csv_shards).
+    """
+
+    def __init__(self, filename, start, end) -> None:
+        super().__init__()
+        self._file = open(filename, 'rb')
+        header = self._file.readline()
+        self._prefix = header if start > 0 else b''
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        size = self._file.readinto(memoryview(buffer)[:min(len(buffer), self._remaining)])
+        self._remaining -= size
+        return size
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+    @classmethod
+    def count_rows(cls, filename, start, end):
+        """ Cantidad de filas de datos del rango. """
+        rows = 0
+        last = b'\n'
+        with cls(filename, start, end) as shard:
+            shard._prefix = b''
+            while chunk := shard.read(1024 * 1024):
+                rows += chunk.count(b'\n')
+                last = chunk[-1:]
+        return rows + (last != b'\n')
+
+
+def csv_shards(filename, count):
+    """
+        Divide las filas de datos de un csv en a lo sumo count rangos de bytes de tamaño similar, cortados en límites
+    de línea. Supone que los campos no contienen saltos de línea.
+    :return: Una lista de tuplas (inicio, fin).
+    """
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        f.readline()
+        header = f.tell()
+        bounds = [header]
+        for i in range(1, count):
+            f.seek(max(header + (size - header) * i // count - 1, bounds[-1]))
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+# Lectura
+
+def count_rows(filename):
+    """ Cantidad de filas de datos de un archivo. En Parquet se lee de los metadatos. """
+    fmt = file_format(filename)
+    if fmt == PARQUET:
+        _require_pyarrow(fmt)
+        return pq.ParquetFile(filename).metadata.num_rows
+    if fmt == ARROW:
+        with _open_ipc(filename) as reader:
+            return sum(batch.num_rows for batch in reader)
+    with open(filename, mode="r") as f:
+        return sum(1 for _ in f) - 1
+
+
+@contextlib.contextmanager
+def _open_ipc(filename):
+    """ Abre un archivo Arrow IPC en formato de archivo o de stream y devuelve un iterable de record batches. """
+    _require_pyarrow(ARROW)
+    with pa.memory_map(filename) as source:
+        try:
+            reader = ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = ipc.open_stream(source)
+        yield batches
+
+
+def _batch_to_frame(batch, columns):
+    """ Convierte un record batch o una tabla en un DataFrame con las columnas pedidas que existan, como texto. """
+    arrays = {}
+    for name in columns:
+        index = batch.schema.get_field_index(name)
+        if index >= 0:
+            array = batch.column(index)
+            arrays[name] = array if pa.types.is_string(array.type) else pc.cast(array, pa.string())
+    return pa.table(arrays).to_pandas() if arrays else pd.DataFrame(index=range(batch.num_rows))
+
+
+def _arrow_batches(filename, fmt, chunk_size, skip, columns):
+    if fmt == PARQUET:
+        parquet = pq.ParquetFile(filename)
+        groups = []
+        for i in range(parquet.num_row_groups):
+            rows = parquet.metadata.row_group(i).num_rows
+            if skip >= rows and not groups:
+                skip -= rows
+            else:
+                groups.append(i)
+        if not groups:
+            return
+        present = [name for name in columns if name in parquet.schema_arrow.names]
+        batches = parquet.iter_batches(batch_size=chunk_size, row_groups=groups, columns=present)
+        yield from _rebatch(batches, chunk_size, skip, columns)
+    else:
+        with _open_ipc(filename) as batches:
+            yield from _rebatch(batches, chunk_size, skip, columns)
+
+
+def _rebatch(batches, chunk_size, skip, columns):
+    """ Omite las primeras skip filas y reagrupa los record batches en partes de chunk_size filas, como read_csv. """
+    pending, size = [], 0
+    for batch in batches:
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        batch = batch.slice(skip)
+        skip = 0
+        pending.append(batch)
+        size += batch.num_rows
+        while size >= chunk_size:
+            table = pa.Table.from_batches(pending)
+            yield _batch_to_frame(table.slice(0, chunk_size), columns)
+            pending, size = table.slice(chunk_size).to_batches(), size - chunk_size
+    if size:
+        yield _batch_to_frame(pa.Table.from_batches(pending), columns)
+
+
+def read_frames(filename, columns, chunk_size, skip=0, shard=None):
+    """
+        Lee un archivo por partes de a lo sumo chunk_size filas.
+    :param filename: archivo csv, Parquet o Arrow IPC.
+    :param columns: columnas a leer de los archivos Parquet y Arrow, que se convierten a texto.
+    :param skip: cantidad de filas iniciales a omitir.
+    :param shard: rango de bytes (inicio, fin) de un csv a leer (ver csv_shards).
+    :return: Un generador de DataFrames.
+    """
+    fmt = file_format(filename)
+    if fmt != CSV:
+        _require_pyarrow(fmt)
+        if shard:
+            raise ValueError('Solo los archivos csv se pueden dividir en rangos')
+        yield from _arrow_batches(filename, fmt, chunk_size, skip, columns)
+        return
+    with (io.BufferedReader(CsvShard(filename, *shard)) if shard else contextlib.nullcontext(filename)) as handle, \
+            pd.read_csv(
+                handle, keep_default_na=False, chunksize=chunk_size, iterator=True,
+                skiprows=(lambda i: 0 < i <= skip) if skip else None
+            ) as reader:
+        yield from reader
+
+
+# Escritura
+
+class TableWriter(abc.ABC):
+    """ Escritor de tablas por partes. resumable indica si se puede retomar la escritura de un archivo anterior. """
+
+    resumable = False
+
+    @abc.abstractmethod
+    def write(self, df):
+        """
+            Agrega las filas de un DataFrame.
+        :return: El tamaño del archivo después de escribir, si se puede retomar, o None.
+        """
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CsvWriter(TableWriter):
+    """ Agrega tablas a un csv y las baja a disco. Se puede retomar desde un tamaño de archivo anterior. """
+
+    resumable = True
+
+    def __init__(self, filename, offset=0) -> None:
+        super().__init__()
+        self._file = open(filename, 'a' if offset else 'w', newline='')
+
+    def write(self, df):
+        df.to_csv(self._file, index=False, header=self._file.tell() == 0)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class ArrowWriter(TableWriter):
+    """
+        Escribe tablas en Parquet (un row group por tabla) o Arrow IPC con un esquema fijo. Opcionalmente agrega una
+    columna geometry con el punto (lon, lat) en WKB y los metadatos de GeoParquet. El archivo recién es válido al
+    cerrarse, por lo que no se puede retomar.
+    """
+
+    resumable = False
+
+    def __init__(self, filename, schema, fmt=PARQUET, geometry=None) -> None:
+        """
+        :param schema: un pyarrow.Schema con las columnas de las tablas (ver table_schema()).
+        :param fmt: 'parquet' o 'arrow'.
+        :param geometry: tupla opcional con los nombres de las columnas de longitud y latitud.
+        """
+        super().__init__()
+        _require_pyarrow(fmt)
+        self.schema = schema
+        self.geometry = geometry
+        if geometry:
+            import shapely
+            self._shapely = shapely
+            schema = schema.append(pa.field('geometry', pa.binary())).with_metadata({
+                b'geo': json.dumps({
+                    'version': '1.0.0',
+                    'primary_column': 'geometry',
+                    'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': ['Point']}},
+                }).encode()
+            })
+        if fmt == PARQUET:
+            self._writer = pq.ParquetWriter(filename, schema)
+        else:
+            self._writer = ipc.new_file(filename, schema)
+        self._schema = schema
+
+    def _geometry(self, df):
+        lon, lat = (df[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in self.geometry)
+        valid = ~(np.isnan(lon) | np.isnan(lat))
+        wkb = np.full(len(df), None, dtype=object)
+        wkb[valid] = self._shapely.to_wkb(self._shapely.points(lon[valid], lat[valid]))
+        return pa.array(wkb, pa.binary())
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        if self.geometry:
+            table = table.append_column('geometry', self._geometry(df))
+        self._writer.write_table(table.replace_schema_metadata(self._schema.metadata))
+
+    def close(self):
+        self._writer.close()
+
+
+def table_schema(columns, kinds):
+    """
+        Arma el esquema de pyarrow de una tabla.
+    :param columns: nombres de las columnas.
+    :param kinds: tipo de Python de cada columna (int, float o str; cualquier otro se escribe como texto).
+    """
+    _require_pyarrow(PARQUET)
+    types = {int: pa.int64(), float: pa.float64()}
+    return pa.schema([pa.field(column, types.get(kind, pa.string())) for column, kind in zip(columns, kinds)])
+
+
+def open_writer(filename, fmt, offset=0, schema=None, geometry=None):
+    """
+        Abre un escritor del formato indicado.
+    :param offset: tamaño del csv desde el que se retoma la escritura.
+    :param schema: esquema de las tablas, para Parquet y Arrow.
+    :param geometry: columnas de longitud y latitud para la geometría de GeoParquet.
+    """
+    if fmt == CSV:
+        if geometry:
+            raise ValueError('La columna geometry solo se puede escribir en Parquet')
+        return CsvWriter(filename, offset)
+    if offset:
+        raise ValueError(f'No se puede retomar la escritura de un archivo {fmt}')
+    if geometry and fmt != PARQUET:
+        raise ValueError('La columna geometry solo se puede escribir en Parquet')
+    return ArrowWriter(filename, schema, fmt, geometry)
+
+
+def merge_parts(filename, parts, fmt):
+    """ Une en orden archivos parciales del mismo formato y esquema en filename. """
+    if fmt == CSV:
+        with open(filename, 'wb') as f:
+            for index, part in enumerate(parts):
+                with open(part, 'rb') as pf:
+                    if index:
+                        pf.readline()
+                    shutil.copyfileobj(pf, f)
+        return
+    _require_pyarrow(fmt)
+    writer = None
+    try:
+        for part in parts:
+            if fmt == PARQUET:
+                parquet = pq.ParquetFile(part)
+                tables = (parquet.read_row_group(i) for i in range(parquet.num_row_groups))
+                part_schema = parquet.schema_arrow
+            else:
+                reader = ipc.open_file(pa.memory_map(part))
+                tables = (pa.table(reader.get_batch(i)) for i in range(reader.num_record_batches))
+                part_schema = reader.schema
+            if writer is None:
+                writer = pq.ParquetWriter(filename, part_schema) if fmt == PARQUET else \
+                    ipc.new_file(filename, part_schema)
+            for table in tables:
+                writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
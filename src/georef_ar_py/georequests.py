@@ -1,12 +1,937 @@
+import asyncio
+import codecs
+import email.utils
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import aiohttp
 import requests as requests
+from requests.adapters import HTTPAdapter
+
+from georef_ar_py import codec
+from georef_ar_py.cache import ResponseCache
+from georef_ar_py.metrics import Metrics
+
+log = logging.getLogger(__name__)
 
 API_BASE_URL = "https://apis.datos.gob.ar/georef/api/"
 TOKEN = None
+CACHE = None
+METRICS = Metrics()
+
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# Comprime con gzip los cuerpos de las peticiones POST que superen COMPRESSION_MIN_SIZE bytes. Requiere que el
+# servidor acepte 'Content-Encoding: gzip', por lo que está desactivado por defecto.
+COMPRESS_REQUESTS = False
+COMPRESSION_MIN_SIZE = 1024
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+RETRYABLE_EXCEPTIONS = (
+    aiohttp.ClientConnectionError, asyncio.TimeoutError, requests.ConnectionError, requests.Timeout
+)
+
+
+class ConnectionPool:
+    """
+        Mantiene abiertas las conexiones HTTP, sincrónicas (requests) y asincrónicas (aiohttp), para reutilizarlas
+    entre peticiones y evitar un nuevo handshake TCP+TLS en cada consulta.
+
+    Una sesión de aiohttp queda ligada al event loop en el que se crea, por lo que la sesión asincrónica se recrea
+    si cambia el loop en ejecución. Antes de que finalice el loop se debe llamar a close_async(), como hace
+    run_async(); quien ejecute las corrutinas en su propio loop debe esperar georequests.close_async(). Un proceso hijo
+    (por ejemplo, de un ProcessPoolExecutor con fork) no usa las sesiones heredadas, cuyos sockets comparte con el
+    padre, sino que crea las suyas.
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, keepalive_timeout=30, ttl_dns_cache=300) -> None:
+        """
+        :param limit: cantidad máxima de conexiones simultáneas.
+        :param limit_per_host: cantidad máxima de conexiones simultáneas contra un mismo host.
+        :param keepalive_timeout: segundos que se mantiene abierta una conexión ociosa.
+        :param ttl_dns_cache: segundos que se guardan en caché las resoluciones DNS.
+        """
+        super().__init__()
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self._session = None
+        self._async_session = None
+        self._async_loop = None
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # Se descartan sin cerrarlas: los sockets heredados siguen en uso por el proceso padre.
+        if self._pid != os.getpid():
+            self._session = None
+            self._async_session = None
+            self._async_loop = None
+            self._pid = os.getpid()
+
+    def configure(self, **kwargs):
+        """
+            Actualiza la configuración del pool. Las sesiones abiertas se descartan para que las siguientes
+        peticiones usen los nuevos valores.
+        """
+        for key, value in kwargs.items():
+            if not hasattr(self, key) or key.startswith('_'):
+                raise AttributeError(f"Parámetro de configuración desconocido: {key}")
+            setattr(self, key, value)
+        self.close()
+        self._discard_async_session()
+
+    @property
+    def session(self):
+        """ Sesión de requests compartida por las consultas sincrónicas. """
+        self._check_pid()
+        if self._session is None:
+            adapter = HTTPAdapter(pool_connections=self.limit_per_host, pool_maxsize=self.limit_per_host)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def async_session(self):
+        """
+            Sesión de aiohttp compartida por las consultas asincrónicas del event loop en ejecución.
+        """
+        self._check_pid()
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_session.closed or self._async_loop is not loop:
+            self._discard_async_session()
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host, keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True, ttl_dns_cache=self.ttl_dns_cache
+            )
+            self._async_session = aiohttp.ClientSession(connector=connector)
+            self._async_loop = loop
+        return self._async_session
+
+    def _discard_async_session(self):
+        if self._async_session is not None and not self._async_session.closed:
+            try:
+                # Cierre sincrónico: la sesión pertenece a otro loop, que puede estar cerrado.
+                self._async_session.connector._close()
+            except RuntimeError:
+                pass
+        self._async_session = None
+        self._async_loop = None
+
+    def close(self):
+        """ Cierra la sesión sincrónica. """
+        self._check_pid()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def close_async(self):
+        """ Cierra la sesión asincrónica. Debe ejecutarse en el mismo loop en el que se usó la sesión. """
+        self._check_pid()
+        if self._async_session is not None:
+            await self._async_session.close()
+        self._async_session = None
+        self._async_loop = None
+
+
+POOL = ConnectionPool()
+
+
+class TokenBucket:
+    """
+        Balde de fichas: admite hasta capacity peticiones por período y se rellena de forma continua.
+    """
+
+    def __init__(self, capacity, period) -> None:
+        """
+        :param capacity: cantidad de peticiones admitidas por período.
+        :param period: duración del período en segundos.
+        """
+        super().__init__()
+        self.capacity = capacity
+        self.period = period
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.capacity / self.period
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, now):
+        """ Segundos a esperar hasta disponer de una ficha. """
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def recalibrate(self, limit=None, remaining=None):
+        """
+            Ajusta el balde a los valores informados por el servidor. Las fichas solo se reducen: el servidor
+        conoce el consumo real (incluido el de otros clientes con el mismo token).
+        """
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+
+
+class RateLimiter:
+    """
+        Limitador asincrónico de peticiones. Controla los presupuestos por segundo, minuto, hora y día con baldes de
+    fichas, se recalibra con los encabezados x-ratelimit-* de cada respuesta y limita la cantidad de peticiones
+    simultáneas.
+
+    Uso:
+        async with rate_limiter:
+            ...
+    """
+
+    PERIODS = {'second': 1, 'minute': 60, 'hour': 60 * 60, 'day': 60 * 60 * 24}
+
+    def __init__(self, limits=None, concurrency=10, share=1.0) -> None:
+        """
+        :param limits: diccionario con la cantidad de peticiones admitidas por período ('second', 'minute',
+            'hour', 'day'). Los períodos sin límite se ignoran.
+        :param concurrency: cantidad máxima de peticiones simultáneas.
+        :param share: fracción de los límites (y de los informados por el servidor) que usa este limitador, cuando
+            varios procesos se reparten el mismo presupuesto.
+        """
+        super().__init__()
+        self.concurrency = concurrency
+        self.share = share
+        self.buckets = {
+            period: TokenBucket(self._scale(limit), self.PERIODS[period])
+            for period, limit in (limits or {}).items() if limit
+        }
+        self.waited = 0.0
+        self._semaphore = None
+        self._lock = None
+        self._loop = None
+
+    @classmethod
+    def from_limits(cls, limits, rps=None, concurrency=10, share=1.0):
+        """
+            Crea un limitador a partir de los límites obtenidos con get_limits().
+        :param limits: diccionario con claves 'limit-<período>' y 'remaining-<período>'.
+        :param rps: tope opcional de peticiones por segundo.
+        :param concurrency: cantidad máxima de peticiones simultáneas.
+        :param share: fracción de los límites y de rps que usa este limitador (ver __init__).
+        """
+        def to_int(value):
+            return int(value) if value else None
+
+        rate_limiter = cls({
+            period: to_int(limits.get(f'limit-{period}')) or to_int(limits.get(f'remaining-{period}'))
+            for period in cls.PERIODS
+        }, concurrency=concurrency, share=share)
+        if rps:
+            rps = rate_limiter._scale(rps)
+            bucket = rate_limiter.buckets.get('second')
+            if bucket is None or bucket.capacity > rps:
+                rate_limiter.buckets['second'] = TokenBucket(rps, 1)
+        for period, bucket in rate_limiter.buckets.items():
+            remaining = to_int(limits.get(f'remaining-{period}'))
+            bucket.recalibrate(remaining=rate_limiter._scale(remaining, 0) if remaining is not None else None)
+        return rate_limiter
+
+    def _scale(self, value, minimum=1):
+        # Cada balde admite al menos una ficha: con menos no se podría enviar ninguna petición.
+        return value if self.share == 1 else max(value * self.share, minimum)
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._lock = asyncio.Lock()
+            self._loop = loop
+
+    async def acquire(self):
+        """ Espera un lugar entre las peticiones simultáneas y una ficha de cada balde. """
+        self._bind_loop()
+        start = time.monotonic()
+        await self._semaphore.acquire()
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    wait = max([bucket.wait_time(now) for bucket in self.buckets.values()], default=0)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                for bucket in self.buckets.values():
+                    bucket.consume()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.waited += time.monotonic() - start
+
+    def release(self):
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def update(self, headers):
+        """
+            Recalibra los baldes con los encabezados x-ratelimit-limit-* y x-ratelimit-remaining-* de una respuesta.
+        """
+        for period in self.PERIODS:
+            limit = headers.get(f'x-ratelimit-limit-{period}')
+            remaining = headers.get(f'x-ratelimit-remaining-{period}')
+            if limit is None and remaining is None:
+                continue
+            bucket = self.buckets.get(period)
+            if bucket is None:
+                if not limit:
+                    continue
+                bucket = self.buckets[period] = TokenBucket(self._scale(int(limit)), self.PERIODS[period])
+            bucket.recalibrate(
+                self._scale(int(limit)) if limit else None,
+                self._scale(int(remaining), 0) if remaining is not None else None
+            )
+
+
+class RetryPolicy:
+    """
+        Política de reintentos ante errores transitorios: respuestas con estado reintentable (429, 5xx) y errores
+    de conexión. Espera con retroceso exponencial y jitter, respeta el encabezado Retry-After y limita la cantidad
+    total de reintentos de una ejecución.
+    """
+
+    def __init__(
+            self, max_retries=3, backoff=0.1, max_backoff=10, max_retry_after=60, max_total_retries=1000,
+            statuses=RETRYABLE_STATUS
+    ) -> None:
+        """
+        :param max_retries: cantidad máxima de reintentos de una petición.
+        :param backoff: espera base en segundos; se duplica en cada reintento.
+        :param max_backoff: espera máxima en segundos entre reintentos.
+        :param max_retry_after: espera máxima aceptada desde Retry-After; si el servidor pide más, no se reintenta.
+        :param max_total_retries: cantidad máxima de reintentos en toda la ejecución.
+        :param statuses: estados HTTP reintentables.
+        """
+        super().__init__()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.max_total_retries = max_total_retries
+        self.statuses = statuses
+        self.retries = 0
+
+    def reset(self):
+        """ Reinicia el contador de reintentos de la ejecución. """
+        self.retries = 0
+
+    @staticmethod
+    def _retry_after(headers):
+        value = headers.get('Retry-After') if headers is not None else None
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    def get_delay(self, attempt, status=None, headers=None, exception=None):
+        """
+            Determina si se debe reintentar una petición.
+        :param attempt: cantidad de reintentos ya realizados para la petición.
+        :param status: estado HTTP de la respuesta.
+        :param headers: encabezados de la respuesta.
+        :param exception: excepción obtenida al enviar la petición.
+        :return: Los segundos a esperar antes de reintentar o None si no se debe reintentar.
+        """
+        if exception is None and status not in self.statuses:
+            return None
+        if exception is not None and not isinstance(exception, RETRYABLE_EXCEPTIONS):
+            return None
+        if attempt >= self.max_retries or self.retries >= self.max_total_retries:
+            return None
+
+        delay = self._retry_after(headers)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        elif delay > self.max_retry_after:
+            return None
+
+        self.retries += 1
+        return delay
+
+
+RETRY_POLICY = RetryPolicy()
+
+
+class CircuitBreaker:
+    """
+        Pausa las peticiones a una API degradada. Mientras está cerrado, registra el resultado de los últimos window
+    intentos; si al menos min_requests de ellos tienen una proporción de fallas (errores de conexión, timeouts y
+    respuestas 5xx) de error_rate o más, se abre y las peticiones esperan, sin enviarse, durante open_time segundos.
+    Después pasa a semiabierto: se envía una sola petición de prueba y el resto sigue esperando. Si la prueba
+    obtiene respuesta, el circuito se cierra y las peticiones se reanudan; si falla, se vuelve a abrir por el doble de
+    tiempo, hasta max_open_time.
+
+    Uso:
+        probe = await circuit_breaker.acquire()
+        ...
+        circuit_breaker.record(success, probe)
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+            self, error_rate=0.5, window=50, min_requests=20, open_time=1.0, max_open_time=30.0, poll_interval=0.05
+    ) -> None:
+        """
+        :param error_rate: proporción de fallas entre los últimos intentos a partir de la cual se abre el circuito.
+        :param window: cantidad de intentos recientes considerados.
+        :param min_requests: cantidad mínima de intentos registrados para abrir el circuito.
+        :param open_time: segundos que el circuito permanece abierto antes de la primera prueba.
+        :param max_open_time: segundos máximos que permanece abierto tras pruebas fallidas consecutivas.
+        :param poll_interval: segundos entre consultas del estado de las peticiones que esperan una prueba en curso.
+        """
+        super().__init__()
+        self.error_rate = error_rate
+        self.window = window
+        self.min_requests = min_requests
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Cierra el circuito y reinicia los registros y los tiempos de cada estado. """
+        with self._lock:
+            self.state = self.CLOSED
+            self.opened = 0
+            self.durations = {self.CLOSED: 0.0, self.OPEN: 0.0, self.HALF_OPEN: 0.0}
+            self._outcomes = deque(maxlen=self.window)
+            self._failures = 0
+            self._open_time = self.open_time
+            self._until = 0.0
+            self._probing = False
+            self._changed = time.monotonic()
+
+    def _set_state(self, state, now):
+        self.durations[self.state] += now - self._changed
+        self.state = state
+        self._changed = now
+
+    def _open(self, now):
+        self._set_state(self.OPEN, now)
+        self._until = now + self._open_time
+        self.opened += 1
+        log.warning(f"La API falla: se pausan las peticiones por {self._open_time:.2f}s")
+
+    def _admit(self):
+        """
+            Decide si se puede enviar una petición.
+        :return: Los segundos a esperar antes de volver a consultar (0 si se admite) y si la petición admitida es
+        la prueba del estado semiabierto.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0, False
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now < self._until:
+                    return self._until - now, False
+                self._set_state(self.HALF_OPEN, now)
+            if self._probing:
+                return self.poll_interval, False
+            self._probing = True
+            return 0, True
+
+    async def acquire(self):
+        """
+            Espera a que el circuito admita una petición.
+        :return: True si la petición es la prueba del estado semiabierto.
+        """
+        while True:
+            wait, probe = self._admit()
+            if wait <= 0:
+                return probe
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        """ Versión sincrónica de acquire(). """
+        while True:
+            wait, probe = self._admit()
+            if wait <= 0:
+                return probe
+            time.sleep(wait)
+
+    def record(self, success, probe=False):
+        """
+            Registra el resultado de una petición admitida.
+        :param success: si se obtuvo una respuesta que no es un error del servidor, o None si la petición no llegó
+        a completarse (por ejemplo, porque se canceló).
+        :param probe: si la petición fue la prueba del estado semiabierto (ver acquire()).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probing = False
+                if success is None:
+                    return
+                if success:
+                    self._set_state(self.CLOSED, now)
+                    self._outcomes.clear()
+                    self._failures = 0
+                    self._open_time = self.open_time
+                    log.info("La API respondió: se reanudan las peticiones")
+                else:
+                    self._open_time = min(self._open_time * 2, self.max_open_time)
+                    self._open(now)
+                return
+            # Los resultados de peticiones enviadas antes de abrir el circuito no cambian su estado.
+            if success is None or self.state != self.CLOSED:
+                return
+            if len(self._outcomes) == self._outcomes.maxlen:
+                self._failures -= not self._outcomes[0]
+            self._outcomes.append(success)
+            self._failures += not success
+            if len(self._outcomes) >= self.min_requests and self._failures >= self.error_rate * len(self._outcomes):
+                self._open(now)
+
+    def merge(self, snapshot):
+        """ Suma los tiempos y las aperturas de otro circuito (por ejemplo, de un proceso hijo). """
+        with self._lock:
+            self.opened += snapshot['opened']
+            for state, seconds in snapshot['durations'].items():
+                self.durations[state] += seconds
+
+    def snapshot(self):
+        """ El estado actual, la cantidad de aperturas y los segundos transcurridos en cada estado. """
+        with self._lock:
+            durations = dict(self.durations)
+            durations[self.state] += time.monotonic() - self._changed
+            return {'state': self.state, 'opened': self.opened, 'durations': durations}
+
+
+CIRCUIT_BREAKER = CircuitBreaker()
+
+
+class SingleFlight:
+    """
+        Agrupa peticiones idénticas en curso: mientras una petición está pendiente, las siguientes con la misma
+    clave esperan su resultado en lugar de enviar otra petición. Todas reciben el mismo objeto de respuesta.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._futures = {}
+        self._events = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hits = 0
+
+    @property
+    def stats(self):
+        return {'calls': self.calls, 'hits': self.hits}
+
+    def reset(self):
+        self.calls = 0
+        self.hits = 0
+
+    async def do_async(self, key, func):
+        """
+            Ejecuta func() (una corrutina) o espera el resultado de la ejecución en curso con la misma clave.
+        """
+        loop = asyncio.get_running_loop()
+        future = self._futures.get((loop, key))
+        if future is not None:
+            self.hits += 1
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        self._futures[(loop, key)] = future
+        self.calls += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita el aviso de excepción no recuperada si no hay otras peticiones esperando.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[(loop, key)]
+
+    def do(self, key, func):
+        """
+            Ejecuta func() o espera el resultado de la ejecución en curso, en otro hilo, con la misma clave.
+        """
+        with self._lock:
+            call = self._events.get(key)
+            if call is None:
+                call = self._events[key] = {'event': threading.Event()}
+                self.calls += 1
+                leader = True
+            else:
+                self.hits += 1
+                leader = False
+
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = func()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._events[key]
+            call['event'].set()
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+
+class JsonArrayParser:
+    """
+        Analizador incremental de una respuesta JSON: extrae, a medida que llegan los bytes, los objetos del arreglo
+    bajo la clave indicada del objeto raíz (por ejemplo, "calles" en {"cantidad": 10, "calles": [{...}, ...]}).
+    Solo mantiene en memoria el registro en curso.
+    """
+
+    _TOKENS = re.compile(r'[{}\[\]"]')
+    _ARRAY_START = re.compile(r'\s*(?::\s*(\[)?)?')
+    _SEPARATOR = re.compile(r'[\s,]*')
+
+    def __init__(self, key) -> None:
+        super().__init__()
+        self.key = key
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_array = False
+        self.done = False
+
+    @staticmethod
+    def _string_end(buffer, pos):
+        while True:
+            end = buffer.find('"', pos)
+            if end < 0:
+                return None
+            backslashes = 0
+            while buffer[end - 1 - backslashes] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                return end + 1
+            pos = end + 1
+
+    def _seek(self):
+        # Recorre el objeto raíz hasta encontrar la clave del arreglo en el primer nivel.
+        buffer = self._buffer
+        pos = self._pos
+        while True:
+            match = self._TOKENS.search(buffer, pos)
+            if match is None:
+                self._pos = len(buffer)
+                return False
+            if match.group() in '{[':
+                self._depth += 1
+                pos = match.end()
+            elif match.group() in '}]':
+                self._depth -= 1
+                pos = match.end()
+            else:
+                end = self._string_end(buffer, match.end())
+                if end is None:
+                    self._pos = match.start()
+                    return False
+                if self._depth == 1 and buffer[match.start() + 1:end - 1] == self.key:
+                    array = self._ARRAY_START.match(buffer, end)
+                    if array.end() == len(buffer):
+                        self._pos = match.start()
+                        return False
+                    if array.group(1):
+                        self._in_array = True
+                        self._buffer = buffer[array.end():]
+                        self._pos = 0
+                        return True
+                pos = end
+
+    def feed(self, chunk):
+        """
+            Procesa un fragmento de la respuesta.
+        :param chunk: bytes recibidos.
+        :return: Una lista con los registros completados en el fragmento.
+        """
+        self._buffer += self._decoder.decode(chunk)
+        records = []
+        if self.done or not (self._in_array or self._seek()):
+            return records
+
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = self._SEPARATOR.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == ']':
+                self.done = True
+                break
+            try:
+                record, pos_end = self._json.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Registro incompleto: se completa con los próximos fragmentos.
+                break
+            records.append(record)
+            pos = pos_end
+        self._buffer = '' if self.done else buffer[pos:]
+        return records
+
+    def close(self):
+        """ Verifica que se haya recibido el arreglo completo. """
+        if not self.done:
+            raise ValueError(f"La respuesta no contiene el arreglo completo \"{self.key}\"")
+
+
+def _endpoint(url):
+    return urllib.parse.urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _rate_limits(headers):
+    """ Los pares (límite, restantes) de los encabezados x-ratelimit-* de una respuesta, por período. """
+    rate_limits = {}
+    for period in RateLimiter.PERIODS:
+        limit = headers.get(f'x-ratelimit-limit-{period}')
+        remaining = headers.get(f'x-ratelimit-remaining-{period}')
+        if limit and remaining is not None:
+            rate_limits[period] = (int(limit), int(remaining))
+    return rate_limits
+
+
+def _body_size(kwargs):
+    data = kwargs.get('data')
+    return len(data) if isinstance(data, (bytes, str)) else 0
+
+
+def _record_outcome(circuit_breaker, success, probe):
+    if circuit_breaker is not None:
+        circuit_breaker.record(success, probe)
+    return True
+
+
+@contextmanager
+def _request(method, url, **kwargs):
+    endpoint = _endpoint(url)
+    bytes_out = _body_size(kwargs)
+    attempt = 0
+    while True:
+        probe = CIRCUIT_BREAKER.acquire_sync() if CIRCUIT_BREAKER is not None else False
+        recorded = False
+        start = time.monotonic()
+        try:
+            try:
+                req = POOL.session.request(method, url, **kwargs)
+            except RETRYABLE_EXCEPTIONS as e:
+                recorded = _record_outcome(CIRCUIT_BREAKER, False, probe)
+                METRICS.record(
+                    endpoint, method, latency=time.monotonic() - start, bytes_out=bytes_out, attempt=attempt, error=e
+                )
+                delay = RETRY_POLICY.get_delay(attempt, exception=e)
+                if delay is None:
+                    raise
+            else:
+                recorded = _record_outcome(CIRCUIT_BREAKER, req.status_code < 500, probe)
+                METRICS.record(
+                    endpoint, method, req.status_code, time.monotonic() - start,
+                    int(req.headers.get('Content-Length', len(req.content))), bytes_out, attempt=attempt,
+                    rate_limits=_rate_limits(req.headers)
+                )
+                delay = RETRY_POLICY.get_delay(attempt, status=req.status_code, headers=req.headers)
+                if delay is None:
+                    with req:
+                        yield req
+                    return
+                req.close()
+        finally:
+            if not recorded:
+                _record_outcome(CIRCUIT_BREAKER, None, probe)
+        log.debug(f"Reintentando {method} {url} en {delay:.2f}s")
+        time.sleep(delay)
+        attempt += 1
+
+
+def _response_size(req):
+    if 'Content-Length' in req.headers:
+        return int(req.headers['Content-Length'])
+    return req.content.total_bytes
+
+
+@asynccontextmanager
+async def _request_async(session, method, url, rate_limiter=None, client=None, **kwargs):
+    retry_policy = RETRY_POLICY if client is None else client.retry_policy
+    metrics = METRICS if client is None else client.metrics
+    circuit_breaker = CIRCUIT_BREAKER if client is None else client.circuit_breaker
+    endpoint = _endpoint(url)
+    bytes_out = _body_size(kwargs)
+    attempt = 0
+    while True:
+        probe = await circuit_breaker.acquire() if circuit_breaker is not None else False
+        recorded = False
+        start = time.monotonic()
+        try:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            sent = time.monotonic()
+            try:
+                try:
+                    req = await session.request(method, url, **kwargs)
+                except RETRYABLE_EXCEPTIONS as e:
+                    recorded = _record_outcome(circuit_breaker, False, probe)
+                    metrics.record(
+                        endpoint, method, latency=time.monotonic() - sent, bytes_out=bytes_out,
+                        limiter_wait=sent - start, attempt=attempt, error=e
+                    )
+                    delay = retry_policy.get_delay(attempt, exception=e)
+                    if delay is None:
+                        raise
+                else:
+                    recorded = _record_outcome(circuit_breaker, req.status < 500, probe)
+                    if rate_limiter is not None:
+                        rate_limiter.update(req.headers)
+                    delay = retry_policy.get_delay(attempt, status=req.status, headers=req.headers)
+                    if delay is None:
+                        try:
+                            yield req
+                        finally:
+                            req.release()
+                            metrics.record(
+                                endpoint, method, req.status, time.monotonic() - sent, _response_size(req), bytes_out,
+                                limiter_wait=sent - start, attempt=attempt, rate_limits=_rate_limits(req.headers)
+                            )
+                        return
+                    req.release()
+                    metrics.record(
+                        endpoint, method, req.status, time.monotonic() - sent, _response_size(req), bytes_out,
+                        limiter_wait=sent - start, attempt=attempt, rate_limits=_rate_limits(req.headers)
+                    )
+            finally:
+                if rate_limiter is not None:
+                    rate_limiter.release()
+        finally:
+            if not recorded:
+                _record_outcome(circuit_breaker, None, probe)
+        log.debug(f"Reintentando {method} {url} en {delay:.2f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def close():
+    """ Cierra las conexiones sincrónicas del pool compartido y la caché. """
+    POOL.close()
+    if CACHE is not None:
+        CACHE.close()
+
+
+async def close_async():
+    """ Cierra las conexiones asincrónicas del pool compartido. """
+    await POOL.close_async()
+
+
+def configure_cache(path=None, **kwargs):
+    """
+        Activa la caché persistente de respuestas para get_json, get_json_async, get_json_post y
+    get_json_post_async. Sin path, desactiva la caché.
+    :param path: ruta al archivo de la caché.
+    :param kwargs: parámetros de ResponseCache (ttl, max_size, split_bulk).
+    :return: El objeto ResponseCache configurado o None.
+    """
+    global CACHE
+    if CACHE is not None:
+        CACHE.close()
+    CACHE = ResponseCache(path, **kwargs) if path else None
+    return CACHE
+
+
+def configure_circuit_breaker(error_rate=0.5, **kwargs):
+    """
+        Configura el circuito que pausa las peticiones sincrónicas y asincrónicas cuando la API falla (ver
+    CircuitBreaker). Con error_rate 0 o None, lo desactiva.
+    :param error_rate: proporción de fallas a partir de la cual se abre el circuito.
+    :param kwargs: otros parámetros de CircuitBreaker (window, min_requests, open_time, max_open_time).
+    :return: El objeto CircuitBreaker configurado o None.
+    """
+    global CIRCUIT_BREAKER
+    CIRCUIT_BREAKER = CircuitBreaker(error_rate, **kwargs) if error_rate else None
+    return CIRCUIT_BREAKER
+
+
+def run_async(coro):
+    """
+        Ejecuta una corrutina en un nuevo event loop y cierra las conexiones asincrónicas del pool compartido
+    antes de que el loop finalice.
+    :param coro: corrutina a ejecutar.
+    :return: El resultado de la corrutina.
+    """
+    async def func():
+        try:
+            return await coro
+        finally:
+            await close_async()
+
+    return asyncio.run(func())
+
+
+def _headers(url, client=None):
+    headers = {'Accept-Encoding': ACCEPT_ENCODING}
+    if client is not None:
+        if client.token:
+            headers['Authorization'] = 'Bearer {}'.format(client.token)
+    elif TOKEN and url == API_BASE_URL:
+        headers['Authorization'] = 'Bearer {}'.format(TOKEN)
+    return headers
 
 
 def get_limits(url, endpoint, **kwargs):
-    headers = {'Authorization': 'Bearer {}'.format(TOKEN)} if TOKEN and url == API_BASE_URL else None
-    with requests.get("{}{}".format(url, endpoint), params=kwargs, headers=headers) as req:
+    headers = _headers(url)
+    with _request('GET', "{}{}".format(url, endpoint), params=kwargs, headers=headers) as req:
         store = req.headers._store
         empty = (None, None)
         return {
@@ -21,58 +946,164 @@ def get_limits(url, endpoint, **kwargs):
         }
 
 
+def _get(url, endpoint, cache_key, **kwargs):
+    headers = _headers(url)
+    with _request('GET', "{}{}".format(url, endpoint), params=kwargs, headers=headers) as req:
+        if req.status_code == 200:
+            response = codec.loads(req.content)
+            if CACHE is not None:
+                CACHE.set(cache_key, response)
+            return response
+        raise requests.RequestException(req)
+
+
+async def _get_async(session, url, endpoint, cache_key, rate_limiter=None, client=None, **kwargs):
+    cache = CACHE if client is None else client.cache
+    headers = _headers(url, client)
+    async with _request_async(
+            session, 'GET', "{}{}".format(url, endpoint), rate_limiter, client, params=kwargs, headers=headers
+    ) as req:
+        if req.status == 200:
+            response = codec.loads(await req.read())
+            if cache is not None:
+                cache.set(cache_key, response)
+            return response
+        raise req.raise_for_status()
+
+
 def get_json(url, endpoint, **kwargs):
     """
-        Obtiene una respuesta como json para la entidad consultada.
+        Obtiene una respuesta como json para la entidad consultada. Las peticiones idénticas en curso se agrupan
+    en una sola (ver SingleFlight).
     :param url: URL de la API a consultar.
     :param endpoint: nombre de una de las capas.
     :param kwargs: parámetros de consulta.
     :return: Un diccionario con la respuesta obtenida
     """
-    headers = {'Authorization': 'Bearer {}'.format(TOKEN)} if TOKEN and url == API_BASE_URL else None
-    with requests.get("{}{}".format(url, endpoint), params=kwargs, headers=headers) as req:
-        if req.status_code == 200:
-            return req.json()
-        raise requests.RequestException(req)
+    key = ResponseCache.make_key('GET', url, endpoint, kwargs)
+    if CACHE is not None:
+        response = CACHE.get(key)
+        if response is not None:
+            METRICS.record_cached(endpoint)
+            return response
+
+    return SINGLE_FLIGHT.do(key, lambda: _get(url, endpoint, key, **kwargs))
 
 
-async def get_json_async(session, url, endpoint, **kwargs):
+async def get_json_async(session, url, endpoint, *, rate_limiter=None, client=None, **kwargs):
     """
-        Obtiene una respuesta como json para la entidad consultada.
+        Obtiene una respuesta como json para la entidad consultada. Las peticiones idénticas en curso se agrupan
+    en una sola (ver SingleFlight).
     :param session: un objeto aiohtpp.ClientSession.
     :param url: URL de la API a consultar.
     :param endpoint: nombre de una de las capas.
+    :param rate_limiter: un objeto RateLimiter opcional que regula la petición.
+    :param client: un objeto GeorefClient opcional cuyo token, caché, política de reintentos y métricas reemplazan
+    a los globales del módulo.
     :param kwargs: parámetros de consulta.
     :return: Un diccionario con la respuesta obtenida
     """
-    headers = {'Authorization': 'Bearer {}'.format(TOKEN)} if TOKEN and url == API_BASE_URL else None
-    async with session.get("{}{}".format(url, endpoint), params=kwargs, headers=headers) as req:
-        if req.status == 200:
-            return await req.json()
-        raise req.raise_for_status()
+    cache = CACHE if client is None else client.cache
+    single_flight = SINGLE_FLIGHT if client is None else client.single_flight
+    key = ResponseCache.make_key('GET', url, endpoint, kwargs)
+    if cache is not None:
+        response = cache.get(key)
+        if response is not None:
+            (METRICS if client is None else client.metrics).record_cached(endpoint)
+            return response
 
+    return await single_flight.do_async(
+        key, lambda: _get_async(session, url, endpoint, key, rate_limiter, client, **kwargs)
+    )
 
-def get_json_post(url, endpoint, data, **kwargs):
-    headers = kwargs.pop('headers', {})
+
+async def get_json_stream_async(session, url, endpoint, entity_key, *, rate_limiter=None, chunk_size=64 * 1024,
+                                client=None, **kwargs):
+    """
+        Obtiene los registros de la entidad consultada uno a uno, a medida que se recibe la respuesta, sin cargarla
+    completa en memoria. Estas consultas no pasan por la caché ni se agrupan con otras en curso.
+    :param session: un objeto aiohtpp.ClientSession.
+    :param url: URL de la API a consultar.
+    :param endpoint: nombre de una de las capas.
+    :param entity_key: clave del arreglo de registros en la respuesta.
+    :param rate_limiter: un objeto RateLimiter opcional que regula la petición.
+    :param chunk_size: tamaño en bytes de cada lectura.
+    :param client: un objeto GeorefClient opcional (ver get_json_async).
+    :param kwargs: parámetros de consulta.
+    :return: Un generador asincrónico de diccionarios con cada registro.
+    """
+    headers = _headers(url, client)
+    async with _request_async(
+            session, 'GET', "{}{}".format(url, endpoint), rate_limiter, client, params=kwargs, headers=headers
+    ) as req:
+        if req.status != 200:
+            raise req.raise_for_status()
+        parser = JsonArrayParser(entity_key)
+        async for chunk in req.content.iter_chunked(chunk_size):
+            for record in parser.feed(chunk):
+                yield record
+        parser.close()
+
+
+def _post_headers(url, kwargs, client=None):
+    headers = _headers(url, client)
+    headers.update(kwargs.pop('headers', {}))
     headers.update({"Content-Type": "application/json"})
-    if TOKEN and url == API_BASE_URL:
-        headers.update({'Authorization': 'Bearer {}'.format(TOKEN)})
+    return headers
 
-    with requests.post("{}{}".format(url, endpoint), json=data, headers=headers) as req:
+
+def _post_body(data, headers):
+    """
+        Codifica el cuerpo de una petición POST y, si COMPRESS_REQUESTS está activo y el cuerpo supera
+    COMPRESSION_MIN_SIZE, lo comprime con gzip.
+    """
+    body = codec.dumps(data)
+    if COMPRESS_REQUESTS and len(body) >= COMPRESSION_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return body
+
+
+def _post(url, endpoint, data, **kwargs):
+    headers = _post_headers(url, kwargs)
+    body = _post_body(data, headers)
+    with _request('POST', "{}{}".format(url, endpoint), data=body, headers=headers) as req:
         if req.status_code == 200:
-            return req.json()
+            return codec.loads(req.content)
         raise req.raise_for_status()
 
 
-async def get_json_post_async(session, url, endpoint, data, **kwargs):
-    headers = kwargs.pop('headers', {})
-    headers.update({"Content-Type": "application/json"})
-    if TOKEN and url == API_BASE_URL:
-        headers.update({'Authorization': 'Bearer {}'.format(TOKEN)})
-
-    async with session.post("{}{}".format(url, endpoint), json=data, headers=headers) as req:
+async def _post_async(session, url, endpoint, data, rate_limiter=None, client=None, **kwargs):
+    headers = _post_headers(url, kwargs, client)
+    body = _post_body(data, headers)
+    async with _request_async(
+            session, 'POST', "{}{}".format(url, endpoint), rate_limiter, client, data=body, headers=headers
+    ) as req:
         if req.status == 200:
-            return await req.json()
+            return codec.loads(await req.read())
         raise req.raise_for_status()
 
 
+def get_json_post(url, endpoint, data, **kwargs):
+    if CACHE is None:
+        return _post(url, endpoint, data, **kwargs)
+
+    cached = CACHE.plan_post(url, endpoint, data)
+    if cached.pending is not None:
+        cached.resolve(_post(url, endpoint, cached.pending, **kwargs))
+    else:
+        METRICS.record_cached(endpoint)
+    return cached.result
+
+
+async def get_json_post_async(session, url, endpoint, data, rate_limiter=None, client=None, **kwargs):
+    cache = CACHE if client is None else client.cache
+    if cache is None:
+        return await _post_async(session, url, endpoint, data, rate_limiter, client, **kwargs)
+
+    cached = cache.plan_post(url, endpoint, data)
+    if cached.pending is not None:
+        cached.resolve(await _post_async(session, url, endpoint, cached.pending, rate_limiter, client, **kwargs))
+    else:
+        (METRICS if client is None else client.metrics).record_cached(endpoint)
+    return cached.result
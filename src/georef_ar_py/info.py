@@ -1,24 +1,16 @@
 import asyncio
-import aiohttp
 import logging
 
-from georef_ar_py.georequests import get_json_async, get_json
+from georef_ar_py.georequests import POOL, get_json_async, get_json, get_json_stream_async
 from georef_ar_py.constants import ENTITIES, PROVINCES_DICT
 
 log = logging.getLogger(__name__)
 
 
-async def _get_response(session, url, entity, **kwargs):
-    try:
-        return await get_json_async(session, url, entity, **kwargs)
-    except asyncio.CancelledError:
-        log.error(f"Cancelando la descarga de {url}")
-
-
 def get_entity_number(url, entity, **kwargs):
     log.debug(f"Consultando cantidad de registros en {entity}")
     if entity not in ENTITIES:
-        raise NotImplemented(f"La entidad \"{entity}\" no se encuentra implementada.")
+        raise ValueError(f"La entidad \"{entity}\" no se encuentra implementada.")
     kwargs.update({'campos': 'basico', 'max': 1})
     response = get_json(url, entity, **kwargs)
     return response['total']
@@ -32,96 +24,128 @@ def get_departments_ids(url, state=None):
     return [department['id'] for department in response['departamentos']]
 
 
-async def _get_items(session, url, entity, **kwargs):
-    entity_key = 'localidades_censales' if entity == 'localidades-censales' else entity
-    params = {'campos': 'completo', 'orden': 'id', 'max': kwargs.get('max', 5000)}
-    response = await _get_response(session, url, entity, **params)
-    return response[entity_key]
-
+async def get_entity_number_async(session, url, entity, client=None, **kwargs):
+    log.debug(f"Consultando cantidad de registros en {entity}")
+    if entity not in ENTITIES:
+        raise ValueError(f"La entidad \"{entity}\" no se encuentra implementada.")
+    kwargs.update({'campos': 'basico', 'max': 1})
+    response = await get_json_async(session, url, entity, client=client, **kwargs)
+    return response['total']
 
-async def _get_items_by_region(session, url, entity, **kwargs):
 
-    limit = kwargs.get('max', 5000)
+async def get_departments_ids_async(session, url, state=None, client=None):
+    params = {'campos': 'basico', 'orden': 'id', 'max': 5000}
+    if state:
+        params.update({'provincia': state})
+    response = await get_json_async(session, url, 'departamentos', client=client, **params)
+    return [department['id'] for department in response['departamentos']]
 
-    params = {'campos': 'completo', 'orden': 'id', 'max': limit}
 
-    subtasks = []
-    for state_id in PROVINCES_DICT.keys():
-        max_items_province = get_entity_number(url, entity, provincia=state_id)
-        if max_items_province <= limit:
-            log.info(f"Consultando {entity}:provincia[{state_id}]")
-            params.pop('departamento', None)
-            params.update({'provincia': state_id})
-            subtasks.append(_get_response(session, url, entity, **params))
+async def get_regions(session, url, entity, limit=5000, client=None):
+    """
+        Divide la consulta de una entidad en regiones (provincias o, si superan el límite, departamentos) con a lo
+    sumo limit registros cada una. Las consultas de planificación se envían en simultáneo; las repetidas entre
+    entidades se agrupan en una sola petición (ver georequests.SingleFlight).
+    :return: Una lista de diccionarios con el parámetro de consulta de cada región.
+    """
+    states = list(PROVINCES_DICT.keys())
+    totals = await asyncio.gather(*[
+        get_entity_number_async(session, url, entity, client, provincia=state_id) for state_id in states
+    ])
+    large_states = [state_id for state_id, total in zip(states, totals) if total > limit]
+    departments = await asyncio.gather(*[
+        get_departments_ids_async(session, url, state_id, client) for state_id in large_states
+    ])
+    departments = dict(zip(large_states, departments))
+
+    regions = []
+    for state_id in states:
+        if state_id in departments:
+            regions.extend({'departamento': dep_id} for dep_id in departments[state_id])
         else:
-            department_ids = get_departments_ids(url, state_id)
-            for dep_id in department_ids:
-                log.info(f"Consultando {entity}:departamento[{dep_id}]")
-                params.pop('provincia', None)
-                params.update({'departamento': dep_id})
-                subtasks.append(_get_response(session, url, entity, **params))
+            regions.append({'provincia': state_id})
+    return regions
 
-    responses = await asyncio.gather(*subtasks)
 
-    return [row for response in responses for row in response[entity]]
+async def _stream_items(session, url, entity, consumer, client=None, **kwargs):
+    entity_key = 'localidades_censales' if entity == 'localidades-censales' else entity
+    try:
+        async for item in get_json_stream_async(session, url, entity, entity_key, client=client, **kwargs):
+            consumer(item)
+    except asyncio.CancelledError:
+        log.error(f"Cancelando la descarga de {url}")
+        raise
+
+
+async def consume_entity(session, url, entity, consumer, limit=5000, client=None):
+    """
+        Descarga los registros completos de una entidad y los entrega uno a uno, a medida que llegan, a consumer.
+    Las entidades más numerosas (asentamientos y calles) se consultan por región en simultáneo.
+    :param session: un objeto aiohtpp.ClientSession.
+    :param url: URL de la API a consultar.
+    :param entity: nombre de una de las capas.
+    :param consumer: función que recibe cada registro.
+    :param limit: cantidad máxima de registros por petición.
+    :param client: un objeto GeorefClient opcional (ver georequests.get_json_async).
+    """
+    params = {'campos': 'completo', 'orden': 'id', 'max': limit}
+    if entity in ['asentamientos', 'calles']:
+        subtasks = []
+        for region in await get_regions(session, url, entity, limit, client):
+            log.info(f"Consultando {entity}:{region}")
+            subtasks.append(_stream_items(session, url, entity, consumer, client, **params, **region))
+        await asyncio.gather(*subtasks)
+    else:
+        log.info(f"Consultando {entity}")
+        await _stream_items(session, url, entity, consumer, client, **params)
 
 
 async def fetch_entities(url):
-    entities = {}
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for entity in ENTITIES:
-            entities.setdefault(entity, {})
-            if entity in ['asentamientos', 'calles']:
-                tasks.append(asyncio.ensure_future(_get_items_by_region(session, url, entity)))
-            else:
-                log.info(f"Consultando {entity}")
-                tasks.append(asyncio.ensure_future(_get_items(session, url, entity)))
-        response = await asyncio.gather(*tasks)
-        return {key: value for key, value in zip(ENTITIES, response)}
+    """
+        Descarga los registros completos de todas las entidades. Usa la sesión asincrónica del pool compartido: si no
+    se ejecuta con georequests.run_async(), se debe llamar a georequests.close_async() antes de que finalice el loop.
+    :param url: URL de la API a consultar.
+    :return: Un diccionario con la lista de registros de cada entidad.
+    """
+    session = POOL.async_session()
+    entities = {entity: [] for entity in ENTITIES}
+    await asyncio.gather(*[
+        consume_entity(session, url, entity, entities[entity].append) for entity in ENTITIES
+    ])
+    return entities
 
 
 async def get_resume(url):
-
+    """
+        Cuenta los registros de cada entidad, en total y por provincia. Al igual que fetch_entities(), si no se ejecuta
+    con georequests.run_async(), se debe llamar a georequests.close_async() antes de que finalice el loop.
+    :param url: URL de la API a consultar.
+    :return: Un diccionario con los totales de cada entidad y, por provincia, los de las entidades que contiene.
+    """
     log.info("Consultando datos...")
 
-    entities = await fetch_entities(url)
+    totals = {entity: 0 for entity in ENTITIES}
+    provinces = {}
 
-    log.info("Estructurando datos...")
-
-    resume = {}
-
-    resume.setdefault('provincias', {}).update({'total': len(entities['provincias'])})
-    resume['provincias'].update({row['id']: {} for row in entities['provincias']})
-
-    resume.setdefault('departamentos', {}).update({'total': len(entities['departamentos'])})
-    for row in entities['departamentos']:
-        resume['provincias'][row['provincia']['id']].setdefault('departamentos', 0)
-        resume['provincias'][row['provincia']['id']]['departamentos'] += 1
-
-    resume.setdefault('municipios', {}).update({'total': len(entities['municipios'])})
-    for row in entities['municipios']:
-        resume['provincias'][row['provincia']['id']].setdefault('municipios', 0)
-        resume['provincias'][row['provincia']['id']]['municipios'] += 1
-
-    resume.setdefault('localidades-censales', {}).update({'total': len(entities['localidades-censales'])})
-    for row in entities['localidades-censales']:
-        resume['provincias'][row['provincia']['id']].setdefault('localidades-censales', 0)
-        resume['provincias'][row['provincia']['id']]['localidades-censales'] += 1
+    def get_counter(entity):
+        def count(row):
+            totals[entity] += 1
+            if entity == 'provincias':
+                provinces.setdefault(row['id'], {})
+            else:
+                province = provinces.setdefault(row['provincia']['id'], {})
+                province[entity] = province.get(entity, 0) + 1
+        return count
 
-    resume.setdefault('asentamientos', {}).update({'total': len(entities['asentamientos'])})
-    for row in entities['asentamientos']:
-        resume['provincias'][row['provincia']['id']].setdefault('asentamientos', 0)
-        resume['provincias'][row['provincia']['id']]['asentamientos'] += 1
+    session = POOL.async_session()
+    await asyncio.gather(*[consume_entity(session, url, entity, get_counter(entity)) for entity in ENTITIES])
 
-    resume.setdefault('localidades', {}).update({'total': len(entities['localidades'])})
-    for row in entities['localidades']:
-        resume['provincias'][row['provincia']['id']].setdefault('localidades', 0)
-        resume['provincias'][row['provincia']['id']]['localidades'] += 1
+    log.info("Estructurando datos...")
 
-    resume.setdefault('calles', {}).update({'total': len(entities['calles'])})
-    for row in entities['calles']:
-        resume['provincias'][row['provincia']['id']].setdefault('calles', 0)
-        resume['provincias'][row['provincia']['id']]['calles'] += 1
+    resume = {entity: {'total': totals[entity]} for entity in ENTITIES}
+    for province_id in sorted(provinces.keys()):
+        resume['provincias'][province_id] = {
+            entity: provinces[province_id][entity] for entity in ENTITIES if entity in provinces[province_id]
+        }
 
     return resume
@@ -0,0 +1,242 @@
+import json
+import math
+import threading
+import time
+from collections import Counter
+
+
+class LatencyHistogram:
+    """
+        Histograma de latencias con cubetas de ancho logarítmico. Ocupa memoria acotada sin importar la cantidad de
+    muestras y estima los percentiles con un error relativo menor a growth - 1.
+    """
+
+    def __init__(self, growth=1.05, minimum=0.0001) -> None:
+        """
+        :param growth: razón entre los límites de cubetas consecutivas.
+        :param minimum: límite superior en segundos de la primera cubeta.
+        """
+        super().__init__()
+        self.growth = growth
+        self.minimum = minimum
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, value):
+        if value <= self.minimum:
+            return 0
+        return int(math.ceil(math.log(value / self.minimum, self.growth)))
+
+    def add(self, value):
+        self.buckets[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+            Estima el percentil p (entre 0 y 100) de las latencias registradas.
+        """
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        accumulated = 0
+        for index in sorted(self.buckets):
+            accumulated += self.buckets[index]
+            if accumulated >= rank:
+                return min(self.minimum * self.growth ** index, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class EndpointMetrics:
+    """ Contadores de las peticiones a un endpoint. """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.limiter_wait = 0.0
+        self.cached = 0
+        self.statuses = Counter()
+        self.latency = LatencyHistogram()
+        self.rate_limits = {}
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.retries += other.retries
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.limiter_wait += other.limiter_wait
+        self.cached += other.cached
+        self.statuses.update(other.statuses)
+        self.latency.merge(other.latency)
+        for period, (limit, remaining) in other.rate_limits.items():
+            self.add_rate_limit(period, limit, remaining)
+
+    def add_rate_limit(self, period, limit, remaining):
+        """ Registra el límite de un período y conserva la menor cantidad de peticiones restantes informada. """
+        if period in self.rate_limits:
+            previous_limit, previous_remaining = self.rate_limits[period]
+            limit = max(limit, previous_limit)
+            remaining = min(remaining, previous_remaining)
+        self.rate_limits[period] = (limit, remaining)
+
+    def as_dict(self, elapsed=None):
+        data = {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'limiter_wait': self.limiter_wait,
+            'cached': self.cached,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'latency': self.latency.as_dict(),
+            'rate_limits': {
+                period: {'limit': limit, 'min_remaining': remaining, 'headroom': remaining / limit if limit else None}
+                for period, (limit, remaining) in sorted(self.rate_limits.items())
+            },
+        }
+        if elapsed:
+            data['rps'] = self.requests / elapsed
+        return data
+
+
+class Metrics:
+    """
+        Registro de las peticiones HTTP por endpoint: cantidad, bytes enviados y recibidos, códigos de estado,
+    latencias (p50, p95 y p99), espera en el limitador, errores, reintentos, peticiones evitadas por la caché y el
+    menor margen informado en los encabezados x-ratelimit-* (headroom: restantes sobre el límite de cada período).
+
+    Cada intento de una petición se registra por separado; los reintentos son los intentos posteriores al primero.
+    La latencia se mide desde el envío hasta que se termina de leer la respuesta. Las funciones agregadas con
+    add_hook() reciben un diccionario con los datos de cada intento a medida que ocurren.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.endpoints = {}
+        self.started = time.time()
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+            Agrega una función que recibe cada intento registrado, con las claves 'endpoint', 'method', 'status',
+        'latency', 'bytes_in', 'bytes_out', 'limiter_wait', 'attempt' y 'error'.
+        """
+        self._hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def _endpoint(self, endpoint):
+        metrics = self.endpoints.get(endpoint)
+        if metrics is None:
+            metrics = self.endpoints[endpoint] = EndpointMetrics()
+        return metrics
+
+    def record(self, endpoint, method, status=None, latency=0.0, bytes_in=0, bytes_out=0, limiter_wait=0.0,
+               attempt=0, error=None, rate_limits=None):
+        """
+            Registra un intento de petición.
+        :param endpoint: nombre del endpoint consultado.
+        :param method: método HTTP.
+        :param status: código de estado de la respuesta o None si no se obtuvo respuesta.
+        :param latency: segundos desde el envío hasta leer la respuesta.
+        :param bytes_in: bytes recibidos.
+        :param bytes_out: bytes enviados.
+        :param limiter_wait: segundos de espera en el limitador antes del envío.
+        :param attempt: número de intento (0 para el primero).
+        :param error: excepción ocurrida, si la hubo.
+        :param rate_limits: diccionario con el límite y las peticiones restantes, (limit, remaining), de cada
+        período informado en la respuesta.
+        """
+        with self._lock:
+            metrics = self._endpoint(endpoint)
+            metrics.requests += 1
+            metrics.bytes_in += bytes_in
+            metrics.bytes_out += bytes_out
+            metrics.limiter_wait += limiter_wait
+            metrics.latency.add(latency)
+            if attempt:
+                metrics.retries += 1
+            if status is not None:
+                metrics.statuses[status] += 1
+            if error is not None:
+                metrics.errors += 1
+            for period, (limit, remaining) in (rate_limits or {}).items():
+                metrics.add_rate_limit(period, limit, remaining)
+
+        if self._hooks:
+            event = {
+                'endpoint': endpoint, 'method': method, 'status': status, 'latency': latency, 'bytes_in': bytes_in,
+                'bytes_out': bytes_out, 'limiter_wait': limiter_wait, 'attempt': attempt, 'error': error
+            }
+            for hook in list(self._hooks):
+                hook(event)
+
+    def record_cached(self, endpoint, count=1):
+        """ Registra peticiones a un endpoint que no se enviaron porque la respuesta estaba en la caché. """
+        with self._lock:
+            metrics = self._endpoint(endpoint)
+            metrics.cached += count
+
+    def merge(self, endpoints):
+        """
+            Suma los registros de otro objeto Metrics (por ejemplo, de un proceso hijo).
+        :param endpoints: el atributo endpoints del otro registro.
+        """
+        with self._lock:
+            for endpoint, other in endpoints.items():
+                self.endpoints.setdefault(endpoint, EndpointMetrics()).merge(other)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """
+            Devuelve un resumen de los registros, por endpoint y en total.
+        """
+        elapsed = time.time() - self.started
+        with self._lock:
+            total = EndpointMetrics()
+            for metrics in self.endpoints.values():
+                total.merge(metrics)
+            return {
+                'elapsed': elapsed,
+                'total': total.as_dict(elapsed),
+                'endpoints': {
+                    endpoint: metrics.as_dict(elapsed) for endpoint, metrics in sorted(self.endpoints.items())
+                }
+            }
+
+    def to_json(self, filename):
+        """ Guarda el resumen de los registros en un archivo json. """
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
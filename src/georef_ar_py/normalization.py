@@ -1,17 +1,27 @@
 import asyncio
+import concurrent.futures
+import json
 import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from collections.abc import Sequence
 from typing import List
 
-import aiohttp
 import numpy as np
 import tqdm.asyncio as tqdma
 from aiohttp import ClientResponseError, ServerDisconnectedError
 from requests import HTTPError
 
-from georef_ar_py.georequests import API_BASE_URL, get_json_post_async, get_json_async, get_limits
+from georef_ar_py import formats, georequests
+from georef_ar_py.georequests import API_BASE_URL, METRICS, POOL, RETRY_POLICY, RateLimiter, get_json_post_async, \
+    get_json_async, get_limits, run_async
 import pandas as pd
 
-from georef_ar_py.utils import flatten_dict
+from georef_ar_py.formats import CsvShard, csv_shards
+from georef_ar_py.similar import CONTEXT_ENDPOINTS, ContextResolver
+from georef_ar_py.utils import Flattener
 
 log = logging.getLogger(__name__)
 
@@ -68,9 +78,60 @@ ERROR_TEMPLATE = {
     }
 }
 
+RESPONSE_FLATTENER = Flattener(NORM_TEMPLATE, ERROR_TEMPLATE)
+
+ABBREVIATIONS = {
+    'avenida': ['av', 'avda', 'avd', 'aven'],
+    'boulevard': ['bv', 'bvd', 'bvar', 'bvard', 'blvd', 'boul'],
+    'general': ['gral', 'grl'],
+    'presidente': ['pte', 'pres'],
+    'doctor': ['dr'],
+    'coronel': ['cnel'],
+    'teniente': ['tte'],
+    'ingeniero': ['ing'],
+    'pasaje': ['pje', 'psje'],
+    'diagonal': ['diag'],
+    'santa': ['sta'],
+}
+_EXPANSIONS = {abbreviation: word for word, abbreviations in ABBREVIATIONS.items() for abbreviation in abbreviations}
+_ABBREVIATION = re.compile(r'\b(?:{})\b'.format('|'.join(_EXPANSIONS)))
+_NUMBER_SIGN = re.compile(r'\b(?:n\s*[°º]|nro\b\.?|num\b\.?|n[uú]mero\b)\s*(?=\d)')
+_THOUSANDS = re.compile(r'(?<=\d)\.(?=\d{3}\b)')
+# Puntos que no están entre dígitos y el límite entre un nombre y su altura, sin los ceros a la izquierda de la
+# altura. Los números que no siguen a un nombre, como los ids de provincia ("06"), no se modifican.
+_SEPARATORS = re.compile(r'(?<!\d)\.|\.(?!\d)|(?<=[a-z])\s*0*(?=\d)')
+_SPACES = re.compile(r'\s+')
+
+
+def canonicalize(values):
+    """
+        Lleva un arreglo de textos a una forma canónica, con operaciones vectorizadas de pandas sobre los valores
+    distintos: minúsculas, sin acentos, con las abreviaturas comunes expandidas (ver ABBREVIATIONS), la altura
+    separada del nombre y sin "N°", separadores de miles ni ceros a la izquierda, sin puntos y con los espacios
+    colapsados. Por ejemplo, "Av. San Martín N° 1.500" y "AVENIDA  SAN MARTIN 1500" quedan como
+    "avenida san martin 1500". Los valores faltantes se mantienen en None.
+
+    :param values: lista o arreglo de textos o None.
+    :return: Un arreglo de numpy de tipo object.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    text = pd.Series(uniques, dtype=object).astype(str).str.lower()
+    text = text.str.replace(_NUMBER_SIGN, ' ', regex=True)
+    text = text.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+    text = text.str.replace(_THOUSANDS, '', regex=True)
+    text = text.str.replace(_SEPARATORS, ' ', regex=True)
+    text = text.str.replace(_ABBREVIATION, lambda match: _EXPANSIONS[match.group()], regex=True)
+    text = text.str.replace(_SPACES, ' ', regex=True).str.strip()
+    result = np.append(text.to_numpy(dtype=object), None)
+    return result[codes]
+
 
 class Address:
 
+    __slots__ = (
+        'address', 'province', 'department', 'census_locality', 'locality', '_normalization', '_nomenclature', '_error'
+    )
+
     def __init__(self, direccion=None, provincia=None, departamento=None, localidad_censal=None, localidad=None) -> None:
         super().__init__()
         self.address = direccion
@@ -102,6 +163,11 @@ class Address:
         params.update({'max': 1})
         return params
 
+    @property
+    def query_key(self):
+        """ Clave de la consulta: dos direcciones con la misma clave reciben la misma normalización. """
+        return tuple(sorted(self.get_params_query().items()))
+
     @property
     def normalization(self):
         return self._normalization or {}
@@ -132,25 +198,376 @@ class Address:
         return self._nomenclature
 
 
+class AddressBatch:
+    """
+        Lote de direcciones guardado en columnas: un arreglo por cada campo de SOURCE_TEMPLATE y, por fila, la
+    respuesta recibida (la normalización o el error) y su estado. Arma las consultas y recibe los resultados por
+    índice de fila, sin crear un objeto Address por dirección; solo las consultas de a una dirección usan objetos
+    Address, creados al momento con address().
+
+    Si se indica canonical, las consultas se arman con la forma canónica de los campos (ver canonicalize()), por lo
+    que las variantes de una misma dirección comparten la clave de consulta y la entrada en la caché de respuestas;
+    las columnas de origen se conservan sin cambios para la salida.
+    """
+
+    PENDING, NORMALIZED, NOT_FOUND, ERROR = range(4)
+    FIELDS = list(SOURCE_TEMPLATE.keys())
+
+    def __init__(self, columns, canonical=False) -> None:
+        """
+        :param columns: diccionario con un arreglo de valores (str o None) por cada campo de SOURCE_TEMPLATE.
+        :param canonical: arma las consultas con la forma canónica de los valores.
+        """
+        super().__init__()
+        self.columns = {field: np.asarray(columns[field], dtype=object) for field in self.FIELDS}
+        self.query_columns = self.columns
+        if canonical:
+            self.query_columns = {field: canonicalize(values) for field, values in self.columns.items()}
+        self.size = len(self.columns['direccion'])
+        self.results = [None] * self.size
+        self.status = np.full(self.size, self.PENDING, dtype=np.int8)
+
+    @classmethod
+    def from_df(cls, df, canonical=False):
+        df = df.filter(items=cls.FIELDS)
+        df = df.astype('str', errors='ignore').where(df.notna(), None)
+        df = df.reindex(columns=cls.FIELDS)
+        df = df.replace(np.nan, None)
+        return cls({field: df[field].to_numpy(dtype=object) for field in cls.FIELDS}, canonical)
+
+    @classmethod
+    def from_addresses(cls, addresses: List[Address], canonical=False):
+        return cls({
+            'direccion': [address.address for address in addresses],
+            'provincia': [address.province for address in addresses],
+            'departamento': [address.department for address in addresses],
+            'localidad_censal': [address.census_locality for address in addresses],
+            'localidad': [address.locality for address in addresses],
+        }, canonical)
+
+    def __len__(self):
+        return self.size
+
+    def address(self, i) -> Address:
+        return Address(*[self.query_columns[field][i] for field in self.FIELDS])
+
+    def query(self, i):
+        """ Los parámetros de la consulta de la fila i, como en Address.get_params_query(). """
+        params = {'direccion': self.query_columns['direccion'][i]}
+        for field in self.FIELDS[1:]:
+            value = self.query_columns[field][i]
+            if value:
+                params[field] = value
+        params['campos'] = 'basico'
+        params['max'] = 1
+        return params
+
+    def queries(self, rows):
+        return [self.query(i) for i in rows]
+
+    def set_query_columns(self, columns):
+        """ Reemplaza los valores de consulta de algunos campos, sin cambiar los de la salida (columns). """
+        if self.query_columns is self.columns:
+            self.query_columns = dict(self.columns)
+        for field, values in columns.items():
+            self.query_columns[field] = np.asarray(values, dtype=object)
+
+    def query_keys(self):
+        """ La clave de la consulta de cada fila: dos filas con la misma clave reciben la misma normalización. """
+        return list(zip(*[
+            [value or None for value in self.query_columns[field]] for field in self.FIELDS
+        ]))
+
+    def set_normalization(self, i, normalizations):
+        if normalizations:
+            self.results[i] = normalizations[0]
+            self.status[i] = self.NORMALIZED
+        else:
+            self.results[i] = None
+            self.status[i] = self.NOT_FOUND
+
+    def set_address(self, i, address: Address):
+        """ Guarda en la fila i el resultado de una consulta hecha con un objeto Address. """
+        self.results[i] = address.data_dict or None
+        if address.normalization:
+            self.status[i] = self.NORMALIZED
+        elif address.error:
+            self.status[i] = self.ERROR
+        else:
+            self.status[i] = self.NOT_FOUND
+
+    def copy(self, i, other, j):
+        """ Copia en la fila i el resultado de la fila j de otro lote. """
+        self.set_result(i, *other.result(j))
+
+    def result(self, i):
+        """ El resultado y el estado de la fila i. """
+        return self.results[i], self.status[i]
+
+    def set_result(self, i, result, status):
+        self.results[i] = result
+        self.status[i] = status
+
+    def update_addresses(self, addresses: List[Address]):
+        """ Vuelca los resultados del lote en los objetos Address de los que se creó. """
+        for address, result, status in zip(addresses, self.results, self.status):
+            address.normalization = result if status == self.NORMALIZED else {}
+            address.error = result if status == self.ERROR else None
+
+    def to_df(self, flattener):
+        """
+            Arma un DataFrame con las columnas de origen y las de la respuesta.
+        :param flattener: un utils.Flattener con la estructura de la respuesta.
+        """
+        data = dict(self.columns)
+        data.update(flattener.to_columns(self.results))
+        return pd.DataFrame(data)
+
+
+class BatchController:
+    """
+        Control AIMD (aumento aditivo, disminución multiplicativa) del tamaño de los POST por lotes y de la cantidad
+    de POST simultáneos, a partir de cada intento de petición observado (ver Metrics.add_hook).
+
+    Mientras las respuestas llegan sin errores y antes de target_latency, cada una suma step direcciones al lote y,
+    una vez por cada `concurrency` respuestas, se admite un POST simultáneo más. Un timeout, un error de conexión o
+    una respuesta 5xx o 429 dividen el lote y la concurrencia por dos; una respuesta lenta, solo el lote. Después de
+    una disminución, las siguientes se ignoran durante una latencia media, para no reaccionar varias veces a la
+    misma congestión.
+
+    También hace de semáforo ajustable: acquire() espera hasta que haya menos de concurrency POST en curso.
+    """
+
+    def __init__(self, size=500, concurrency=10, min_size=10, max_size=1000, max_concurrency=None,
+                 target_latency=5.0, step=None, endpoint='direcciones') -> None:
+        """
+        :param size: tamaño inicial del lote.
+        :param concurrency: cantidad inicial de POST simultáneos.
+        :param max_concurrency: tope de POST simultáneos; por defecto, concurrency.
+        :param target_latency: segundos por encima de los cuales una respuesta se considera lenta.
+        :param step: direcciones que se suman al lote por cada respuesta rápida; por defecto, el 10% del inicial.
+        :param endpoint: endpoint de los POST observados.
+        """
+        super().__init__()
+        self.size = size
+        self.concurrency = concurrency
+        self.min_size = min(min_size, size)
+        self.max_size = max(max_size, size)
+        self.max_concurrency = max_concurrency or concurrency
+        self.target_latency = target_latency
+        self.step = step or max(size // 10, 1)
+        self.endpoint = endpoint
+        self.latency = None
+        self.increases = 0
+        self.decreases = 0
+        self.on_change = None
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._waiters = deque()
+        self._sizes = []
+
+    # Semáforo
+
+    async def acquire(self):
+        if self._in_flight < self.concurrency and not self._waiters:
+            self._in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._in_flight < self.concurrency:
+            future = self._waiters.popleft()
+            if not future.done():
+                self._in_flight += 1
+                future.set_result(None)
+
+    def take(self, available):
+        """ Devuelve el tamaño del próximo lote, para available direcciones pendientes, y lo registra. """
+        size = min(self.size, available)
+        self._sizes.append(size)
+        return size
+
+    # Control
+
+    def observe(self, event):
+        """ Ajusta el lote y la concurrencia con un intento de petición registrado por Metrics. """
+        if event['method'] != 'POST' or event['endpoint'] != self.endpoint:
+            return
+        latency = event['latency']
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        status = event['status']
+        if status is None and event['error'] is not None or status is not None and (status >= 500 or status == 429):
+            self._decrease(concurrency=True)
+        elif latency > self.target_latency:
+            self._decrease(concurrency=False)
+        elif status is not None and status < 400:
+            self._increase()
+
+    def _increase(self):
+        size, concurrency = self.size, self.concurrency
+        self.size = min(self.size + self.step, self.max_size)
+        self._successes += 1
+        if self._successes >= self.concurrency:
+            self._successes = 0
+            self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+        if (size, concurrency) != (self.size, self.concurrency):
+            self.increases += 1
+            self._changed()
+
+    def _decrease(self, concurrency):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or 0):
+            return
+        self._last_decrease = now
+        self._successes = 0
+        self.size = max(self.size // 2, self.min_size)
+        if concurrency:
+            self.concurrency = max(self.concurrency // 2, 1)
+        self.decreases += 1
+        self._changed()
+
+    def _changed(self):
+        self._wake()
+        if self.on_change:
+            self.on_change(self)
+
+    def snapshot(self):
+        """ El lote y la concurrencia actuales, los tamaños de lote usados, la latencia media y los ajustes. """
+        return {
+            'size': self.size,
+            'concurrency': self.concurrency,
+            'mean_size': sum(self._sizes) / len(self._sizes) if self._sizes else None,
+            'min_size': min(self._sizes, default=None),
+            'max_size': max(self._sizes, default=None),
+            'latency': self.latency,
+            'increases': self.increases,
+            'decreases': self.decreases,
+        }
+
+
+class Checkpoint:
+    """
+        Archivo de control de una normalización por lotes, guardado junto al csv de salida. Registra cuántas filas de
+    la entrada ya están escritas en la salida, el tamaño en bytes de la salida hasta ese punto y los rangos de filas
+    que estaban en curso. Se reemplaza de forma atómica después de escribir cada chunk, por lo que siempre describe
+    un estado consistente de la salida.
+    """
+
+    SUFFIX = '.checkpoint'
+
+    def __init__(self, filename) -> None:
+        super().__init__()
+        self.filename = filename
+
+    @classmethod
+    def for_target(cls, target):
+        return cls(target + cls.SUFFIX)
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def load(self):
+        with open(self.filename) as f:
+            return json.load(f)
+
+    def save(self, **data):
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.filename)
+
+
+def _normalize_shard(kwargs, token, source, target, shard, index, resume, fmt, geometry):
+    """
+        Normaliza un rango de un csv en un proceso hijo (ver AddressNormalizer.normalize_file).
+    :return: Los contadores de la ejecución y las métricas de las peticiones (ver Metrics.merge).
+    """
+    georequests.TOKEN = token
+    METRICS.reset()
+    normalizer = AddressNormalizer(**kwargs)
+    checkpoint, state = normalizer._prepare(source, target, resume, shard)
+    normalizer._normalize_file(
+        source, target, checkpoint, state, shard, total=CsvShard.count_rows(source, *shard),
+        desc="Parte {}: ".format(index + 1), position=index, fmt=fmt, geometry=geometry
+    )
+    return normalizer._summary(), METRICS.endpoints
+
+
 class AddressNormalizer:
 
-    def __init__(self, url=API_BASE_URL, endpoint="direcciones", chunk_size=1000, data_size=500, rps=None) -> None:
+    def __init__(
+            self, url=API_BASE_URL, endpoint="direcciones", chunk_size=1000, data_size=500, rps=None, concurrency=10,
+            dedup=True, dedup_size=1000000, queue_size=4, rate_limits=None, share=1.0, canonical=True,
+            street_index=None, min_score=0.8, adaptive=False, target_latency=5.0, resolve_context=False
+    ) -> None:
+        """
+        :param dedup: consulta una sola vez las direcciones repetidas en la ejecución y copia el resultado al resto.
+        :param dedup_size: cantidad máxima de consultas distintas cuyo resultado se recuerda para agrupar las
+        repetidas; al superarla se olvidan las usadas hace más tiempo, que se vuelven a consultar si reaparecen.
+        :param street_index: un objeto streets.StreetIndex, o la ruta a su archivo, con el que se resuelven sin
+        peticiones las direcciones que encuentra con un puntaje de al menos min_score; el resto se consulta a la API.
+        :param adaptive: ajusta durante la ejecución el tamaño de los POST, desde data_size, y la cantidad de POST
+        simultáneos, hasta concurrency, según las latencias y los errores observados (ver BatchController).
+        :param target_latency: latencia en segundos a partir de la cual el control adaptativo achica los lotes.
+        :param resolve_context: antes de consultar las direcciones, resuelve a IDs los valores distintos de provincia,
+        departamento y localidad censal, una sola vez cada uno, y consulta con esos IDs en lugar de los textos
+        originales (ver similar.ContextResolver). Agrega peticiones a esos endpoints, que se hacen al leer cada chunk.
+        """
         super().__init__()
-        self._addresses = []
         self._url = url
         self._enpoint = endpoint
         self._chunk_size = chunk_size
         self._data_size = data_size
-        self._requests_remaining = 0
-        self._df = None
+        self._concurrency = concurrency
+        self._rate_limiter = None
         self._pbar = None
         self._normalized_count = 0
         self._errors_count = 0
-        self._columns_response = None
-        self._rate_limits = None
+        self._rate_limits = rate_limits
+        self._share = share
         self._rps = rps
+        self._max_rps = rps
         self._total_addresses = 1
-        self._consumption_rate = None
+        self._dedup = dedup
+        self._dedup_size = dedup_size
+        self._canonical = canonical
+        self._street_index = street_index
+        if isinstance(street_index, str):
+            from georef_ar_py.streets import StreetIndex
+            self._street_index = StreetIndex.load(street_index)
+        self._min_score = min_score
+        self._local_count = 0
+        self._context_resolver = ContextResolver(url) if resolve_context else None
+        self._adaptive = adaptive
+        self._target_latency = target_latency
+        self._controller = None
+        self._batching = []
+        self._queue_size = queue_size
+        self._queries = OrderedDict()
+        self._queries_count = 0
+        self._rows_count = 0
+        self._in_flight = {}
+        self._stages = {}
+        self._elapsed = 0.0
+        self._retries = 0
 
     @staticmethod
     def row_count(file):
@@ -159,15 +576,7 @@ class AddressNormalizer:
 
     @property
     def columns(self):
-        if not self._columns_response:
-            self._columns_response = list(
-                flatten_dict(NORM_TEMPLATE).keys()
-            )
-            error_list = list(
-                flatten_dict(ERROR_TEMPLATE).keys()
-            )
-            self._columns_response.extend(error_list)
-        return self._columns_response
+        return RESPONSE_FLATTENER.columns
 
     @property
     def rate_limits(self):
@@ -196,7 +605,8 @@ class AddressNormalizer:
             estimated_error_freq = 0.6
             get_req = post_req * estimated_error_freq * self._data_size
             total_req = int(post_req + get_req)
-            rl = self.rate_limits
+            # Los períodos sin encabezado x-ratelimit-* (por ejemplo, en una API propia) no tienen límite.
+            rl = {k: float('inf') if v is None else v for k, v in self.rate_limits.items()}
             if rl['remaining-second'] > total_req:
                 self._rps = total_req
             elif rl['remaining-minute'] > total_req:
@@ -208,10 +618,52 @@ class AddressNormalizer:
         return self._rps
 
     @property
-    def consumption_rate(self):
-        if not self._consumption_rate:
-            self._consumption_rate = 1 / self.rps
-        return self._consumption_rate
+    def rate_limiter(self):
+        if not self._rate_limiter:
+            self._rate_limiter = RateLimiter.from_limits(
+                self.rate_limits, rps=self._max_rps, concurrency=self._concurrency, share=self._share
+            )
+        return self._rate_limiter
+
+    @property
+    def batching(self):
+        """
+            El estado final del control adaptativo de la última ejecución (ver BatchController.snapshot()), uno por
+        proceso, o una lista vacía si no se usó.
+        """
+        return self._batching
+
+    @property
+    def dedup_ratio(self):
+        """
+            Proporción de las direcciones consultadas en la última ejecución (las que no se resolvieron con el
+        índice de calles) que se resolvieron con una consulta ya enviada.
+        """
+        if not self._rows_count:
+            return 0.0
+        return 1 - self._queries_count / self._rows_count
+
+    @property
+    def summary(self):
+        """
+            Resumen de la última ejecución de normalize_file(): contadores, segundos de cada etapa del pipeline
+        (lectura, espera de las consultas y escritura), filas por segundo, consultas evitadas por el agrupamiento de
+        direcciones repetidas y por el índice de calles y segundos en cada estado del circuito de peticiones (ver
+        context.Report y georequests.CircuitBreaker).
+        """
+        summary = self._summary()
+        rows = self._rows_count + self._local_count
+        summary.update({
+            'retries': self._retries,
+            'elapsed': self._elapsed,
+            'rows_per_second': rows / self._elapsed if self._elapsed else None,
+            'dedup_ratio': self.dedup_ratio,
+            'saved': {'dedup': self._rows_count - self._queries_count, 'street_index': self._local_count},
+        })
+        return summary
+
+    def _add_stage_time(self, stage, start):
+        self._stages[stage] = self._stages.get(stage, 0.0) + time.monotonic() - start
 
     def _set_error(self, address, status_code, reason):
         address.error = {
@@ -222,6 +674,41 @@ class AddressNormalizer:
         }
         self._errors_count += 1
 
+    @staticmethod
+    def _error_status(e):
+        """ El código de estado y el motivo con los que se registra el error de una petición. """
+        if isinstance(e, HTTPError):
+            return e.response.status_code, e.response.reason
+        if isinstance(e, ClientResponseError):
+            return e.status, e.message
+        if isinstance(e, ServerDisconnectedError):
+            return "Unknown", e.message
+        if isinstance(e, asyncio.TimeoutError):
+            return "Unknown", "Timeout error"
+        return "Unknown", "Unknown"
+
+    @classmethod
+    def _is_row_error(cls, e):
+        """
+            Indica si el error de un POST puede deberse a alguna dirección del lote: una respuesta 4xx (salvo 429) o
+        una respuesta que no se pudo interpretar. Los errores del servidor o de la conexión no se aíslan dividiendo
+        el lote, porque fallarían también todas sus partes.
+        """
+        if isinstance(e, ValueError):
+            return True
+        status_code, _ = cls._error_status(e)
+        return isinstance(status_code, int) and 400 <= status_code < 500 and status_code != 429
+
+    def _set_batch_error(self, batch: AddressBatch, rows, e):
+        """ Registra el error de un POST en todas sus filas. """
+        status_code, reason = self._error_status(e)
+        error = {'error': {'status_code': status_code, 'reason': reason}}
+        for i in rows:
+            batch.set_result(i, error, AddressBatch.ERROR)
+        self._errors_count += len(rows)
+        if self._pbar:
+            self._pbar.update(len(rows))
+
     def _set_normalization(self, address, normalizations):
         if len(normalizations) == 0:
             address.normalization = {}
@@ -234,17 +721,11 @@ class AddressNormalizer:
             self._pbar.update(1)
 
     async def _request(self, session, data=None, **kwargs):
-        while self._requests_remaining > 1:
-            await asyncio.sleep(self.consumption_rate)
-        self._requests_remaining += 1
-        try:
-            if data:
-                response = await get_json_post_async(session, self._url, self._enpoint, data, **kwargs)
-            else:
-                response = await get_json_async(session, self._url, self._enpoint, **kwargs)
-            return response
-        finally:
-            self._requests_remaining -= 1
+        if data:
+            return await get_json_post_async(
+                session, self._url, self._enpoint, data, rate_limiter=self.rate_limiter, **kwargs
+            )
+        return await get_json_async(session, self._url, self._enpoint, rate_limiter=self.rate_limiter, **kwargs)
 
     async def normalize_address(self, session, address: Address) -> Address:
         """ Consulta a la API para normalizar una dirección
@@ -257,104 +738,655 @@ class AddressNormalizer:
         try:
             response = await self._request(session, **address.get_params_query())
             self._set_normalization(address, response.get('direcciones', []))
-        except HTTPError as re:
-            self._set_error(address, re.response.status_code, re.response.reason)
-        except ClientResponseError as cre:
-            self._set_error(address, cre.status, cre.message)
-        except ServerDisconnectedError as sde:
-            self._set_error(address, "Unknown", sde.message)
-        except asyncio.TimeoutError:
-            self._set_error(address, "Unknown", "Timeout error")
         except Exception as e:
-            self._set_error(address, "Unknown", "Unknown")
+            self._set_error(address, *self._error_status(e))
         finally:
             self._update_address_count()
             return address
 
+    async def _post_batch(self, session, batch: AddressBatch, rows):
+        response = await self._request(session, data={"direcciones": batch.queries(rows)})
+        results = response.get('resultados') or []
+        if len(results) != len(rows):
+            raise ValueError("Se esperaban {} resultados y se recibieron {}".format(len(rows), len(results)))
+        for i, result in zip(rows, results):
+            batch.set_normalization(i, result.get('direcciones', []))
+        self._normalized_count += int(np.count_nonzero(batch.status[rows] == AddressBatch.NORMALIZED))
+        if self._pbar:
+            self._pbar.update(len(rows))
+
+    async def _bisect(self, session, batch: AddressBatch, rows) -> int:
+        """ Divide las filas de un lote fallido en mitades y consulta cada una, recursivamente, hasta aislar las
+        direcciones que fallan. Solo las hojas de una dirección se consultan de a una.
+
+        :return: La cantidad de peticiones enviadas.
+        """
+        if len(rows) == 1:
+            address = await self.normalize_address(session, batch.address(rows[0]))
+            batch.set_address(rows[0], address)
+            return 1
+        half = len(rows) // 2
+        costs = await asyncio.gather(*[
+            self._normalize_part(session, batch, part) for part in (rows[:half], rows[half:])
+        ])
+        return sum(costs)
+
+    async def _normalize_part(self, session, batch: AddressBatch, rows) -> int:
+        if len(rows) == 1:
+            return await self._bisect(session, batch, rows)
+        try:
+            await self._post_batch(session, batch, rows)
+            return 1
+        except Exception as e:
+            if not self._is_row_error(e):
+                self._set_batch_error(batch, rows, e)
+                return 1
+            return 1 + await self._bisect(session, batch, rows)
+
+    async def _normalize_rows(self, session, batch: AddressBatch, rows):
+        """ Normaliza las filas indicadas de un lote en una petición POST (ver normalize_batch_addresses). """
+        try:
+            await self._post_batch(session, batch, rows)
+        except Exception as e:
+            if not self._is_row_error(e):
+                self._set_batch_error(batch, rows, e)
+                log.warning("Falló la petición de un lote de {} direcciones ({}): se registran como errores".format(
+                    len(rows), e.__class__.__name__
+                ))
+                return
+            cost = 1 + await self._bisect(session, batch, rows)
+            errors = int(np.count_nonzero(batch.status[rows] == AddressBatch.ERROR))
+            log.warning("Falló la petición de un lote de {} direcciones ({}): {} peticiones para aislar {} "
+                        "errores".format(len(rows), e.__class__.__name__, cost, errors))
+
     async def normalize_batch_addresses(self, session, addresses: List[Address]) -> List[Address]:
-        """ Consulta a la API para normalizar un conjunto de direcciones. Si ocurre un error se intentará
-        normalizar las direcciones de a una. Esta consulta considera que la API siempre devuelve un listado de
-        direcciones normalizadas en el mismo orden en que se envían.
+        """ Consulta a la API para normalizar un conjunto de direcciones. Si la API rechaza el lote (una respuesta
+        4xx o que no se puede interpretar), se divide en mitades que se consultan por separado hasta aislar las
+        direcciones con errores, por lo que cada dirección inválida cuesta del orden de log2(len(addresses))
+        peticiones en lugar de una por dirección del lote. Si el error es del servidor o de la conexión, una vez
+        agotados los reintentos, todas las direcciones del lote se registran con ese error. Esta
+        consulta considera que la API siempre devuelve un listado de direcciones normalizadas en el mismo orden en
+        que se envían.
 
         :param session: Client session for request
         :param addresses: Una lista de objetos Address con direcciones a normalizar.
         :return: La misma lista de objetos Address con las direcciones normalizadas o los errores encontrados.
         """
+        batch = AddressBatch.from_addresses(addresses, self._canonical)
+        await self._normalize_rows(session, batch, np.arange(len(batch)))
+        batch.update_addresses(addresses)
+        return addresses
 
+    def _pending_rows(self, batch: AddressBatch):
+        """
+            Devuelve las filas del lote cuya consulta no se envió antes en la ejecución, una por consulta, y las
+        registra como enviadas, junto con las filas repetidas y el origen de su resultado: la fila de un lote en
+        curso o el resultado ya guardado (ver _release_queries). Las filas ya resueltas con el índice de calles no se
+        consultan. Se recuerdan a lo sumo dedup_size consultas, las usadas más recientemente.
+        """
+        resolved = batch.status != AddressBatch.PENDING
+        local = int(np.count_nonzero(resolved))
+        self._local_count += local
+        self._normalized_count += local
+        if self._pbar and local:
+            self._pbar.update(local)
+        self._rows_count += len(batch) - local
+        if not self._dedup:
+            self._queries_count += len(batch) - local
+            return np.flatnonzero(~resolved), [], []
+        pending = []
+        keys = []
+        duplicates = []
+        for i, key in enumerate(batch.query_keys()):
+            if resolved[i]:
+                continue
+            source = self._queries.get(key)
+            if source is None:
+                self._queries[key] = (batch, i)
+                if len(self._queries) > self._dedup_size:
+                    self._queries.popitem(last=False)
+                pending.append(i)
+                keys.append(key)
+            else:
+                self._queries.move_to_end(key)
+                duplicates.append((i, source))
+        self._queries_count += len(pending)
+        return np.array(pending, dtype=np.intp), keys, duplicates
+
+    def _release_queries(self, batch: AddressBatch, rows, keys):
+        """
+            Reemplaza la referencia al lote de las consultas que envió por su resultado y su estado, para que el lote
+        se libere una vez escrito.
+        """
+        for i, key in zip(rows, keys):
+            source = self._queries.get(key)
+            if source is not None and source[0] is batch:
+                self._queries[key] = batch.result(i)
+
+    def _copy_results(self, batch: AddressBatch, duplicates):
+        """
+            Completa las filas repetidas con el resultado de la consulta ya enviada.
+        """
+        for i, source in duplicates:
+            if isinstance(source[0], AddressBatch):
+                batch.copy(i, *source)
+            else:
+                batch.set_result(i, *source)
+        if duplicates:
+            status = batch.status[[i for i, _ in duplicates]]
+            self._normalized_count += int(np.count_nonzero(status == AddressBatch.NORMALIZED))
+            self._errors_count += int(np.count_nonzero(status == AddressBatch.ERROR))
+            if self._pbar:
+                self._pbar.update(len(duplicates))
+
+    async def _run_normalization(self, session, batch: AddressBatch, rows):
+        if self._controller is None:
+            await asyncio.gather(*[
+                self._normalize_rows(session, batch, rows[i:i + self._data_size])
+                for i in range(0, len(rows), self._data_size)
+            ])
+            return
+        tasks = []
         try:
-            data = {"direcciones": [address.get_params_query() for address in addresses]}
-            response = await self._request(session, data=data)
-            for address, result in zip(addresses, response.get('resultados')):
-                self._set_normalization(address, result.get('direcciones', []))
-                self._update_address_count()
-        except Exception:
-            await asyncio.gather(*[self.normalize_address(session, address) for address in addresses])
+            start = 0
+            while start < len(rows):
+                await self._controller.acquire()
+                size = self._controller.take(len(rows) - start)
+                tasks.append(asyncio.ensure_future(self._controlled_rows(session, batch, rows[start:start + size])))
+                start += size
+            await asyncio.gather(*tasks)
         finally:
-            return addresses
+            for task in tasks:
+                task.cancel()
 
-    async def _run_normalization(self):
-        address_chunk_list = [
-            self._addresses[i:i + self._data_size] for i in range(
-                0, len(self._addresses), self._data_size
-            )
+    async def _controlled_rows(self, session, batch: AddressBatch, rows):
+        """ Normaliza un lote tomado con el control adaptativo y libera su lugar entre los POST simultáneos. """
+        try:
+            await self._normalize_rows(session, batch, rows)
+        finally:
+            self._controller.release()
+
+    def _resolve_context(self, batch: AddressBatch):
+        """ Reemplaza en las consultas del lote los nombres de provincia, departamento y localidad censal por IDs. """
+        batch.set_query_columns(self._context_resolver.resolve(
+            {field: batch.query_columns[field] for field in CONTEXT_ENDPOINTS}
+        ))
+
+    def _resolve_locally(self, batch: AddressBatch):
+        """ Resuelve con el índice de calles las filas del lote que encuentra con un puntaje suficiente. """
+        columns = batch.query_columns
+        if not self._canonical:
+            columns = {field: canonicalize(values) for field, values in batch.query_columns.items()}
+        for i, query in enumerate(zip(*[columns[field] for field in AddressBatch.FIELDS])):
+            normalization, score = self._street_index.resolve(*query)
+            if normalization is not None and score >= self._min_score:
+                batch.set_normalization(i, [normalization])
+
+    def _next_batch(self, frames):
+        chunk = next(frames, None)
+        if chunk is None:
+            return None
+        batch = AddressBatch.from_df(chunk, self._canonical)
+        if self._context_resolver is not None:
+            self._resolve_context(batch)
+        if self._street_index is not None:
+            self._resolve_locally(batch)
+        return batch
+
+    async def _read_chunks(self, source, chunks, skip=0, shard=None):
+        """
+            Etapa de lectura: lee el archivo (o el rango shard de un csv) por chunks y arma sus lotes, con la forma
+        canónica de las consultas y las filas que se resuelven con el índice de calles, en otro hilo, y los encola.
+        Omite las primeras skip filas.
+        """
+        loop = asyncio.get_running_loop()
+        frames = formats.read_frames(source, AddressBatch.FIELDS, self._chunk_size, skip, shard)
+        while True:
+            start = time.monotonic()
+            batch = await loop.run_in_executor(None, self._next_batch, frames)
+            self._add_stage_time('read', start)
+            if batch is None:
+                break
+            await chunks.put(batch)
+        await chunks.put(None)
+
+    async def _request_chunks(self, session, chunks, results, start=0):
+        """
+            Etapa de consultas: envía las direcciones de cada chunk sin esperar a que terminen los anteriores y
+        encola, en orden, la tarea de cada uno. La cola de resultados acotada limita los chunks en curso.
+        """
+        while (batch := await chunks.get()) is not None:
+            self._in_flight[start] = start + len(batch)
+            start += len(batch)
+            rows, keys, duplicates = self._pending_rows(batch)
+            task = asyncio.ensure_future(self._run_normalization(session, batch, rows))
+            await results.put((batch, rows, keys, duplicates, task))
+        await results.put(None)
+
+    @staticmethod
+    def _append_chunk(writer, df):
+        """ Agrega un chunk al archivo de salida. Devuelve el tamaño del archivo (ver formats.TableWriter). """
+        return writer.write(df)
+
+    async def _write_chunks(self, writer, results, checkpoint, info, rows=0, normalized=0, errors=0):
+        """
+            Etapa de escritura: espera cada chunk en el orden de lectura, lo agrega a la salida, en otro hilo, y
+        actualiza el checkpoint si la salida se puede retomar. El tiempo de espera de cada chunk se registra como el
+        de la etapa de consultas, que no está oculto detrás de la lectura. El checkpoint guarda los contadores de las
+        filas escritas, sin las de los chunks en curso, que se vuelven a consultar al retomar.
+        """
+        loop = asyncio.get_running_loop()
+        while (item := await results.get()) is not None:
+            batch, pending, keys, duplicates, task = item
+            start = time.monotonic()
+            await task
+            self._add_stage_time('request', start)
+            start = time.monotonic()
+            self._copy_results(batch, duplicates)
+            self._release_queries(batch, pending, keys)
+            df = batch.to_df(RESPONSE_FLATTENER)
+            offset = await loop.run_in_executor(None, self._append_chunk, writer, df)
+            self._add_stage_time('write', start)
+            del self._in_flight[rows]
+            rows += len(batch)
+            normalized += int(np.count_nonzero(batch.status == AddressBatch.NORMALIZED))
+            errors += int(np.count_nonzero(batch.status == AddressBatch.ERROR))
+            if writer.resumable:
+                checkpoint.save(
+                    rows=rows, offset=offset, in_flight=sorted(self._in_flight.items()),
+                    normalized=normalized, errors=errors, **info
+                )
+
+    async def _run_file(self, source, writer, checkpoint, state, shard=None):
+        rows = state['rows']
+        chunks = asyncio.Queue(self._queue_size)
+        results = asyncio.Queue(self._queue_size)
+        info = {'source': os.path.abspath(source), 'source_size': os.path.getsize(source), 'shard': shard}
+        stages = [
+            asyncio.ensure_future(self._read_chunks(source, chunks, rows, shard)),
+            asyncio.ensure_future(self._request_chunks(POOL.async_session(), chunks, results, rows)),
+            asyncio.ensure_future(self._write_chunks(
+                writer, results, checkpoint, info, rows, state['normalized'], state['errors']
+            )),
         ]
-        async with aiohttp.ClientSession() as session:
-            await asyncio.gather(*[
-                self.normalize_batch_addresses(session, address_chunk) for address_chunk in address_chunk_list
-            ])
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            for stage in stages:
+                stage.cancel()
+            while not results.empty():
+                item = results.get_nowait()
+                if item is not None:
+                    item[-1].cancel()
 
-    def _addresses_to_df(self):
-        address_data_list = [address.data_dict for address in self._addresses]
-        flatten_list = [flatten_dict(data) for data in address_data_list]
-        response_df = pd.DataFrame(flatten_list, columns=self.columns)
-        response_df.index = self._df.index
-        df_concat = pd.concat([self._df, response_df], axis=1)
-        return df_concat
+    def _resume_state(self, source, target, checkpoint, shard=None):
+        """
+            Lee el checkpoint de una ejecución interrumpida y recorta la salida hasta el último chunk registrado.
+        :return: El estado guardado en el checkpoint.
+        """
+        state = checkpoint.load()
+        if state['source_size'] != os.path.getsize(source) or state.get('shard') != (list(shard) if shard else None):
+            raise ValueError("El archivo {} no coincide con el de la ejecución interrumpida".format(source))
+        if not os.path.exists(target) or os.path.getsize(target) < state['offset']:
+            raise ValueError("El archivo {} está incompleto, no se puede retomar".format(target))
+        os.truncate(target, state['offset'])
+        in_flight = sum(end - start for start, end in state['in_flight'])
+        log.info("Retomando {} desde la fila {} ({} direcciones en curso se vuelven a consultar)".format(
+            target, state['rows'], in_flight
+        ))
+        return state
 
-    def _df_to_addresses(self, df_chunk):
-        df = df_chunk.filter(items=list(SOURCE_TEMPLATE.keys())).astype('str', errors='ignore')
-        df = df.reindex(columns=list(SOURCE_TEMPLATE.keys()))
-        df.replace(np.nan, None, inplace=True)
+    def _prepare(self, source, target, resume, shard=None):
+        """
+            Busca el checkpoint de target y, si se retoma una ejecución, el estado guardado en él.
+        :return: El checkpoint y el estado desde el que se empieza.
+        """
+        checkpoint = Checkpoint.for_target(target)
+        state = {'rows': 0, 'offset': 0, 'normalized': 0, 'errors': 0}
+        if resume and checkpoint.exists():
+            state = self._resume_state(source, target, checkpoint, shard)
+        elif resume:
+            log.warning("No se encontró el checkpoint {}, se procesa el archivo completo".format(checkpoint.filename))
+        return checkpoint, state
 
-        self._df = df
+    def _normalize_file(self, source, target, checkpoint, state, shard=None, total=None,
+                        desc="Direcciones procesadas: ", position=None, fmt=formats.CSV, geometry=False):
+        """ Normaliza el archivo source (o el rango shard de un csv) a target, desde el estado indicado. """
+        self._normalized_count = state['normalized']
+        self._errors_count = state['errors']
+        self._queries = OrderedDict()
+        self._queries_count = 0
+        self._rows_count = 0
+        self._local_count = 0
+        self._in_flight = {}
+        self._stages = {}
+        RETRY_POLICY.reset()
+        if georequests.CIRCUIT_BREAKER is not None:
+            georequests.CIRCUIT_BREAKER.reset()
+        schema = None
+        if fmt != formats.CSV:
+            schema = formats.table_schema(
+                AddressBatch.FIELDS + RESPONSE_FLATTENER.columns,
+                [str] * len(AddressBatch.FIELDS) + RESPONSE_FLATTENER.kinds
+            )
+        with tqdma.tqdm(total=total, initial=state['rows'], desc=desc, position=position) as bar, \
+                formats.open_writer(
+                    target, fmt, state['offset'], schema, ('ubicacion_lon', 'ubicacion_lat') if geometry else None
+                ) as writer:
+            self._pbar = bar
+            self._start_controller(lambda controller: bar.set_postfix(
+                lote=controller.size, concurrencia=controller.concurrency, refresh=False
+            ))
+            try:
+                run_async(self._run_file(source, writer, checkpoint, state, shard))
+            finally:
+                self._stop_controller()
+        self._queries = OrderedDict()
 
-        self._addresses = []
-        for params in self._df.to_dict('records'):
-            self._addresses.append(Address(**params))
+    def _start_controller(self, on_change=None):
+        """ Si el control adaptativo está activo, crea el BatchController de una ejecución y lo conecta a METRICS. """
+        if not self._adaptive:
+            return
+        self._controller = BatchController(
+            self._data_size, self._concurrency, target_latency=self._target_latency, endpoint=self._enpoint
+        )
+        self._controller.on_change = on_change
+        if on_change:
+            on_change(self._controller)
+        georequests.METRICS.add_hook(self._controller.observe)
+
+    def _stop_controller(self):
+        self._batching = []
+        if self._controller is not None:
+            georequests.METRICS.remove_hook(self._controller.observe)
+            self._batching = [self._controller.snapshot()]
+            self._controller = None
+
+    def _summary(self):
+        circuit_breaker = georequests.CIRCUIT_BREAKER
+        return {
+            'normalized': self._normalized_count,
+            'errors': self._errors_count,
+            'queries': self._queries_count,
+            'rows': self._rows_count,
+            'local': self._local_count,
+            'batching': self._batching,
+            'stages': self._stages,
+            'retries': RETRY_POLICY.retries,
+            'circuit_breaker': circuit_breaker.snapshot() if circuit_breaker is not None else None,
+            'context': self._context_resolver.snapshot() if self._context_resolver is not None else None,
+        }
 
-    def _run_csv_chunk(self, chunk):
-        self._df_to_addresses(chunk)
-        asyncio.run(self._run_normalization())
+    def _log_summary(self, retries):
+        log.info("Direcciones normalizadas: {}".format(self._normalized_count))
+        log.info("Errores: {}".format(self._errors_count))
+        if self._street_index is not None:
+            log.info("Direcciones resueltas con el índice de calles: {}".format(self._local_count))
+        log.info("Consultas enviadas: {} (direcciones repetidas: {:.1%})".format(
+            self._queries_count, self.dedup_ratio
+        ))
+        log.info("Reintentos: {}".format(retries))
+        if self._context_resolver is not None:
+            context = self._context_resolver.snapshot()
+            log.info("Unidades territoriales resueltas a IDs: {} de {} valores distintos ({} peticiones)".format(
+                context['resolved'], context['values'], context['requests']
+            ))
+        circuit_breaker = self._summary()['circuit_breaker']
+        if circuit_breaker and circuit_breaker['opened']:
+            durations = circuit_breaker['durations']
+            log.info("Peticiones pausadas por fallas de la API: {} veces, {:.1f}s en pausa y {:.1f}s en prueba".format(
+                circuit_breaker['opened'], durations['open'], durations['half_open']
+            ))
+        for index, batching in enumerate(self._batching):
+            prefix = "Parte {}: ".format(index + 1) if len(self._batching) > 1 else ""
+            log.info("{}Lote final: {} direcciones (medio {:.0f}, entre {} y {}); concurrencia final: {}".format(
+                prefix, batching['size'], batching['mean_size'] or 0, batching['min_size'], batching['max_size'],
+                batching['concurrency']
+            ))
+            log.info("{}Ajustes del lote: {} aumentos y {} disminuciones".format(
+                prefix, batching['increases'], batching['decreases']
+            ))
+        latency = METRICS.snapshot()['total']['latency']
+        if latency['count']:
+            log.info("Latencia p50/p95/p99: {:.3f}s / {:.3f}s / {:.3f}s".format(
+                latency['p50'], latency['p95'], latency['p99']
+            ))
+
+    def _normalize_sharded(self, source, target, resume, workers, fmt, geometry):
+        """
+            Divide el csv en rangos de bytes (ver csv_shards) y normaliza cada uno en un proceso, con su propio
+        pipeline, una fracción del presupuesto de peticiones y de la concurrencia, y una salida parcial con su
+        checkpoint. Al terminar todas, une las salidas en orden. Las direcciones repetidas se agrupan solo dentro
+        de cada rango.
+        """
+        shards = csv_shards(source, workers)
+        parts = ['{}.part{}'.format(target, index) for index in range(len(shards))]
+        kwargs = {
+            'url': self._url, 'endpoint': self._enpoint, 'chunk_size': self._chunk_size,
+            'data_size': self._data_size, 'rps': self._max_rps, 'concurrency': max(self._concurrency // len(shards), 1),
+            'dedup': self._dedup, 'dedup_size': self._dedup_size, 'queue_size': self._queue_size,
+            'rate_limits': self.rate_limits,
+            'share': 1 / len(shards), 'canonical': self._canonical, 'min_score': self._min_score,
+            'adaptive': self._adaptive, 'target_latency': self._target_latency,
+            'resolve_context': self._context_resolver is not None,
+            'street_index': getattr(self._street_index, 'filename', None) or self._street_index
+        }
+        log.info("Procesos: {}".format(len(shards)))
+        if georequests.CIRCUIT_BREAKER is not None:
+            georequests.CIRCUIT_BREAKER.reset()
 
-    def csv2csv(self, source, target):
-        self._total_addresses = AddressNormalizer.row_count(source) - 1
+        summaries = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [
+                executor.submit(
+                    _normalize_shard, kwargs, georequests.TOKEN, source, part, shard, index, resume, fmt, geometry
+                )
+                for index, (part, shard) in enumerate(zip(parts, shards))
+            ]
+            for future in futures:
+                summary, endpoints = future.result()
+                summaries.append(summary)
+                METRICS.merge(endpoints)
+                if georequests.CIRCUIT_BREAKER is not None and summary['circuit_breaker']:
+                    georequests.CIRCUIT_BREAKER.merge(summary['circuit_breaker'])
+                if self._context_resolver is not None and summary['context']:
+                    self._context_resolver.merge(summary['context'])
+
+        formats.merge_parts(target, parts, fmt)
+        for part in parts:
+            os.remove(part)
+            Checkpoint.for_target(part).remove()
+
+        self._normalized_count = sum(summary['normalized'] for summary in summaries)
+        self._errors_count = sum(summary['errors'] for summary in summaries)
+        self._queries_count = sum(summary['queries'] for summary in summaries)
+        self._rows_count = sum(summary['rows'] for summary in summaries)
+        self._local_count = sum(summary['local'] for summary in summaries)
+        self._batching = [batching for summary in summaries for batching in summary['batching']]
+        self._stages = {}
+        for summary in summaries:
+            for stage, seconds in summary['stages'].items():
+                self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+        return sum(summary['retries'] for summary in summaries)
+
+    def normalize_file(self, source, target, resume=False, workers=1, geometry=False):
+        """
+            Normaliza las direcciones de un archivo y escribe los resultados en otro. El formato de cada uno se elige
+        por la extensión: .parquet, .arrow/.feather (Arrow IPC) o csv para cualquier otra (ver formats). La
+        entrada se lee por partes y, en Parquet y Arrow, solo las columnas de SOURCE_TEMPLATE. La salida en Parquet
+        y Arrow conserva los tipos de las columnas (enteros, números de punto flotante y texto). Mientras dura la
+        ejecución se mantiene un checkpoint junto a una salida csv (ver Checkpoint), que se borra al terminar.
+
+        :param source: archivo de entrada.
+        :param target: archivo de salida.
+        :param resume: si existe el checkpoint de una ejecución interrumpida, continúa desde la última fila escrita
+        en lugar de empezar de cero. Solo con salida csv.
+        :param workers: cantidad de procesos entre los que se reparte una entrada csv (ver _normalize_sharded).
+        Para retomar una ejecución se debe indicar la misma cantidad.
+        :param geometry: agrega a una salida Parquet la columna geometry con el punto de ubicacion, en WKB y con
+        los metadatos de GeoParquet.
+        """
+        fmt = formats.file_format(target)
+        if resume and fmt != formats.CSV:
+            raise ValueError("Solo se puede retomar la normalización con salida csv")
+        if geometry and fmt != formats.PARQUET:
+            raise ValueError("La columna geometry solo se puede escribir en Parquet")
+        if workers > 1 and formats.file_format(source) != formats.CSV:
+            raise ValueError("Solo una entrada csv se puede repartir entre varios procesos")
+
+        self._total_addresses = formats.count_rows(source)
         log.info("Direcciones a procesar: {}".format(self._total_addresses))
         log.info("Peticiones por segundo: {}".format(self.rps))
         log.info("Tiempo estimado: {}s".format(self._total_addresses // self.rps))
-        self._normalized_count = 0
-        self._errors_count = 0
-        with tqdma.tqdm(total=self._total_addresses, desc="Direcciones procesadas: ") as bar:
-            self._pbar = bar
-            self._pbar.total = self._total_addresses
-            with pd.read_csv(
-                    source, keep_default_na=False, chunksize=self._chunk_size, iterator=True
-            ) as reader:
-                chunk = next(reader)
-                self._run_csv_chunk(chunk)
-                df = self._addresses_to_df()
-                df.to_csv(target, index=False, header=True)
-                for chunk in reader:
-                    self._run_csv_chunk(chunk)
-                    df = self._addresses_to_df()
-                    df.to_csv(target, mode='a', index=False, header=False)
-        log.info("Direcciones normalizadas: {}".format(self._normalized_count))
-        log.info("Errores: {}".format(self._errors_count))
+        start = time.monotonic()
+        if workers > 1:
+            retries = self._normalize_sharded(source, target, resume, workers, fmt, geometry)
+        else:
+            checkpoint, state = self._prepare(source, target, resume)
+            self._normalize_file(
+                source, target, checkpoint, state, total=self._total_addresses, fmt=fmt, geometry=geometry
+            )
+            checkpoint.remove()
+            retries = RETRY_POLICY.retries
+        self._elapsed = time.monotonic() - start
+        self._retries = retries
+        self._log_summary(retries)
+
+    def csv2csv(self, source, target, resume=False, workers=1):
+        """ Normaliza las direcciones de un csv y escribe los resultados en otro (ver normalize_file). """
+        self.normalize_file(source, target, resume, workers)
+
+    async def _normalize_addresses(self, session, addresses: List[Address]) -> List[Address]:
+        """ Normaliza un micro lote de normalize_iter(), con el índice de calles si lo hay y el resto por POST. """
+        batch = AddressBatch.from_addresses(addresses, self._canonical)
+        if self._context_resolver is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._resolve_context, batch)
+        if self._street_index is not None:
+            self._resolve_locally(batch)
+        await self._run_normalization(session, batch, np.flatnonzero(batch.status == AddressBatch.PENDING))
+        batch.update_addresses(addresses)
+        return addresses
+
+    @staticmethod
+    async def _iterate(addresses):
+        """
+            Recorre un iterable asincrónico o sincrónico. Los iterables sincrónicos que no son secuencias (por
+        ejemplo, un cursor de base de datos) se avanzan en otro hilo, para no bloquear el event loop.
+        """
+        if hasattr(addresses, '__aiter__'):
+            async for address in addresses:
+                yield address
+        elif isinstance(addresses, Sequence):
+            for address in addresses:
+                yield address
+        else:
+            loop = asyncio.get_running_loop()
+            iterator = iter(addresses)
+            end = object()
+            while (address := await loop.run_in_executor(None, next, iterator, end)) is not end:
+                yield address
+
+    async def _micro_batches(self, addresses, size, max_wait):
+        """
+            Agrupa las direcciones en micro lotes de a lo sumo size, que se entregan al completarse o cuando pasaron
+        max_wait segundos desde la primera dirección del lote, aunque el origen no haya entregado más.
+        """
+        loop = asyncio.get_running_loop()
+        items = self._iterate(addresses)
+        buffer, deadline = [], None
+        next_item = asyncio.ensure_future(items.__anext__())
+        try:
+            while True:
+                timeout = max(deadline - loop.time(), 0) if buffer else None
+                done, _ = await asyncio.wait({next_item}, timeout=timeout)
+                if not done:
+                    yield buffer
+                    buffer = []
+                    continue
+                try:
+                    address = next_item.result()
+                except StopAsyncIteration:
+                    break
+                if not buffer:
+                    deadline = loop.time() + max_wait
+                buffer.append(address)
+                if len(buffer) >= size:
+                    yield buffer
+                    buffer = []
+                next_item = asyncio.ensure_future(items.__anext__())
+            if buffer:
+                yield buffer
+        finally:
+            next_item.cancel()
+            await items.aclose()
+
+    async def normalize_iter(self, addresses, batch_size=None, max_wait=0.1, ordered=True):
+        """
+            Normaliza un flujo de direcciones y entrega los resultados a medida que se completan, sin archivos
+        intermedios. Las direcciones se agrupan en micro lotes por tamaño y por tiempo que se envían en POST por
+        lotes (con el índice de calles y el control adaptativo, si están configurados). A lo sumo queue_size micro
+        lotes están en curso a la vez, por lo que la memoria usada no depende del largo del flujo.
+
+        Uso:
+            async for index, address in normalizer.normalize_iter(consumer):
+                print(index, address.nomenclature)
+
+        :param addresses: iterable sincrónico o asincrónico de objetos Address, diccionarios con las claves de
+        SOURCE_TEMPLATE o textos.
+        :param batch_size: cantidad máxima de direcciones por micro lote; por defecto, data_size.
+        :param max_wait: segundos máximos que una dirección espera a que se complete su micro lote.
+        :param ordered: entrega los resultados en el orden de entrada; si es False, a medida que termina cada
+        micro lote.
+        :return: Un generador asincrónico de tuplas (posición en el flujo, objeto Address normalizado).
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: self.rate_limiter)
+        session = POOL.async_session()
+        slots = asyncio.Semaphore(self._queue_size)
+        results = asyncio.Queue()
+        tasks = set()
+
+        async def produce():
+            start = 0
+            try:
+                async for items in self._micro_batches(addresses, batch_size or self._data_size, max_wait):
+                    items = [
+                        item if isinstance(item, Address) else Address(**item) if isinstance(item, dict) else
+                        Address(item) for item in items
+                    ]
+                    await slots.acquire()
+                    task = asyncio.ensure_future(self._normalize_addresses(session, items))
+                    task.start = start
+                    start += len(items)
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    if ordered:
+                        results.put_nowait(task)
+                    else:
+                        task.add_done_callback(results.put_nowait)
+                await asyncio.gather(*tasks)
+            finally:
+                results.put_nowait(None)
+
+        self._start_controller()
+        producer = asyncio.ensure_future(produce())
+        try:
+            while (task := await results.get()) is not None:
+                items = await task
+                slots.release()
+                for index, address in enumerate(items, task.start):
+                    yield index, address
+            await producer
+        finally:
+            producer.cancel()
+            for task in list(tasks):
+                task.cancel()
+            self._stop_controller()
 
     def normalize(self, address: Address):
         async def func(a):
-            async with aiohttp.ClientSession() as session:
-                await self.normalize_address(session, a)
+            await self.normalize_address(POOL.async_session(), a)
 
-        asyncio.run(func(address))
+        run_async(func(address))
 
         return address
@@ -0,0 +1,521 @@
+"""
+    Servidor local que imita la API de georef-ar para medir el rendimiento sin conexión ni consumo de cuota.
+
+Implementa los endpoints de las entidades (GET y POST por lotes), direcciones (GET y POST por lotes) y ubicacion, y
+responde con los encabezados x-ratelimit-*. Los registros se leen de archivos de respuesta (por ejemplo
+tests/response_api/*.json) o se generan de forma sintética y determinista con el tamaño indicado. Permite agregar
+latencia, errores aleatorios y limitar las peticiones por período.
+
+    geoarpy serve --port 8080 --size 20000 --latency 0.05 --error_rate 0.01
+    geoarpy batch-normalize direcciones.csv salida.csv --url http://127.0.0.1:8080/
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter
+
+from aiohttp import web
+
+from georef_ar_py import codec
+from georef_ar_py.constants import ENTITIES, PROVINCES_DICT
+from georef_ar_py.utils import flatten_dict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {'second': 200, 'minute': 6000, 'hour': 154000, 'day': 1500000}
+PERIODS = {'second': 1, 'minute': 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+MAX_RESULTS = 5000
+MAX_BULK = 1000
+
+STREET_NAMES = [
+    'SAN MARTIN', 'BELGRANO', 'RIVADAVIA', 'SARMIENTO', 'MITRE', 'MORENO', 'ALBERDI', 'URQUIZA', 'ROCA',
+    'LAVALLE', 'PELLEGRINI', 'ESPAÑA', 'ITALIA', 'COLON', 'INDEPENDENCIA', '25 DE MAYO', '9 DE JULIO',
+    'LAS HERAS', 'GUEMES', 'BROWN', 'ALSINA', 'CORRIENTES', 'SANTA FE', 'ENTRE RIOS', 'TUCUMAN'
+]
+STREET_CATEGORIES = ['CALLE', 'AV', 'PJE', 'BV']
+
+_ADDRESS = re.compile(r'^\s*(?P<calle>.*?\D)\s*(?P<altura>\d+)\b')
+
+
+def _normalize_text(text):
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def _stable_hash(text):
+    return zlib.crc32(str(text).encode('utf-8'))
+
+
+def _error(status, message):
+    return web.Response(
+        body=codec.dumps({'errores': [{'codigo_interno': None, 'mensaje': message}]}),
+        status=status, content_type='application/json'
+    )
+
+
+class GeorefStandIn:
+    """
+        Reemplazo local de la API de georef-ar.
+
+    Los registros de cada entidad se toman de fixtures/<entidad>.json si el archivo existe; el resto se genera de
+    forma sintética con size registros por entidad (sizes permite indicar un tamaño distinto por entidad). Las
+    provincias sintéticas son siempre las 24 de constants.PROVINCES_DICT.
+    """
+
+    def __init__(self, fixtures=None, size=1000, sizes=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_statuses=(500, 502, 503), limits=None, seed=0, prefix='/') -> None:
+        """
+        :param fixtures: directorio con archivos de respuesta por entidad.
+        :param size: cantidad de registros sintéticos por entidad.
+        :param sizes: diccionario opcional con la cantidad de registros sintéticos de cada entidad.
+        :param latency: demora media en segundos agregada a cada respuesta.
+        :param jitter: variación máxima en segundos de la demora.
+        :param error_rate: proporción de peticiones que responden con un error del servidor.
+        :param error_statuses: códigos de estado de los errores inyectados.
+        :param limits: peticiones permitidas por período ('second', 'minute', 'hour', 'day'). Con un diccionario
+        vacío no se limitan las peticiones.
+        :param seed: semilla de los datos sintéticos y de los errores inyectados.
+        :param prefix: prefijo de las rutas (por ejemplo '/georef/api/').
+        """
+        super().__init__()
+        self.fixtures = fixtures
+        self.size = size
+        self.sizes = sizes or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.seed = seed
+        self.prefix = '/' + prefix.strip('/') + '/' if prefix.strip('/') else '/'
+        self.stats = {'requests': Counter(), 'statuses': Counter(), 'queries': Counter()}
+        self._random = random.Random(seed)
+        self._records = {}
+        self._by_province = {}
+        self._windows = {}
+        self._runner = None
+        self._thread_loop = None
+
+    # Datos
+
+    @staticmethod
+    def entity_key(entity):
+        return entity.replace('-', '_')
+
+    def records(self, entity):
+        """
+            Devuelve los registros de una entidad, ordenados por id.
+        """
+        if entity not in self._records:
+            records = self._load_fixture(entity)
+            if records is None:
+                records = self._generate(entity)
+            records.sort(key=lambda record: record['id'])
+            self._records[entity] = records
+            by_province = {}
+            for record in records:
+                province_id = record['id'] if entity == 'provincias' else record['provincia']['id']
+                by_province.setdefault(province_id, []).append(record)
+            self._by_province[entity] = by_province
+        return self._records[entity]
+
+    def by_province(self, entity, province_id):
+        """ Devuelve los registros de una entidad que pertenecen a una provincia. """
+        self.records(entity)
+        return self._by_province[entity].get(province_id, [])
+
+    def _load_fixture(self, entity):
+        if not self.fixtures:
+            return None
+        filename = os.path.join(self.fixtures, '{}.json'.format(entity))
+        if not os.path.isfile(filename):
+            return None
+        with open(filename, 'rb') as f:
+            records = codec.loads(f.read()).get(self.entity_key(entity))
+        log.debug(f"Registros de {entity} leídos de {filename}")
+        return list(records) if records is not None else None
+
+    def _rng(self, entity):
+        return random.Random('{}:{}'.format(self.seed, entity))
+
+    def _entity_size(self, entity):
+        return self.sizes.get(entity, self.size)
+
+    def _generate(self, entity):
+        rng = self._rng(entity)
+        if entity == 'provincias':
+            return [
+                {
+                    'centroide': {'lat': round(rng.uniform(-54, -22), 7), 'lon': round(rng.uniform(-72, -54), 7)},
+                    'id': province_id, 'nombre': name
+                } for province_id, name in PROVINCES_DICT.items()
+            ]
+
+        provinces = self.records('provincias')
+        if entity == 'departamentos':
+            records = []
+            for i in range(self._entity_size(entity)):
+                province = provinces[i % len(provinces)]
+                records.append({
+                    'centroide': self._near(rng, province['centroide'], 2),
+                    'id': '{}{:03d}'.format(province['id'], i // len(provinces) % 1000),
+                    'nombre': 'Departamento {}'.format(i // len(provinces) + 1),
+                    'provincia': self._ref(province)
+                })
+            return records
+
+        departments = self.records('departamentos')
+        records = []
+        for i in range(self._entity_size(entity)):
+            department = departments[i % len(departments)]
+            number = i // len(departments)
+            province = department['provincia']
+            if entity == 'municipios':
+                records.append({
+                    'centroide': self._near(rng, department['centroide'], 0.5),
+                    'id': '{}{:04d}'.format(province['id'], i % 10000),
+                    'nombre': 'Municipio {}'.format(i + 1),
+                    'provincia': province
+                })
+                continue
+
+            census_locality = {
+                'id': '{}{:03d}'.format(department['id'], number % 1000),
+                'nombre': 'Localidad {} {}'.format(department['nombre'], number % 1000 + 1)
+            }
+            if entity == 'localidades-censales':
+                records.append({
+                    'categoria': 'Localidad simple',
+                    'centroide': self._near(rng, department['centroide'], 0.5),
+                    'departamento': self._ref(department),
+                    'funcion': None,
+                    'id': census_locality['id'],
+                    'municipio': {'id': None, 'nombre': None},
+                    'nombre': census_locality['nombre'],
+                    'provincia': province
+                })
+            elif entity in ['asentamientos', 'localidades']:
+                records.append({
+                    'categoria': 'Entidad',
+                    'centroide': self._near(rng, department['centroide'], 0.5),
+                    'departamento': self._ref(department),
+                    'id': '{}{:06d}'.format(department['id'], number),
+                    'localidad_censal': census_locality,
+                    'municipio': {'id': None, 'nombre': None},
+                    'nombre': 'Asentamiento {}'.format(i + 1),
+                    'provincia': province
+                })
+            elif entity == 'calles':
+                name = '{} {}'.format(STREET_NAMES[number % len(STREET_NAMES)], number // len(STREET_NAMES) or '')
+                end = rng.randrange(100, 5000, 100)
+                records.append({
+                    'altura': {
+                        'fin': {'derecha': end, 'izquierda': end - 1},
+                        'inicio': {'derecha': 0, 'izquierda': 1}
+                    },
+                    'categoria': STREET_CATEGORIES[number % len(STREET_CATEGORIES)],
+                    'departamento': self._ref(department),
+                    'id': '{}{:08d}'.format(department['id'], number),
+                    'localidad_censal': census_locality,
+                    'nombre': name.strip(),
+                    'nomenclatura': '{}, {}, {}'.format(name.strip(), department['nombre'], province['nombre']),
+                    'provincia': province
+                })
+            else:
+                raise ValueError(f"La entidad {entity} no se encuentra implementada")
+        return records
+
+    @staticmethod
+    def _ref(record):
+        return {'id': record['id'], 'nombre': record['nombre']}
+
+    @staticmethod
+    def _near(rng, point, spread):
+        return {
+            'lat': round(point['lat'] + rng.uniform(-spread, spread), 7),
+            'lon': round(point['lon'] + rng.uniform(-spread, spread), 7)
+        }
+
+    # Consultas
+
+    def _find(self, entity, value):
+        """ Busca un registro de la entidad por id o por nombre. """
+        if value is None:
+            return None
+        value = str(value)
+        records = self.records(entity)
+        for record in records:
+            if record['id'] == value:
+                return record
+        name = _normalize_text(value)
+        for record in records:
+            if _normalize_text(record['nombre']) == name:
+                return record
+        return None
+
+    @staticmethod
+    def _match_name(name, query):
+        tokens = _normalize_text(name).split()
+        return all(any(token.startswith(q) for token in tokens) for q in _normalize_text(query).split())
+
+    @staticmethod
+    def _match_ref(record, field, value):
+        ref = record.get(field) or {}
+        values = str(value).split(',')
+        return ref.get('id') in values or _normalize_text(ref.get('nombre') or '') == _normalize_text(value)
+
+    def query_entity(self, entity, params):
+        """
+            Resuelve una consulta sobre una entidad.
+        :param entity: nombre de una de las capas.
+        :param params: diccionario con los parámetros de la consulta.
+        :return: El diccionario de la respuesta.
+        """
+        max_results = int(params.get('max', 10))
+        start = int(params.get('inicio', 0))
+        if max_results > MAX_RESULTS or max_results < 0 or start < 0:
+            raise ValueError(f"El parámetro max debe estar entre 0 y {MAX_RESULTS}")
+
+        records = self.records(entity)
+        if 'provincia' in params and entity != 'provincias':
+            province = self._find('provincias', params['provincia'])
+            records = self.by_province(entity, province['id']) if province else []
+
+        if 'id' in params:
+            ids = str(params['id']).split(',')
+            records = [record for record in records if record['id'] in ids]
+        if 'nombre' in params:
+            records = [record for record in records if self._match_name(record['nombre'], params['nombre'])]
+        for field in ['departamento', 'municipio', 'localidad_censal']:
+            if field in params:
+                records = [record for record in records if self._match_ref(record, field, params[field])]
+
+        if params.get('orden') == 'nombre':
+            records = sorted(records, key=lambda record: record['nombre'])
+
+        page = records[start:start + max_results]
+        return {
+            'cantidad': len(page),
+            'inicio': start,
+            'parametros': params,
+            'total': len(records),
+            self.entity_key(entity): page
+        }
+
+    def normalize_address(self, params):
+        """
+            Normaliza una dirección de forma sintética: la calle y la altura se toman del texto y las unidades
+        territoriales, de los parámetros o, si no se indican, de un hash estable de la dirección. Las direcciones sin
+        altura no se normalizan.
+        """
+        address = str(params.get('direccion') or '')
+        match = _ADDRESS.match(address)
+        results = []
+        if match:
+            street = ' '.join(match.group('calle').upper().split())
+            number = int(match.group('altura'))
+            province = self._find('provincias', params.get('provincia'))
+            if province is None:
+                provinces = self.records('provincias')
+                province = provinces[_stable_hash(address) % len(provinces)]
+            departments = self.by_province('departamentos', province['id'])
+            department = self._find('departamentos', params.get('departamento'))
+            if department is None and departments:
+                department = departments[_stable_hash(street) % len(departments)]
+            department = department or {'id': None, 'nombre': None, 'centroide': province['centroide']}
+            street_id = '{}{:08d}'.format(department['id'] or province['id'], _stable_hash(street) % 10 ** 8)
+            rng = random.Random(_stable_hash('{}:{}'.format(street_id, number)))
+            results.append({
+                'altura': {'unidad': None, 'valor': number},
+                'calle': {'categoria': 'CALLE', 'id': street_id, 'nombre': street},
+                'calle_cruce_1': {'categoria': None, 'id': None, 'nombre': None},
+                'calle_cruce_2': {'categoria': None, 'id': None, 'nombre': None},
+                'departamento': self._ref(department),
+                'localidad_censal': {
+                    'id': '{}010'.format(department['id']) if department['id'] else None,
+                    'nombre': params.get('localidad_censal') or department['nombre']
+                },
+                'nomenclatura': '{} {}, {}, {}'.format(street, number, department['nombre'], province['nombre']),
+                'piso': None,
+                'provincia': self._ref(province),
+                'ubicacion': self._near(rng, department['centroide'], 0.05)
+            })
+        max_results = int(params.get('max', 10))
+        return {
+            'cantidad': len(results[:max_results]),
+            'direcciones': results[:max_results],
+            'inicio': 0,
+            'parametros': params,
+            'total': len(results)
+        }
+
+    def locate(self, params):
+        """
+            Devuelve la provincia y el departamento más cercanos a un punto.
+        """
+        lat, lon = float(params['lat']), float(params['lon'])
+
+        def nearest(records):
+            return min(records, key=lambda r: math.hypot(r['centroide']['lat'] - lat, r['centroide']['lon'] - lon))
+
+        province = nearest(self.records('provincias'))
+        departments = self.by_province('departamentos', province['id'])
+        department = nearest(departments) if departments else {'id': None, 'nombre': None}
+        location = {
+            'departamento': self._ref(department),
+            'lat': lat,
+            'lon': lon,
+            'municipio': {'id': None, 'nombre': None},
+            'provincia': self._ref(province)
+        }
+        if str(params.get('aplanar', '')).lower() in ['true', '1']:
+            location = flatten_dict(location)
+        return {'parametros': params, 'ubicacion': location}
+
+    # Control de peticiones
+
+    def _consume(self, now):
+        """
+            Descuenta una petición de cada período y devuelve los encabezados x-ratelimit-* junto con los segundos
+        a esperar si se agotó alguno de los límites.
+        """
+        headers = {}
+        retry_after = None
+        for period, limit in self.limits.items():
+            length = PERIODS[period]
+            start, count = self._windows.get(period, (now, 0))
+            if now - start >= length:
+                start, count = now, 0
+            if count < limit:
+                count += 1
+            else:
+                wait = start + length - now
+                retry_after = wait if retry_after is None else max(retry_after, wait)
+            self._windows[period] = (start, count)
+            headers['x-ratelimit-limit-{}'.format(period)] = str(limit)
+            headers['x-ratelimit-remaining-{}'.format(period)] = str(limit - count)
+        return headers, retry_after
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        endpoint = request.match_info.get('endpoint', request.path)
+        self.stats['requests'][endpoint] += 1
+
+        headers, retry_after = self._consume(time.monotonic())
+        delay = max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if retry_after is not None:
+            response = _error(429, 'Se superó el límite de peticiones')
+            response.headers['Retry-After'] = str(max(math.ceil(retry_after), 1))
+        elif self.error_rate and self._random.random() < self.error_rate:
+            response = _error(self._random.choice(self.error_statuses), 'Error inyectado')
+        else:
+            try:
+                response = await handler(request)
+            except web.HTTPException:
+                raise
+            except (ValueError, KeyError, TypeError) as e:
+                response = _error(400, str(e))
+
+        response.headers.update(headers)
+        self.stats['statuses'][response.status] += 1
+        return response
+
+    # Rutas
+
+    @staticmethod
+    def _json_response(data):
+        response = web.Response(body=codec.dumps(data), content_type='application/json')
+        response.enable_compression()
+        return response
+
+    async def _read_bulk(self, request, key):
+        data = codec.loads(await request.read())
+        queries = data[key]
+        if not isinstance(queries, list) or len(queries) > MAX_BULK:
+            raise ValueError(f"El cuerpo debe contener una lista de a lo sumo {MAX_BULK} consultas")
+        self.stats['queries'][request.match_info['endpoint']] += len(queries)
+        return queries
+
+    def _resolver(self, endpoint):
+        if endpoint == 'direcciones':
+            return 'direcciones', self.normalize_address
+        if endpoint == 'ubicacion':
+            return 'ubicaciones', self.locate
+        if endpoint in ENTITIES:
+            return self.entity_key(endpoint), lambda params: self.query_entity(endpoint, params)
+        raise web.HTTPNotFound()
+
+    async def _get(self, request):
+        _, resolve = self._resolver(request.match_info['endpoint'])
+        self.stats['queries'][request.match_info['endpoint']] += 1
+        return self._json_response(resolve(dict(request.query)))
+
+    async def _post(self, request):
+        key, resolve = self._resolver(request.match_info['endpoint'])
+        queries = await self._read_bulk(request, key)
+        return self._json_response({'resultados': [resolve(params) for params in queries]})
+
+    def make_app(self):
+        app = web.Application(middlewares=[self._middleware], client_max_size=64 * 1024 * 1024)
+        app.router.add_get(self.prefix + '{endpoint}', self._get)
+        app.router.add_post(self.prefix + '{endpoint}', self._post)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        """
+            Inicia el servidor en el event loop en ejecución.
+        :return: La URL base del servidor, para usar como url de la API.
+        """
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return 'http://{}:{}{}'.format(host, port, self.prefix)
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self, host='127.0.0.1', port=0):
+        """
+            Inicia el servidor en un event loop propio, en otro hilo, para consultarlo desde código sincrónico o
+        desde otro event loop (por ejemplo, AddressNormalizer.csv2csv).
+        :return: La URL base del servidor.
+        """
+        loop = self._thread_loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name='georef-stand-in', daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(self.start(host, port), loop).result()
+
+    def stop_thread(self):
+        """ Detiene el servidor iniciado con start_in_thread(). """
+        loop, self._thread_loop = self._thread_loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def serve(host='127.0.0.1', port=8080, **kwargs):
+    """
+        Ejecuta el servidor hasta que se interrumpe el proceso.
+    :param kwargs: parámetros de GeorefStandIn.
+    """
+    stand_in = GeorefStandIn(**kwargs)
+    log.info(f"Sirviendo la API de prueba en http://{host}:{port}{stand_in.prefix}")
+    try:
+        access_log = logging.getLogger('aiohttp.access') if log.isEnabledFor(logging.DEBUG) else None
+        web.run_app(stand_in.make_app(), host=host, port=port, print=None, access_log=access_log)
+    finally:
+        log.info(f"Peticiones atendidas: {dict(stand_in.stats['requests'])}")
+        log.info(f"Códigos de estado: {dict(stand_in.stats['statuses'])}")
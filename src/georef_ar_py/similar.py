@@ -1,6 +1,24 @@
+import logging
+import re
+import threading
 import urllib
+
 from georef_ar_py.georequests import API_BASE_URL, get_json, get_json_post
 
+log = logging.getLogger(__name__)
+
+MAX_BULK = 1000
+
+# Campos de las direcciones que se pueden resolver a IDs y la capa en la que se buscan, en el orden en que se
+# resuelven: cada uno se busca dentro de los anteriores.
+CONTEXT_ENDPOINTS = {
+    'provincia': 'provincias',
+    'departamento': 'departamentos',
+    'localidad_censal': 'localidades-censales',
+}
+
+_ID = re.compile(r'^\d+$')
+
 
 def get_similar(url, endpoint, nombre, **kwargs):
     url = url or API_BASE_URL
@@ -9,20 +27,103 @@ def get_similar(url, endpoint, nombre, **kwargs):
     return get_json(url, endpoint, **kwargs)[endpoint]
 
 
-def get_similar_bulk(url, endpoint, nombres):
-    """Normaliza una lista de nombres de alguna de las entidades geográficas."""
+def get_similar_bulk(url, endpoint, nombres, filters=None):
+    """Normaliza una lista de nombres de alguna de las entidades geográficas.
+
+    :param filters: lista opcional con un diccionario de parámetros adicionales por nombre, por ejemplo
+    {'provincia': '14'} para buscar un departamento dentro de una provincia.
+    """
 
     url = url or API_BASE_URL
+    key = endpoint.replace('-', '_')
     data = {
-        endpoint: [
-            {"nombre": nombre, "max": 1} for nombre in nombres
+        key: [
+            dict({"nombre": nombre, "max": 1}, **(filters[i] if filters else {})) for i, nombre in enumerate(nombres)
         ]}
     results = get_json_post(url, endpoint, data)
 
     # convierte a una lista de "resultado más probable" o "vacío" cuando no hay
     parsed_results = [
-        single_result[endpoint][0] if single_result[endpoint] else {}
+        single_result[key][0] if single_result[key] else {}
         for single_result in results["resultados"]
     ]
 
     return parsed_results
+
+
+class ContextResolver:
+    """
+        Resuelve a IDs los nombres de provincia, departamento y localidad censal de las direcciones con
+    get_similar_bulk, una sola vez por valor distinto: los resultados se guardan para toda la ejecución. Cada
+    departamento se busca dentro de la provincia de su fila y cada localidad censal, dentro de su provincia y su
+    departamento, si ya se resolvieron. Los valores que ya son IDs se conservan y los que no se encuentran, o cuya
+    petición falla, se mantienen como texto y no se vuelven a pedir.
+
+    Se puede usar desde varios hilos (por ejemplo, los micro lotes de AddressNormalizer.normalize_iter): las
+    resoluciones se hacen de a una, por lo que un valor pedido por dos lotes a la vez se consulta una sola vez.
+    """
+
+    def __init__(self, url=None) -> None:
+        """
+        :param url: URL de la API.
+        """
+        super().__init__()
+        self.url = url
+        self.ids = {}
+        self.values = 0
+        self.resolved = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """ Valores distintos consultados, resueltos a un ID y peticiones enviadas desde la creación. """
+        with self._lock:
+            return {'values': self.values, 'resolved': self.resolved, 'requests': self.requests}
+
+    def merge(self, snapshot):
+        """ Suma los contadores de un snapshot(), por ejemplo, el de otro proceso. """
+        with self._lock:
+            self.values += snapshot['values']
+            self.resolved += snapshot['resolved']
+            self.requests += snapshot['requests']
+
+    def _fetch(self, endpoint, keys):
+        for start in range(0, len(keys), MAX_BULK):
+            chunk = keys[start:start + MAX_BULK]
+            try:
+                results = get_similar_bulk(
+                    self.url, endpoint, [value for _, value, _ in chunk], [dict(scope) for _, _, scope in chunk]
+                )
+            except Exception as e:
+                # Se recuerdan como no encontrados, para no volver a pedirlos a una API que está fallando.
+                log.warning("No se pudieron resolver {} valores de {} a IDs: {}".format(len(chunk), endpoint, e))
+                results = [{}] * len(chunk)
+            self.requests += 1
+            self.values += len(chunk)
+            for key, result in zip(chunk, results):
+                self.ids[key] = result.get('id')
+                self.resolved += bool(self.ids[key])
+
+    def resolve(self, columns):
+        """
+            Busca los IDs de los valores de cada campo de CONTEXT_ENDPOINTS que no se consultaron antes.
+        :param columns: diccionario con una secuencia de valores (str o None) por cada campo de CONTEXT_ENDPOINTS,
+        todas del mismo largo.
+        :return: Un diccionario con una lista por campo, con el ID de cada valor encontrado en lugar del nombre.
+        """
+        with self._lock:
+            resolved = {}
+            scopes = [()] * len(columns['provincia'])
+            for field, endpoint in CONTEXT_ENDPOINTS.items():
+                keys = [(field, value, scope) for value, scope in zip(columns[field], scopes)]
+                pending = [
+                    key for key in dict.fromkeys(keys) if key[1] and not _ID.match(key[1]) and key not in self.ids
+                ]
+                if pending:
+                    self._fetch(endpoint, pending)
+                resolved[field] = [self.ids.get(key) or key[1] for key in keys]
+                scopes = [
+                    scope + ((field, value),) if value and _ID.match(value) else scope
+                    for scope, value in zip(scopes, resolved[field])
+                ]
+            return resolved
@@ -0,0 +1,346 @@
+"""
+    Índice local de calles para normalizar direcciones sin consultar la API.
+
+El índice se arma con la capa completa de calles (ver StreetIndex.download()) y se guarda en un archivo .npz
+comprimido. Agrupa las calles por localidad censal y por el nombre en forma canónica (ver
+normalization.canonicalize); cada grupo guarda los rangos de alturas de sus tramos ordenados por la altura inicial,
+junto con el máximo acumulado de las alturas finales, para encontrar por bisección el tramo que contiene una altura.
+Los nombres que no coinciden exactamente se buscan por similitud de trigramas entre las calles de las localidades
+indicadas en la consulta.
+"""
+import bisect
+import logging
+import re
+from collections import Counter
+
+import numpy as np
+
+from georef_ar_py.georequests import API_BASE_URL, POOL, run_async
+from georef_ar_py.info import consume_entity
+from georef_ar_py.normalization import canonicalize
+
+log = logging.getLogger(__name__)
+
+STREET_TYPES = ['avenida', 'calle', 'pasaje', 'boulevard', 'diagonal']
+LOCALITY_FIELDS = ['provincia', 'departamento', 'localidad_censal']
+STREET_FIELDS = ['id', 'nombre', 'categoria']
+RANGE_FIELDS = [('inicio', 'derecha'), ('inicio', 'izquierda'), ('fin', 'derecha'), ('fin', 'izquierda')]
+
+_ADDRESS = re.compile(r'^(?P<calle>.+)\s(?P<altura>\d+)$')
+_STREET_TYPE = re.compile(r'^(?:{})\s'.format('|'.join(STREET_TYPES)))
+
+
+def _trigrams(name):
+    padded = '  {} '.format(name)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _point_along(coordinates, fraction):
+    """ El punto (lon, lat) a la fracción indicada del largo de una línea, medido en el plano. """
+    if len(coordinates) == 1:
+        return coordinates[0]
+    lengths = np.hypot(*np.diff(coordinates, axis=0).T)
+    distance = fraction * lengths.sum()
+    cumulative = np.cumsum(lengths)
+    i = min(int(np.searchsorted(cumulative, distance)), len(lengths) - 1)
+    start = cumulative[i] - lengths[i]
+    t = (distance - start) / lengths[i] if lengths[i] else 0.0
+    return coordinates[i] + t * (coordinates[i + 1] - coordinates[i])
+
+
+class _Builder:
+    """ Acumula los registros de la capa de calles en columnas. """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.streets = {field: [] for field in STREET_FIELDS}
+        self.ranges = []
+        self.locality = []
+        self.offsets = [0]
+        self.coordinates = []
+        self.localities = {}
+
+    def add(self, record):
+        for field in STREET_FIELDS:
+            self.streets[field].append(record.get(field) or '')
+        altura = record.get('altura') or {}
+        ranges = []
+        for end, side in RANGE_FIELDS:
+            value = (altura.get(end) or {}).get(side)
+            ranges.append(-1 if value is None else int(value))
+        self.ranges.append(ranges)
+        key = tuple(
+            (record.get(field) or {}).get(attribute) or ''
+            for field in LOCALITY_FIELDS for attribute in ('id', 'nombre')
+        )
+        self.locality.append(self.localities.setdefault(key, len(self.localities)))
+        geometry = record.get('geometria') or {}
+        lines = geometry.get('coordinates') or []
+        if geometry.get('type') == 'LineString':
+            lines = [lines]
+        for line in lines:
+            self.coordinates.extend(point[:2] for point in line)
+        self.offsets.append(len(self.coordinates))
+
+    def arrays(self):
+        arrays = {field: np.array(values, dtype=str) for field, values in self.streets.items()}
+        arrays['clave'] = canonicalize(arrays['nombre']).astype(str)
+        arrays['alturas'] = np.array(self.ranges, dtype=np.int64).reshape(-1, len(RANGE_FIELDS))
+        arrays['localidad'] = np.array(self.locality, dtype=np.int32)
+        arrays['geometria_inicio'] = np.array(self.offsets, dtype=np.int64)
+        arrays['geometria'] = np.array(self.coordinates, dtype=np.float64).reshape(-1, 2)
+        localities = list(self.localities)
+        for i, field in enumerate(LOCALITY_FIELDS):
+            arrays[field + '_id'] = np.array([locality[2 * i] for locality in localities], dtype=str)
+            arrays[field + '_nombre'] = np.array([locality[2 * i + 1] for locality in localities], dtype=str)
+        return arrays
+
+
+class StreetIndex:
+    """
+        Índice local de calles que normaliza direcciones de la forma "<calle> <altura>" en microsegundos, sin
+    peticiones HTTP, e interpola la ubicación sobre la geometría del tramo que contiene la altura.
+
+    resolve() devuelve la normalización con la misma estructura que la API (normalization.NORM_TEMPLATE) y un puntaje
+    de confianza: 1 si el nombre coincide exactamente y la similitud de trigramas si no. Las direcciones que no se
+    pueden resolver con seguridad (nombre desconocido o ambiguo, altura fuera de los rangos o texto adicional después
+    de la altura) devuelven None, para que se consulten a la API (ver AddressNormalizer).
+
+    Uso:
+        index = StreetIndex.download()
+        index.save('calles.npz')
+        index = StreetIndex.load('calles.npz')
+        normalization, score = index.normalize('Av. San Martín 150', localidad_censal='Junín')
+    """
+
+    def __init__(self, arrays, filename=None) -> None:
+        """
+        :param arrays: diccionario de arreglos de numpy con las columnas del índice (ver save()).
+        :param filename: archivo del que se leyó el índice, si lo hay.
+        """
+        super().__init__()
+        self.arrays = arrays
+        self.filename = filename
+        self._streets = {field: arrays[field].tolist() for field in STREET_FIELDS}
+        self._localities = {
+            field: (arrays[field + '_id'].tolist(), arrays[field + '_nombre'].tolist()) for field in LOCALITY_FIELDS
+        }
+        self._ranges = arrays['alturas'].tolist()
+        self._locality = arrays['localidad'].tolist()
+        self._offsets = arrays['geometria_inicio'].tolist()
+        self._coordinates = arrays['geometria']
+        self._trigram_index = {}
+        self._build_groups()
+        self._build_lookup()
+
+    def __len__(self):
+        return len(self._locality)
+
+    def _build_groups(self):
+        """
+            Ordena los tramos por localidad, nombre y altura inicial, y registra el rango de cada grupo
+        (localidad, nombre) en ese orden junto con el máximo acumulado de las alturas finales.
+        """
+        ranges = self.arrays['alturas']
+        starts = np.where(ranges[:, :2] < 0, np.iinfo(np.int64).max, ranges[:, :2]).min(axis=1)
+        ends = ranges[:, 2:].max(axis=1)
+        keys = self.arrays['clave']
+        localities = self.arrays['localidad']
+        order = np.lexsort((starts, keys, localities))
+        self._order = order.tolist()
+        self._starts = starts[order].tolist()
+        self._ends = ends[order].tolist()
+        self._max_ends = list(self._ends)
+        self._groups = {}
+        self._names = {}
+        self._locality_names = {}
+        sorted_keys = keys[order].tolist()
+        sorted_localities = localities[order].tolist()
+        first = 0
+        for i in range(1, len(order) + 1):
+            if i < len(order) and sorted_keys[i] == sorted_keys[first] and \
+                    sorted_localities[i] == sorted_localities[first]:
+                self._max_ends[i] = max(self._max_ends[i], self._max_ends[i - 1])
+                continue
+            locality, name = sorted_localities[first], sorted_keys[first]
+            self._groups[(locality, name)] = (first, i)
+            self._names.setdefault(name, []).append(locality)
+            self._locality_names.setdefault(locality, []).append(name)
+            first = i
+
+    def _build_lookup(self):
+        """ Indexa las localidades por id y por nombre canónico de su provincia, departamento y localidad censal. """
+        self._lookup = {}
+        for field, (ids, names) in self._localities.items():
+            lookup = self._lookup[field] = {}
+            for i, (value, name) in enumerate(zip(ids, canonicalize(names))):
+                for key in {value, name}:
+                    if key:
+                        lookup.setdefault(key, set()).add(i)
+
+    # Construcción y persistencia
+
+    @classmethod
+    def from_records(cls, records):
+        """
+            Arma el índice con registros de la capa de calles (con campos='completo'). La geometría se toma, si está,
+        de la clave 'geometria' de cada registro, en GeoJSON (LineString o MultiLineString).
+        """
+        builder = _Builder()
+        for record in records:
+            builder.add(record)
+        return cls(builder.arrays())
+
+    @classmethod
+    async def download_async(cls, url=API_BASE_URL, session=None, limit=5000, client=None):
+        """
+            Descarga la capa completa de calles, por región, y arma el índice a medida que llegan los registros.
+        """
+        builder = _Builder()
+        await consume_entity(session or POOL.async_session(), url, 'calles', builder.add, limit, client)
+        log.info("Calles descargadas: {}".format(len(builder.locality)))
+        return cls(builder.arrays())
+
+    @classmethod
+    def download(cls, url=API_BASE_URL, limit=5000):
+        return run_async(cls.download_async(url, limit=limit))
+
+    def save(self, filename):
+        """ Guarda las columnas del índice en un archivo .npz comprimido. """
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f, **self.arrays)
+        self.filename = filename
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files}, filename)
+
+    # Consultas
+
+    def _scope(self, provincia=None, departamento=None, localidad_censal=None):
+        """ Las localidades que coinciden con todas las unidades territoriales indicadas, o None si no se indica. """
+        scope = None
+        for field, value in zip(LOCALITY_FIELDS, (provincia, departamento, localidad_censal)):
+            if value:
+                matches = self._lookup[field].get(str(value), set())
+                scope = matches if scope is None else scope & matches
+        return scope
+
+    def _locality_trigrams(self, locality):
+        index = self._trigram_index.get(locality)
+        if index is None:
+            index = self._trigram_index[locality] = {}
+            for name in self._locality_names.get(locality, ()):
+                for trigram in _trigrams(name):
+                    index.setdefault(trigram, []).append(name)
+        return index
+
+    def _similar(self, name, scope):
+        """
+            Busca por similitud de trigramas (coeficiente de Dice) los nombres de calles de las localidades scope.
+        :return: Las calles (localidad, nombre) con el mayor puntaje y ese puntaje.
+        """
+        trigrams = _trigrams(name)
+        best, score = [], 0.0
+        for locality in scope:
+            index = self._locality_trigrams(locality)
+            common = Counter(candidate for trigram in trigrams for candidate in index.get(trigram, ()))
+            for candidate, count in common.items():
+                similarity = 2 * count / (len(trigrams) + len(_trigrams(candidate)))
+                if similarity > score:
+                    best, score = [(locality, candidate)], similarity
+                elif similarity == score:
+                    best.append((locality, candidate))
+        return best, score
+
+    def _candidates(self, name, scope):
+        names = [name]
+        stripped = _STREET_TYPE.sub('', name)
+        if stripped != name:
+            names.append(stripped)
+        for candidate in names:
+            localities = self._names.get(candidate, ())
+            if scope is None:
+                streets = [(locality, candidate) for locality in localities]
+            elif len(scope) < len(localities):
+                streets = [(locality, candidate) for locality in scope if (locality, candidate) in self._groups]
+            else:
+                streets = [(locality, candidate) for locality in localities if locality in scope]
+            if streets:
+                return streets, 1.0
+        if not scope:
+            return [], 0.0
+        return max((self._similar(candidate, scope) for candidate in names), key=lambda result: result[1])
+
+    def _segment(self, group, number):
+        """ Busca por bisección un tramo del grupo (localidad, nombre) cuyo rango de alturas contiene number. """
+        first, last = self._groups[group]
+        i = bisect.bisect_right(self._starts, number, first, last)
+        while i > first and self._max_ends[i - 1] >= number:
+            i -= 1
+            if self._starts[i] <= number <= self._ends[i]:
+                return self._order[i]
+        return None
+
+    def _location(self, row, number):
+        first, last = self._offsets[row], self._offsets[row + 1]
+        if first == last:
+            return {'lat': None, 'lon': None}
+        coordinates = self._coordinates[first:last]
+        ranges = self._ranges[row]
+        start, end = min(ranges[0], ranges[1]), max(ranges[2], ranges[3])
+        for side_start, side_end in ((ranges[0], ranges[2]), (ranges[1], ranges[3])):
+            if 0 <= side_start <= number <= side_end and side_start % 2 == number % 2:
+                start, end = side_start, side_end
+                break
+        fraction = (number - start) / (end - start) if end > start else 0.5
+        lon, lat = _point_along(coordinates, min(max(fraction, 0.0), 1.0))
+        return {'lat': float(lat), 'lon': float(lon)}
+
+    def _normalization(self, row, number):
+        locality = self._locality[row]
+        refs = {
+            field: {'id': ids[locality] or None, 'nombre': names[locality] or None}
+            for field, (ids, names) in self._localities.items()
+        }
+        name = self._streets['nombre'][row]
+        return {
+            'altura': {'unidad': None, 'valor': number},
+            'calle': {'categoria': self._streets['categoria'][row] or None, 'id': self._streets['id'][row] or None,
+                      'nombre': name},
+            'calle_cruce_1': {'categoria': None, 'id': None, 'nombre': None},
+            'calle_cruce_2': {'categoria': None, 'id': None, 'nombre': None},
+            'departamento': refs['departamento'],
+            'localidad_censal': refs['localidad_censal'],
+            'nomenclatura': '{} {}, {}, {}'.format(
+                name, number, refs['departamento']['nombre'], refs['provincia']['nombre']
+            ),
+            'piso': None,
+            'provincia': refs['provincia'],
+            'ubicacion': self._location(row, number),
+        }
+
+    def resolve(self, direccion, provincia=None, departamento=None, localidad_censal=None, localidad=None):
+        """
+            Normaliza una dirección con valores ya en forma canónica (ver normalization.canonicalize). Las unidades
+        territoriales pueden indicarse por id o por nombre; localidad no se usa.
+        :return: Una tupla con la normalización, o None si no se pudo resolver, y su puntaje.
+        """
+        match = _ADDRESS.match(direccion or '')
+        if not match:
+            return None, 0.0
+        scope = self._scope(provincia, departamento, localidad_censal)
+        if scope is not None and not scope:
+            return None, 0.0
+        number = int(match.group('altura'))
+        streets, score = self._candidates(match.group('calle').strip(), scope)
+        rows = [row for row in (self._segment(street, number) for street in streets) if row is not None]
+        if len(rows) != 1:
+            return None, 0.0
+        return self._normalization(rows[0], number), score
+
+    def normalize(self, direccion, provincia=None, departamento=None, localidad_censal=None, localidad=None):
+        """ Normaliza una dirección (ver resolve()). """
+        values = canonicalize([direccion, provincia, departamento, localidad_censal])
+        return self.resolve(*values)
@@ -1,8 +1,12 @@
-import json
-
 import geopandas as gpd
+import numpy as np
+import pandas as pd
 from tqdm import tqdm
 
+from georef_ar_py import codec
+
+MAX_FLATTENERS = 32
+
 
 def flatten_dict(dd, separator='_', prefix=''):
     return {prefix + separator + k if prefix else k: v
@@ -11,6 +15,164 @@ def flatten_dict(dd, separator='_', prefix=''):
             } if isinstance(dd, dict) else {prefix: dd}
 
 
+def template_paths(template, separator='_', prefix=()):
+    """
+        Devuelve las hojas de un template como pares (nombre, ruta), donde nombre es la clave que les asigna
+    flatten_dict y ruta, la tupla de claves para llegar a ellas.
+    """
+    paths = []
+    for key, value in template.items():
+        if isinstance(value, dict):
+            paths.extend(template_paths(value, separator, prefix + (key,)))
+        else:
+            paths.append((separator.join(prefix + (key,)), prefix + (key,)))
+    return paths
+
+
+class Flattener:
+    """
+        Aplanador de diccionarios con una estructura fija, compilado una sola vez a partir de uno o más templates
+    (diccionarios anidados cuyas hojas son tipos, como normalization.NORM_TEMPLATE). Produce las mismas claves que
+    flatten_dict, pero recorre un árbol de claves ya armado en lugar de recorrer cada diccionario, y puede escribir
+    los valores directamente en arreglos tipados: float64 para float, enteros con valores faltantes (Int64) para int
+    y object para el resto. Los valores de las hojas str se convierten a texto.
+
+    Las claves ausentes, las hojas en None y los subdiccionarios que no lo son quedan como valores faltantes; las
+    claves que no están en el template se ignoran.
+    """
+
+    def __init__(self, *templates, separator='_') -> None:
+        super().__init__()
+        self.columns = []
+        self.kinds = []
+        self.dtypes = []
+        self._tree = {}
+        for template in templates:
+            for name, path in template_paths(template, separator):
+                node = self._tree
+                for key in path[:-1]:
+                    node = node.setdefault(key, {})
+                node[path[-1]] = len(self.columns)
+                self.columns.append(name)
+                self.kinds.append(self._leaf(template, path))
+                self.dtypes.append(self._dtype(self.kinds[-1]))
+        self._tree = self._compile(self._tree)
+
+    @classmethod
+    def from_record(cls, record, separator='_'):
+        """ Compila un aplanador con la estructura de un diccionario de ejemplo. """
+        def template(value):
+            return {k: template(v) for k, v in value.items()} if isinstance(value, dict) else type(value)
+        return cls(template(record), separator=separator)
+
+    @staticmethod
+    def _leaf(template, path):
+        for key in path:
+            template = template[key]
+        return template
+
+    @staticmethod
+    def _dtype(kind):
+        if kind is float:
+            return np.float64
+        if kind is int:
+            return np.int64
+        return object
+
+    @classmethod
+    def _compile(cls, node):
+        return tuple((key, cls._compile(value) if isinstance(value, dict) else value) for key, value in node.items())
+
+    def _walk(self, tree, record, write):
+        for key, node in tree:
+            value = record.get(key)
+            if value is None:
+                continue
+            if node.__class__ is tuple:
+                if value.__class__ is dict:
+                    self._walk(node, value, write)
+            else:
+                write(node, value)
+
+    def _match(self, tree, record, flat):
+        if len(record) != len(tree):
+            return False
+        for (key, node), record_key in zip(tree, record):
+            if key != record_key:
+                return False
+            value = record[key]
+            if node.__class__ is tuple:
+                if value.__class__ is not dict or not self._match(node, value, flat):
+                    return False
+            elif value.__class__ is dict:
+                return False
+            else:
+                flat[self.columns[node]] = value
+        return True
+
+    def flatten_exact(self, record):
+        """
+            Aplana un diccionario que tiene exactamente la estructura del template (las mismas claves, en el mismo
+        orden, y los mismos subdiccionarios), con el mismo resultado que flatten_dict.
+        :return: Un diccionario con una clave por columna o None si el diccionario tiene otra estructura.
+        """
+        flat = {}
+        return flat if self._match(self._tree, record, flat) else None
+
+    def flatten(self, record):
+        """ Devuelve un diccionario con una clave por columna. """
+        flat = dict.fromkeys(self.columns)
+        columns = self.columns
+
+        def write(index, value):
+            flat[columns[index]] = value
+        self._walk(self._tree, record, write)
+        return flat
+
+    def to_columns(self, records):
+        """
+            Aplana una secuencia de diccionarios (o None) en un arreglo tipado por columna.
+        :return: Un diccionario de columna a arreglo, en el orden de columns.
+        """
+        size = len(records)
+        buffers = []
+        masks = {}
+        strings = {index for index, kind in enumerate(self.kinds) if kind is str}
+        for index, dtype in enumerate(self.dtypes):
+            if dtype is np.float64:
+                buffers.append(np.full(size, np.nan))
+            elif dtype is np.int64:
+                buffers.append(np.zeros(size, dtype=np.int64))
+                masks[index] = np.ones(size, dtype=bool)
+            else:
+                buffers.append(np.full(size, None, dtype=object))
+
+        row = 0
+
+        def write(index, value):
+            if index in strings and value.__class__ is not str:
+                value = str(value)
+            try:
+                buffers[index][row] = value
+            except (TypeError, ValueError):
+                return
+            if index in masks:
+                masks[index][row] = False
+
+        for row, record in enumerate(records):
+            if record:
+                self._walk(self._tree, record, write)
+
+        return {
+            column: pd.arrays.IntegerArray(buffer, masks[index]) if index in masks else buffer
+            for index, (column, buffer) in enumerate(zip(self.columns, buffers))
+        }
+
+    def to_df(self, records, index=None):
+        """ Arma un DataFrame con una columna tipada por hoja del template. """
+        return pd.DataFrame(self.to_columns(records), index=index, columns=self.columns)
+
+
 def converter(source, target):
     if source.split(".")[-1] == "ndjson" and target.split(".")[-1] == "geojson":
         ndjson2geojson(source, target)
@@ -23,34 +185,37 @@ def ndjson2geojson(source, target=None, flatten=True):
     if not target:
         target = "{}.geojson".format(source.split('.')[:-1][0])
 
-    def open_file(file_name):
-        with open(file_name, 'w') as f:
-            f.write('{"type": "FeatureCollection","features": [')
-
-    def append_to_file(data, file_name):
-        with open(file_name, 'a') as f:
-            f.write(data)
-
-    def close_file(file_name):
-        with open(file_name, 'a') as f:
-            f.write(']}')
+    with open(source, 'rb') as sf, open(target, 'wb') as tf:
 
-    with open(source, 'r') as sf:
+        tf.write(b'{"type": "FeatureCollection","features": [')
 
-        open_file(target)
-
-        for number, line in enumerate(tqdm(sf.readlines())):
+        flatteners = {}
+        compiled = 0
+        for number, line in enumerate(tqdm(sf)):
             if number == 0:
                 continue
 
-            text = "" if number == 1 else ", "
-
-            entity = json.loads(line)
+            entity = codec.loads(line)
             geometry = entity['geometria']
             del(entity['geometria'])
 
             if flatten:
-                entity = flatten_dict(entity)
+                # Los registros de una entidad comparten pocas estructuras: se compila un aplanador con el primer
+                # registro de cada una, que verifica la estructura mientras aplana (ver Flattener.flatten_exact). Si
+                # aparecen demasiadas estructuras distintas, el resto se aplana con flatten_dict.
+                candidates = flatteners.setdefault(tuple(entity), [])
+                flat = None
+                for flattener in candidates:
+                    flat = flattener.flatten_exact(entity)
+                    if flat is not None:
+                        break
+                if flat is None and compiled < MAX_FLATTENERS:
+                    compiled += 1
+                    flattener = Flattener.from_record(entity)
+                    flat = flattener.flatten_exact(entity)
+                    if flat is not None:
+                        candidates.append(flattener)
+                entity = flat if flat is not None else flatten_dict(entity)
                 geometry = flatten_dict(geometry)
 
             feature = {
@@ -59,7 +224,8 @@ def ndjson2geojson(source, target=None, flatten=True):
                 "properties": entity
             }
 
-            text = text + json.dumps(feature)
-            append_to_file(text, target)
+            if number > 1:
+                tf.write(b", ")
+            tf.write(codec.dumps(feature))
 
-        close_file(target)
+        tf.write(b']}')
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from georef_ar_py import georequests
+from georef_ar_py.cache import ResponseCache
+from georef_ar_py.metrics import Metrics
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+        self.metrics = georequests.METRICS
+        georequests.METRICS = Metrics()
+
+    def tearDown(self) -> None:
+        georequests.configure_cache(None)
+        georequests.METRICS = self.metrics
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def test_make_key(self):
+        key1 = ResponseCache.make_key('GET', 'http://api/', 'provincias', {'max': 1, 'nombre': 'Chaco'})
+        key2 = ResponseCache.make_key('GET', 'http://api/', 'provincias', {'nombre': 'Chaco', 'max': '1'})
+        key3 = ResponseCache.make_key('GET', 'http://api/', 'provincias', {'nombre': 'Chubut', 'max': '1'})
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, key3)
+
+    def test_get_set(self):
+        cache = ResponseCache(self.path)
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', {'provincias': [{'id': '22', 'nombre': 'Chaco'}]})
+        self.assertEqual('Chaco', cache.get('key')['provincias'][0]['nombre'])
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+        cache.close()
+
+        cache = ResponseCache(self.path)
+        self.assertIsNotNone(cache.get('key'))
+        cache.close()
+
+    def test_ttl(self):
+        cache = ResponseCache(self.path, ttl=-1)
+        cache.set('key', {'total': 1})
+        self.assertIsNone(cache.get('key'))
+        cache.close()
+
+    def test_eviction(self):
+        cache = ResponseCache(self.path, max_size=100, evict_every=1)
+        for i in range(10):
+            cache.set(f'key{i}', {'value': 'x' * 20})
+        self.assertLessEqual(cache.size, 100)
+        self.assertIsNone(cache.get('key0'))
+        self.assertIsNotNone(cache.get('key9'))
+        cache.close()
+
+    @mock.patch('georef_ar_py.georequests._post')
+    def test_post_split_bulk(self, mock_post):
+        georequests.configure_cache(self.path, split_bulk=True)
+
+        mock_post.return_value = {'resultados': [{'direcciones': ['a']}, {'direcciones': ['b']}]}
+        data = {'direcciones': [{'direccion': 'a'}, {'direccion': 'b'}]}
+        response = georequests.get_json_post('http://api/', 'direcciones', data)
+        self.assertEqual(mock_post.return_value, response)
+
+        mock_post.return_value = {'resultados': [{'direcciones': ['c']}]}
+        data = {'direcciones': [{'direccion': 'a'}, {'direccion': 'c'}, {'direccion': 'b'}]}
+        response = georequests.get_json_post('http://api/', 'direcciones', data)
+        mock_post.assert_called_with('http://api/', 'direcciones', {'direcciones': [{'direccion': 'c'}]})
+        self.assertEqual(
+            [{'direcciones': ['a']}, {'direcciones': ['c']}, {'direcciones': ['b']}], response['resultados']
+        )
+
+        georequests.get_json_post('http://api/', 'direcciones', data)
+        self.assertEqual(2, mock_post.call_count)
+        self.assertEqual(1, georequests.METRICS.snapshot()['endpoints']['direcciones']['cached'])
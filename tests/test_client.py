@@ -0,0 +1,72 @@
+import unittest
+
+from georef_ar_py import georequests
+from georef_ar_py.client import GeorefClient, GeorefClientSync
+from georef_ar_py.server import GeorefStandIn
+
+
+class GeorefClientTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.stand_in = GeorefStandIn(size=200, limits={})
+        url = await self.stand_in.start()
+        self.client = GeorefClient(url, token='token', bulk_size=2)
+        self.addAsyncCleanup(self.stand_in.close)
+        self.addAsyncCleanup(self.client.close)
+
+    def test_headers(self):
+        self.assertEqual('Bearer token', georequests._headers(self.client.url, self.client)['Authorization'])
+        self.assertNotIn('Authorization', georequests._headers(self.client.url))
+
+    async def test_normalize(self):
+        normalization = await self.client.normalize('Av. Corrientes 1234', provincia='Chaco')
+        self.assertEqual('22', normalization['provincia']['id'])
+        self.assertEqual({}, await self.client.normalize('sin altura'))
+
+    async def test_normalize_bulk(self):
+        addresses = ['Mitre {}'.format(i) for i in range(1, 6)] + [{'direccion': 'Belgrano 10', 'provincia': '82'}]
+        normalizations = await self.client.normalize_bulk(addresses)
+        self.assertEqual([i for i in range(1, 6)] + [10], [n['altura']['valor'] for n in normalizations])
+        self.assertEqual('82', normalizations[-1]['provincia']['id'])
+        self.assertEqual(3, self.stand_in.stats['requests']['direcciones'])
+        self.assertEqual(3, self.client.metrics.snapshot()['endpoints']['direcciones']['requests'])
+        self.assertNotIn('direcciones', georequests.METRICS.endpoints)
+
+    async def test_similar(self):
+        self.assertEqual('82', (await self.client.similar('provincias', 'sant fe'))[0]['id'])
+        similar = await self.client.similar_bulk('provincias', ['pxa', 'sant fe', 'chaco'])
+        self.assertEqual([None, '82', '22'], [entity.get('id') for entity in similar])
+
+    async def test_territorial_units(self):
+        units = await self.client.territorial_units([{'lat': -32.94, 'lon': -60.63}, {'lat': -34.6, 'lon': -58.4}])
+        self.assertEqual(2, len(units))
+        self.assertIn('provincia_id', units[0])
+
+    async def test_entities(self):
+        self.assertEqual(200, await self.client.entity_number('calles'))
+        self.assertEqual(200, len(await self.client.entities('calles')))
+        self.assertEqual(200, len(await self.client.entities('departamentos')))
+
+
+class GeorefClientSyncTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.stand_in = GeorefStandIn(limits={})
+        self.url = self.stand_in.start_in_thread()
+
+    def tearDown(self) -> None:
+        self.stand_in.stop_thread()
+        super().tearDown()
+
+    def test_client(self):
+        with GeorefClientSync(self.url) as client:
+            self.assertEqual(1234, client.normalize('Corrientes 1234')['altura']['valor'])
+            self.assertEqual(2, len(client.normalize_bulk(['Mitre 1', 'Mitre 2'])))
+            self.assertEqual(24, client.entity_number('provincias'))
+            self.assertEqual(3, client.metrics.snapshot()['total']['requests'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+from unittest import mock
+
+from georef_ar_py import codec
+
+
+class CodecTest(unittest.TestCase):
+
+    DATA = {'direcciones': [{'direccion': 'Av. Corrientes 1234', 'provincia': 'Córdoba', 'max': 1}]}
+
+    def test_round_trip(self):
+        raw = codec.dumps(self.DATA)
+        self.assertIsInstance(raw, bytes)
+        self.assertEqual(self.DATA, codec.loads(raw))
+        self.assertEqual(self.DATA, codec.loads(raw.decode('utf-8')))
+        self.assertEqual(raw.decode('utf-8'), codec.dumps_str(self.DATA))
+
+    def test_stdlib_fallback(self):
+        with mock.patch.object(codec, 'orjson', None):
+            self.assertEqual('json', codec.backend())
+            raw = codec.dumps(self.DATA)
+            self.assertIn('Córdoba'.encode('utf-8'), raw)
+            self.assertEqual(self.DATA, codec.loads(raw))
+
+
+if __name__ == '__main__':
+    unittest.main()
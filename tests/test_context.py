@@ -0,0 +1,44 @@
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from georef_ar_py.context import Report
+
+
+class ReportTest(unittest.TestCase):
+
+    def test_write(self):
+        logger = logging.getLogger('georef_ar_py.test_context')
+        other = logging.getLogger('georef_ar_py.test_context_other')
+        report = Report(logger, io.StringIO(), name='geoarpy-test')
+        report.capture(logger.parent)
+
+        with report.stage('lectura'):
+            report.warn("Advertencia del reporte")
+        with report.stage('lectura'):
+            other.error("Error de otro módulo")
+        report.get_data('requests')['total'] = 10
+        report.release()
+        other.error("Error fuera del reporte")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = report.write(tmp_dir)
+            self.assertTrue(os.path.basename(filename).startswith('geoarpy-test-'))
+            with open(filename) as f:
+                data = json.load(f)
+            with open(filename[:-len('json')] + 'txt') as f:
+                text = f.read()
+
+        self.assertEqual(1, data['warnings'])
+        self.assertEqual(1, data['errors'])
+        self.assertEqual(['lectura'], list(data['stages']))
+        self.assertEqual({'total': 10}, data['requests'])
+        self.assertGreater(data['peak_rss_mb'], 0)
+        self.assertEqual("Advertencia del reporte\nError de otro módulo\n", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
+import json
 import os
+import tempfile
 from unittest import TestCase
 
-from georef_ar_py.utils import ndjson2geojson
+from georef_ar_py.utils import flatten_dict, ndjson2geojson
 
 
 class TestNdjsonGeojson(TestCase):
@@ -68,3 +70,29 @@ class TestNdjsonGeojson(TestCase):
             os.path.join(current_dir, os.path.join(os.getcwd(), "convert/intersecciones.ndjson")),
             os.path.join(current_dir, os.path.join(os.getcwd(), "convert/intersecciones.geojson"))
         )
+
+    def test_ndjson2geojson(self):
+        entities = [
+            {'id': '1', 'provincia': {'id': '06', 'nombre': 'Buenos Aires'}, 'municipio': {'id': '1'}},
+            {'id': '2', 'provincia': {'id': '06', 'nombre': 'Buenos Aires'}, 'municipio': None},
+            {'id': '3', 'provincia': {'nombre': 'Chaco', 'id': '22'}, 'municipio': {'id': '2', 'nombre': 'M'}},
+            {'id': '4', 'provincia': {'id': '06', 'nombre': 'Buenos Aires'}, 'municipio': {'id': '3'}},
+            {'id': '5', 'provincia': {'nombre': 'Chaco', 'id': '22'}, 'municipio': {'id': '4'}},
+            {'id': '6', 'provincia': {'id': '06', 'nombre': 'Buenos Aires'}, 'municipio': {}},
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, 'entidades.ndjson')
+            target = os.path.join(tmp_dir, 'entidades.geojson')
+            with open(source, 'w') as f:
+                f.write('{}\n')
+                for entity in entities:
+                    f.write(json.dumps(dict(entity, geometria={'type': 'Point', 'coordinates': [-58.4, -34.6]})) + '\n')
+            ndjson2geojson(source, target)
+            with open(target) as f:
+                features = json.load(f)['features']
+
+        # Las claves anidadas, su orden y los subdiccionarios vacíos o en None quedan igual que con flatten_dict
+        self.assertEqual(
+            [list(flatten_dict(entity).items()) for entity in entities],
+            [list(feature['properties'].items()) for feature in features]
+        )
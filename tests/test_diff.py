@@ -1,9 +1,14 @@
 import json
 import os
+import tempfile
 import unittest
 from unittest import mock
 
-from georef_ar_py.diff import get_diff_object, DiffEntity
+from georef_ar_py import georequests
+from georef_ar_py.diff import get_diff_object, process_layers, DiffEntity
+from georef_ar_py.georequests import CircuitBreaker
+from georef_ar_py.metrics import Metrics
+from georef_ar_py.server import GeorefStandIn
 
 
 def get_mocked_response(url, entity, **kwargs):
@@ -28,9 +33,17 @@ def get_mocked_entity_number(url, entity, **kwargs):
     return get_mocked_response(url, entity)['total']
 
 
+def get_mocked_stream(url, entity, **kwargs):
+    async def stream(*args, **kwargs):
+        for row in get_mocked_response(url, entity)[entity.replace('-', '_')]:
+            yield row
+    return stream
+
+
 class DiffTestCase(unittest.IsolatedAsyncioTestCase):
     """
-        Agrega tests para verificar la cantidad de entidades en cada capa y el correcto funcionamiento de la clase DiffEntity
+        Agrega tests para verificar la cantidad de entidades en cada capa y el correcto funcionamiento de la clase
+    DiffEntity
     """
 
     @classmethod
@@ -43,11 +56,15 @@ class DiffTestCase(unittest.IsolatedAsyncioTestCase):
         self.src_url = "http://apis.datos.gob.ar/georef/api/"
         self.target_url = "http://apis.datos.gob.ar/georef-demo/api/"
 
+    async def asyncTearDown(self) -> None:
+        await georequests.close_async()
+        await super().asyncTearDown()
+
     @mock.patch('georef_ar_py.diff.get_entity_number')
-    @mock.patch.object(DiffEntity, "_get_response")
+    @mock.patch.object(DiffEntity, "_iter_response")
     async def test_diff_provinces(self, mock_method, mock_entity_number):
         mock_entity_number.side_effect = get_mocked_entity_number
-        mock_method.return_value = get_mocked_response(self.target_url, "provincias")
+        mock_method.side_effect = get_mocked_stream(self.target_url, "provincias")
 
         diff_entity = get_diff_object(self.src_url, self.target_url, 'provincias')
 
@@ -62,10 +79,10 @@ class DiffTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual({}, diff_dict)
 
     @mock.patch('georef_ar_py.diff.get_entity_number')
-    @mock.patch.object(DiffEntity, "_get_response")
+    @mock.patch.object(DiffEntity, "_iter_response")
     async def test_diff_departments(self, mock_method, mock_entity_number):
         mock_entity_number.side_effect = get_mocked_entity_number
-        mock_method.return_value = get_mocked_response(self.target_url, "departamentos")
+        mock_method.side_effect = get_mocked_stream(self.target_url, "departamentos")
 
         diff_entity = get_diff_object(self.src_url, self.target_url, 'departamentos')
 
@@ -80,10 +97,10 @@ class DiffTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual({}, diff_dict)
 
     @mock.patch('georef_ar_py.diff.get_entity_number')
-    @mock.patch.object(DiffEntity, "_get_response")
+    @mock.patch.object(DiffEntity, "_iter_response")
     async def test_diff_municipalities(self, mock_method, mock_entity_number):
         mock_entity_number.side_effect = get_mocked_entity_number
-        mock_method.return_value = get_mocked_response(self.target_url, "municipios")
+        mock_method.side_effect = get_mocked_stream(self.target_url, "municipios")
 
         diff_entity = get_diff_object(self.src_url, self.target_url, 'municipios')
 
@@ -98,10 +115,10 @@ class DiffTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual({}, diff_dict)
 
     @mock.patch('georef_ar_py.diff.get_entity_number')
-    @mock.patch.object(DiffEntity, "_get_response")
+    @mock.patch.object(DiffEntity, "_iter_response")
     async def test_diff_census_localities(self, mock_method, mock_entity_number):
         mock_entity_number.side_effect = get_mocked_entity_number
-        mock_method.return_value = get_mocked_response(self.target_url, "localidades-censales")
+        mock_method.side_effect = get_mocked_stream(self.target_url, "localidades-censales")
 
         diff_entity = get_diff_object(self.src_url, self.target_url, 'localidades-censales')
 
@@ -134,10 +151,10 @@ class DiffTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual({}, diff_dict)
 
     @mock.patch('georef_ar_py.diff.get_entity_number')
-    @mock.patch.object(DiffEntity, "_get_response")
+    @mock.patch.object(DiffEntity, "_iter_response")
     async def test_diff_localities(self, mock_method, mock_entity_number):
         mock_entity_number.side_effect = get_mocked_entity_number
-        mock_method.return_value = get_mocked_response(self.target_url, "localidades")
+        mock_method.side_effect = get_mocked_stream(self.target_url, "localidades")
 
         diff_entity = get_diff_object(self.src_url, self.target_url, 'localidades')
 
@@ -168,3 +185,38 @@ class DiffTestCase(unittest.IsolatedAsyncioTestCase):
         diff_dict = await diff_entity._get_diff_as_dict()
 
         self.assertEqual({}, diff_dict)
+
+
+class ProcessLayersTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.stand_in = GeorefStandIn(limits={}, size=50)
+        self.url = self.stand_in.start_in_thread()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.metrics = georequests.METRICS
+        self.circuit_breaker = georequests.CIRCUIT_BREAKER
+        georequests.METRICS = Metrics()
+        georequests.CIRCUIT_BREAKER = CircuitBreaker()
+
+    def tearDown(self) -> None:
+        georequests.METRICS = self.metrics
+        georequests.CIRCUIT_BREAKER = self.circuit_breaker
+        self.stand_in.stop_thread()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def test_process_layers(self):
+        layers = ['provincias', 'departamentos', 'calles']
+        # Pausas previas del proceso principal, que los procesos del pool heredan
+        georequests.CIRCUIT_BREAKER.opened = 2
+        results = list(process_layers(self.url, self.url, layers, self.tmp_dir.name, 'csv', max_workers=1))
+        self.assertEqual({(layer, None) for layer in layers}, set(results))
+
+        # El único proceso del pool atiende todas las capas: cada una devuelve solo sus propias peticiones
+        snapshot = georequests.METRICS.snapshot()
+        self.assertEqual(sum(self.stand_in.stats['requests'].values()), snapshot['total']['requests'])
+        for layer in layers:
+            self.assertEqual(self.stand_in.stats['requests'][layer], snapshot['endpoints'][layer]['requests'])
+        self.assertEqual(2, georequests.CIRCUIT_BREAKER.opened)
+
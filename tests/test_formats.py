@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+import geopandas as gpd
+import pandas as pd
+
+from georef_ar_py import formats
+from georef_ar_py.normalization import AddressNormalizer
+from georef_ar_py.server import GeorefStandIn
+
+
+@unittest.skipIf(formats.pa is None, 'requiere pyarrow')
+class FormatsTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_file_format(self):
+        self.assertEqual('parquet', formats.file_format('a/b.PARQUET'))
+        self.assertEqual('arrow', formats.file_format('b.feather'))
+        self.assertEqual('csv', formats.file_format('b.txt'))
+
+    def test_table_writer(self):
+        class Writer(formats.TableWriter):
+            def write(self, df):
+                return None
+
+        with self.assertRaises(TypeError):
+            Writer()
+
+    def test_read_frames(self):
+        df = pd.DataFrame({'direccion': ['Mitre {}'.format(i) for i in range(25)], 'localidad_censal': range(25)})
+        df.loc[3, 'direccion'] = None
+        for name, write in (('in.parquet', df.to_parquet), ('in.feather', df.to_feather)):
+            path = self._path(name)
+            write(path)
+            self.assertEqual(25, formats.count_rows(path))
+            frames = list(formats.read_frames(path, ['direccion', 'localidad_censal', 'provincia'], 10, skip=2))
+            self.assertEqual([10, 10, 3], [len(frame) for frame in frames])
+            self.assertEqual(['direccion', 'localidad_censal'], list(frames[0].columns))
+            self.assertEqual('2', frames[0]['localidad_censal'][0])
+            self.assertIsNone(frames[0]['direccion'][1])
+
+    def test_merge_parts(self):
+        schema = formats.table_schema(['a', 'b'], [int, str])
+        parts = [self._path('out.part0'), self._path('out.part1')]
+        for index, part in enumerate(parts):
+            with formats.open_writer(part, formats.PARQUET, schema=schema) as writer:
+                writer.write(pd.DataFrame({'a': [index, None], 'b': ['x', None]}))
+        formats.merge_parts(self._path('out.parquet'), parts, formats.PARQUET)
+        df = pd.read_parquet(self._path('out.parquet'))
+        self.assertEqual([0, 1], df['a'].dropna().tolist())
+        self.assertEqual(4, len(df))
+
+
+@unittest.skipIf(formats.pa is None, 'requiere pyarrow')
+class NormalizeFileTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.stand_in = GeorefStandIn(limits={})
+        self.url = self.stand_in.start_in_thread()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        rows = [{'direccion': 'Mitre {}'.format(i + 1) if i != 5 else 'sin altura'} for i in range(60)]
+        pd.DataFrame(rows).to_csv(self.source, index=False)
+
+    def tearDown(self) -> None:
+        self.stand_in.stop_thread()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def test_parquet(self):
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.parquet')
+        AddressNormalizer(url=self.url, chunk_size=25, data_size=10).normalize_file(self.source, target, geometry=True)
+
+        df = pd.read_parquet(target)
+        self.assertEqual(60, len(df))
+        self.assertEqual('float64', str(df['ubicacion_lat'].dtype))
+        self.assertEqual('int64', str(formats.pq.read_schema(target).field('altura_valor').type))
+        self.assertTrue(pd.isna(df['altura_valor'][5]))
+
+        gdf = gpd.read_parquet(target)
+        self.assertEqual('OGC:CRS84', gdf.crs.to_string())
+        self.assertEqual(59, gdf.geometry.notna().sum())
+        self.assertAlmostEqual(df['ubicacion_lon'][0], gdf.geometry[0].x)
+
+        arrow = os.path.join(self.tmp_dir.name, 'normalizadas.arrow')
+        AddressNormalizer(url=self.url, chunk_size=25, data_size=10).normalize_file(target, arrow)
+        self.assertEqual(df['nomenclatura'].tolist(), pd.read_feather(arrow)['nomenclatura'].tolist())
+
+    def test_workers(self):
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.parquet')
+        AddressNormalizer(url=self.url, chunk_size=10, data_size=5).normalize_file(self.source, target, workers=3)
+        df = pd.read_parquet(target)
+        self.assertEqual(list(range(1, 61)), df['altura_valor'].fillna(6).tolist())
+
+    def test_resume(self):
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.parquet')
+        with self.assertRaises(ValueError):
+            AddressNormalizer(url=self.url).normalize_file(self.source, target, resume=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
+import asyncio
+import concurrent.futures
+import json
 import logging
+import time
+import unittest
 from unittest import TestCase
 
 import pytest as pytest
+from aiohttp import web, ClientResponseError
+from aiohttp.test_utils import TestServer
 from requests import RequestException
 
 from georef_ar_py import georequests
-from georef_ar_py.georequests import get_json, get_limits
+from georef_ar_py.georequests import get_json, get_limits, ConnectionPool, RateLimiter, TokenBucket, RetryPolicy, \
+    SingleFlight, JsonArrayParser, get_json_async, get_json_stream_async, get_json_post_async, CircuitBreaker
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -21,3 +29,364 @@ class Test(TestCase):
         self.assertIsNotNone(limits)
         self.assertEqual(8, len(limits))
 
+
+class ConnectionPoolTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_sync_session_is_reused(self):
+        pool = ConnectionPool(limit_per_host=5)
+        session = pool.session
+        self.assertIs(session, pool.session)
+        self.assertEqual(5, session.get_adapter('https://').poolmanager.connection_pool_kw['maxsize'])
+        pool.close()
+        self.assertIsNot(session, pool.session)
+        pool.close()
+
+    def test_configure(self):
+        pool = ConnectionPool()
+        session = pool.session
+        pool.configure(limit_per_host=2)
+        self.assertEqual(2, pool.limit_per_host)
+        self.assertIsNot(session, pool.session)
+        with pytest.raises(AttributeError):
+            pool.configure(unknown=1)
+        pool.close()
+
+    def test_forked_process(self):
+        pool = ConnectionPool()
+        session = pool.session
+        # Un proceso hijo ve el pid del padre en el pool heredado
+        pool._pid = -1
+        self.assertIsNot(session, pool.session)
+        self.assertTrue(session.adapters)
+        session.close()
+        pool.close()
+
+    async def test_async_session_is_reused(self):
+        pool = ConnectionPool(limit=10, limit_per_host=3, ttl_dns_cache=60)
+        session = pool.async_session()
+        self.assertIs(session, pool.async_session())
+        self.assertEqual(3, session.connector.limit_per_host)
+        self.assertTrue(session.connector.use_dns_cache)
+        await pool.close_async()
+        self.assertTrue(session.closed)
+
+    def test_run_async_closes_session(self):
+        pool = georequests.POOL
+
+        async def func():
+            return pool.async_session()
+
+        session = georequests.run_async(func())
+        self.assertTrue(session.closed)
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(10, 1)
+        now = time.monotonic()
+        for _ in range(10):
+            self.assertEqual(0, bucket.wait_time(now))
+            bucket.consume()
+        self.assertAlmostEqual(0.1, bucket.wait_time(now), places=2)
+        bucket.recalibrate(limit=20, remaining=0)
+        self.assertEqual(20, bucket.capacity)
+        self.assertLessEqual(bucket.tokens, 0)
+
+    def test_from_limits(self):
+        limits = {
+            'limit-day': '1500000', 'remaining-day': '1000',
+            'limit-hour': None, 'remaining-hour': None,
+            'limit-minute': '6000', 'remaining-minute': '6000',
+            'limit-second': '200', 'remaining-second': '200',
+        }
+        rate_limiter = RateLimiter.from_limits(limits, rps=50, concurrency=4)
+        self.assertEqual(['day', 'minute', 'second'], sorted(rate_limiter.buckets.keys()))
+        self.assertEqual(50, rate_limiter.buckets['second'].capacity)
+        self.assertLessEqual(rate_limiter.buckets['day'].tokens, 1000)
+
+    async def test_rate(self):
+        rate_limiter = RateLimiter({'second': 10}, concurrency=5)
+        start = time.monotonic()
+        for _ in range(15):
+            async with rate_limiter:
+                pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+
+    async def test_concurrency(self):
+        rate_limiter = RateLimiter(concurrency=3)
+        running = []
+        peak = []
+
+        async def task():
+            async with rate_limiter:
+                running.append(1)
+                peak.append(len(running))
+                await asyncio.sleep(0.01)
+                running.pop()
+
+        await asyncio.gather(*[task() for _ in range(10)])
+        self.assertEqual(3, max(peak))
+
+    def test_update(self):
+        rate_limiter = RateLimiter({'second': 200})
+        rate_limiter.update({
+            'x-ratelimit-limit-second': '100', 'x-ratelimit-remaining-second': '5',
+            'x-ratelimit-limit-minute': '6000', 'x-ratelimit-remaining-minute': '10',
+        })
+        self.assertEqual(100, rate_limiter.buckets['second'].capacity)
+        self.assertLessEqual(rate_limiter.buckets['second'].tokens, 5)
+        self.assertLessEqual(rate_limiter.buckets['minute'].tokens, 10)
+
+    def test_share(self):
+        limits = {'limit-second': '200', 'remaining-second': '100', 'limit-day': '1000', 'remaining-day': '2'}
+        rate_limiter = RateLimiter.from_limits(limits, rps=40, share=0.25)
+        self.assertEqual(10, rate_limiter.buckets['second'].capacity)
+        self.assertEqual(250, rate_limiter.buckets['day'].capacity)
+        self.assertLessEqual(rate_limiter.buckets['day'].tokens, 0.5)
+        rate_limiter.update({'x-ratelimit-limit-minute': '2', 'x-ratelimit-remaining-minute': '0'})
+        self.assertEqual(1, rate_limiter.buckets['minute'].capacity)
+        self.assertEqual(0, rate_limiter.buckets['minute'].tokens)
+
+
+class RetryPolicyTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.retry_policy = georequests.RETRY_POLICY
+        georequests.RETRY_POLICY = RetryPolicy(backoff=0.01)
+
+    def tearDown(self) -> None:
+        georequests.RETRY_POLICY = self.retry_policy
+        super().tearDown()
+
+    def test_get_delay(self):
+        policy = RetryPolicy(max_retries=2, backoff=1, max_backoff=3, max_total_retries=3)
+        self.assertIsNone(policy.get_delay(0, status=404))
+        self.assertIsNone(policy.get_delay(0, exception=ValueError()))
+        self.assertLessEqual(policy.get_delay(1, status=503), 2)
+        self.assertEqual(5, policy.get_delay(0, status=429, headers={'Retry-After': '5'}))
+        self.assertIsNone(policy.get_delay(0, status=429, headers={'Retry-After': '3600'}))
+        self.assertIsNone(policy.get_delay(2, status=503))
+        self.assertIsNotNone(policy.get_delay(0, exception=georequests.requests.ConnectionError()))
+        self.assertIsNone(policy.get_delay(0, status=503))
+        self.assertEqual(3, policy.retries)
+
+    async def _serve(self, statuses):
+        calls = []
+
+        async def handler(request):
+            status = statuses[min(len(calls), len(statuses) - 1)]
+            calls.append(status)
+            return web.json_response({'total': 1}, status=status, headers={'Retry-After': '0'})
+
+        app = web.Application()
+        app.router.add_get('/provincias', handler)
+        server = TestServer(app)
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+        return str(server.make_url('/')), calls
+
+    async def test_retry_async(self):
+        url, calls = await self._serve([503, 429, 200])
+        session = georequests.POOL.async_session()
+        self.addAsyncCleanup(georequests.close_async)
+        response = await get_json_async(session, url, 'provincias')
+        self.assertEqual({'total': 1}, response)
+        self.assertEqual([503, 429, 200], calls)
+        self.assertEqual(2, georequests.RETRY_POLICY.retries)
+
+    async def test_no_retry_async(self):
+        url, calls = await self._serve([400, 200])
+        session = georequests.POOL.async_session()
+        self.addAsyncCleanup(georequests.close_async)
+        with pytest.raises(ClientResponseError):
+            await get_json_async(session, url, 'provincias')
+        self.assertEqual([400], calls)
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.retry_policy = georequests.RETRY_POLICY
+        self.circuit_breaker = georequests.CIRCUIT_BREAKER
+        georequests.RETRY_POLICY = RetryPolicy(max_retries=5, backoff=0.01)
+        georequests.CIRCUIT_BREAKER = CircuitBreaker(window=2, min_requests=2, open_time=0.05)
+
+    def tearDown(self) -> None:
+        georequests.RETRY_POLICY = self.retry_policy
+        georequests.CIRCUIT_BREAKER = self.circuit_breaker
+        super().tearDown()
+
+    async def test_states(self):
+        breaker = CircuitBreaker(window=4, min_requests=4, open_time=0.05)
+        for success in [True, False, True]:
+            breaker.record(success)
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+        breaker.record(False)
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+
+        # Una sola prueba a la vez: las demás peticiones esperan su resultado
+        self.assertTrue(await breaker.acquire())
+        self.assertEqual(CircuitBreaker.HALF_OPEN, breaker.state)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(breaker.acquire(), 0.2)
+        breaker.record(False, probe=True)
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+
+        self.assertTrue(await breaker.acquire())
+        breaker.record(True, probe=True)
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+        self.assertFalse(await breaker.acquire())
+        snapshot = breaker.snapshot()
+        self.assertEqual(2, snapshot['opened'])
+        # 0.05s y luego el doble, 0.1s, abierto
+        self.assertGreaterEqual(snapshot['durations']['open'], 0.15)
+        self.assertGreater(snapshot['durations']['half_open'], 0.1)
+
+    async def test_request_async(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(time.monotonic())
+            return web.json_response({'total': 1}, status=503 if len(calls) <= 4 else 200)
+
+        app = web.Application()
+        app.router.add_get('/provincias', handler)
+        server = TestServer(app)
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+        session = georequests.POOL.async_session()
+        self.addAsyncCleanup(georequests.close_async)
+
+        self.assertEqual({'total': 1}, await get_json_async(session, str(server.make_url('/')), 'provincias'))
+        # Se abre con las dos primeras fallas y cada prueba fallida duplica la pausa: 0.05s, 0.1s y 0.2s
+        self.assertEqual(5, len(calls))
+        self.assertGreaterEqual(calls[-1] - calls[1], 0.35)
+        snapshot = georequests.CIRCUIT_BREAKER.snapshot()
+        self.assertEqual(CircuitBreaker.CLOSED, snapshot['state'])
+        self.assertEqual(3, snapshot['opened'])
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_do_async(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'total': 24}
+
+        responses = await asyncio.gather(*[single_flight.do_async('key', func) for _ in range(5)])
+        self.assertEqual(1, len(calls))
+        self.assertTrue(all(response is responses[0] for response in responses))
+        self.assertEqual({'calls': 1, 'hits': 4}, single_flight.stats)
+
+        await single_flight.do_async('key', func)
+        self.assertEqual(2, len(calls))
+
+    async def test_do_async_error(self):
+        single_flight = SingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.01)
+            raise ValueError()
+
+        responses = await asyncio.gather(
+            *[single_flight.do_async('key', func) for _ in range(3)], return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(response, ValueError) for response in responses))
+
+    def test_do(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'total': 24}
+
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            responses = list(executor.map(lambda _: single_flight.do('key', func), range(4)))
+        self.assertEqual(1, len(calls))
+        self.assertEqual([{'total': 24}] * 4, responses)
+        self.assertEqual(3, single_flight.hits)
+
+
+class JsonStreamTest(unittest.IsolatedAsyncioTestCase):
+
+    DOC = {
+        "cantidad": 3, "parametros": {"calles": 'a \\" { [', "orden": ["calles"]}, "inicio": 0,
+        "calles": [
+            {"nombre": 'SAN MARTÍN \\"}]', "geometria": [[1.5, 2], [3, 4]]},
+            {"altura": {"inicio": {"derecha": 1}}},
+            {}
+        ],
+        "total": 3
+    }
+
+    def test_parser(self):
+        raw = json.dumps(self.DOC, ensure_ascii=False, indent=1).encode('utf-8')
+        for size in [1, 2, 3, 7, 64, len(raw)]:
+            parser = JsonArrayParser('calles')
+            records = []
+            for i in range(0, len(raw), size):
+                records.extend(parser.feed(raw[i:i + size]))
+            parser.close()
+            self.assertEqual(self.DOC['calles'], records)
+
+    def test_parser_incomplete(self):
+        parser = JsonArrayParser('calles')
+        parser.feed(b'{"total": 1, "calles": [{"id": "1"}, {"id"')
+        with pytest.raises(ValueError):
+            parser.close()
+
+    async def test_get_json_stream_async(self):
+        async def handler(request):
+            return web.json_response(self.DOC)
+
+        app = web.Application()
+        app.router.add_get('/calles', handler)
+        server = TestServer(app)
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+
+        session = georequests.POOL.async_session()
+        self.addAsyncCleanup(georequests.close_async)
+        url = str(server.make_url('/'))
+        records = [record async for record in get_json_stream_async(session, url, 'calles', 'calles', chunk_size=5)]
+        self.assertEqual(self.DOC['calles'], records)
+
+
+class CompressionTest(unittest.IsolatedAsyncioTestCase):
+
+    def tearDown(self) -> None:
+        georequests.COMPRESS_REQUESTS = False
+        super().tearDown()
+
+    async def test_post_gzip(self):
+        received = []
+
+        async def handler(request):
+            received.append((request.headers.get('Content-Encoding'), request.headers.get('Accept-Encoding')))
+            data = await request.json()
+            return web.json_response({'resultados': [{'direccion': d['direccion']} for d in data['direcciones']]})
+
+        app = web.Application()
+        app.router.add_post('/direcciones', handler)
+        server = TestServer(app)
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+        self.addAsyncCleanup(georequests.close_async)
+
+        georequests.COMPRESS_REQUESTS = True
+        data = {'direcciones': [{'direccion': 'Av. Corrientes {}'.format(i)} for i in range(100)]}
+        response = await get_json_post_async(
+            georequests.POOL.async_session(), str(server.make_url('/')), 'direcciones', data
+        )
+        self.assertEqual(100, len(response['resultados']))
+        self.assertEqual('gzip', received[0][0])
+        self.assertIn('gzip', received[0][1])
@@ -2,7 +2,7 @@ import unittest
 from unittest import TestCase, mock
 
 import tests.test_diff
-from georef_ar_py import info
+from georef_ar_py import georequests, info
 from georef_ar_py.georequests import API_BASE_URL
 
 
@@ -14,8 +14,17 @@ def get_mocked_response(url, entity, **kwargs):
     return tests.test_diff.get_mocked_response(url, entity, **kwargs)
 
 
+async def get_mocked_stream(session, url, entity, entity_key, **kwargs):
+    for row in tests.test_diff.get_mocked_response(url, entity, **kwargs)[entity_key]:
+        yield row
+
+
 class Test(unittest.IsolatedAsyncioTestCase):
 
+    async def asyncTearDown(self) -> None:
+        await georequests.close_async()
+        await super().asyncTearDown()
+
     @mock.patch('georef_ar_py.info.get_json')
     @mock.patch('georef_ar_py.info.get_json_async')
     def test_get_entity_number(self, get_response_async_mock, get_response_mock):
@@ -37,13 +46,23 @@ class Test(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(150054, info.get_entity_number(API_BASE_URL, 'calles'))
 
+    async def test_get_entity_number_unknown(self):
+        with self.assertRaises(ValueError):
+            info.get_entity_number(API_BASE_URL, 'paises')
+        with self.assertRaises(ValueError):
+            await info.get_entity_number_async(None, API_BASE_URL, 'paises')
+
+    @mock.patch('georef_ar_py.info.get_json_stream_async')
     @mock.patch('georef_ar_py.info.get_json')
     @mock.patch('georef_ar_py.info.get_json_async')
-    async def test_get_resume(self, get_response_async_mock, get_response_mock):
+    async def test_get_resume(self, get_response_async_mock, get_response_mock, get_stream_mock):
 
         get_response_async_mock.side_effect = get_mocked_response_async
         get_response_mock.side_effect = get_mocked_response
+        get_stream_mock.side_effect = get_mocked_stream
 
         resume = await info.get_resume(API_BASE_URL)
 
         self.assertTrue(all([key in resume.keys() for key in ['provincias', 'departamentos', 'municipios']]))
+        self.assertEqual(24, resume['provincias']['total'])
+        self.assertEqual(10, resume['departamentos']['total'])
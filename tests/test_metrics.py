@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import unittest
+
+from georef_ar_py import georequests
+from georef_ar_py.georequests import get_json_async, get_json_post_async
+from georef_ar_py.metrics import LatencyHistogram, Metrics
+from georef_ar_py.server import GeorefStandIn
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for i in range(1, 1001):
+            histogram.add(i / 1000)
+        self.assertAlmostEqual(0.5, histogram.percentile(50), delta=0.5 * 0.05)
+        self.assertAlmostEqual(0.95, histogram.percentile(95), delta=0.95 * 0.05)
+        self.assertAlmostEqual(0.99, histogram.percentile(99), delta=0.99 * 0.05)
+        self.assertEqual(1, histogram.percentile(100))
+
+
+class MetricsTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.metrics = georequests.METRICS
+        georequests.METRICS = Metrics()
+        self.retry_policy = georequests.RETRY_POLICY
+        georequests.RETRY_POLICY = georequests.RetryPolicy(backoff=0.01)
+
+    def tearDown(self) -> None:
+        georequests.METRICS = self.metrics
+        georequests.RETRY_POLICY = self.retry_policy
+        super().tearDown()
+
+    def test_record(self):
+        metrics = Metrics()
+        events = []
+        metrics.add_hook(events.append)
+        metrics.record('direcciones', 'POST', 200, 0.2, bytes_in=100, bytes_out=50)
+        metrics.record('direcciones', 'POST', 503, 0.1, attempt=1)
+        metrics.record('provincias', 'GET', error=ConnectionError())
+
+        other = Metrics()
+        other.record('provincias', 'GET', 200, 0.1, bytes_in=10)
+        metrics.merge(other.endpoints)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(3, len(events))
+        self.assertEqual({'200': 1, '503': 1}, snapshot['endpoints']['direcciones']['statuses'])
+        self.assertEqual(1, snapshot['endpoints']['direcciones']['retries'])
+        self.assertEqual(2, snapshot['endpoints']['provincias']['requests'])
+        self.assertEqual(1, snapshot['endpoints']['provincias']['errors'])
+        self.assertEqual(110, snapshot['total']['bytes_in'])
+        self.assertEqual(4, snapshot['total']['latency']['count'])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'metrics.json')
+            metrics.to_json(filename)
+            with open(filename) as f:
+                self.assertEqual(4, json.load(f)['total']['requests'])
+
+    async def test_requests(self):
+        stand_in = GeorefStandIn(limits={'second': 1})
+        url = await stand_in.start()
+        self.addAsyncCleanup(stand_in.close)
+        self.addAsyncCleanup(georequests.close_async)
+        session = georequests.POOL.async_session()
+
+        await get_json_post_async(session, url, 'direcciones', {'direcciones': [{'direccion': 'Mitre 10'}]})
+        await get_json_async(session, url, 'provincias')
+
+        snapshot = georequests.METRICS.snapshot()['endpoints']
+        self.assertEqual(1, snapshot['direcciones']['requests'])
+        self.assertGreater(snapshot['direcciones']['bytes_out'], 0)
+        self.assertGreater(snapshot['direcciones']['bytes_in'], 0)
+        self.assertEqual({'200': 1, '429': 1}, snapshot['provincias']['statuses'])
+        self.assertEqual(1, snapshot['provincias']['retries'])
+        self.assertEqual(
+            {'limit': 1, 'min_remaining': 0, 'headroom': 0.0}, snapshot['provincias']['rate_limits']['second']
+        )
+
+    async def test_cached(self):
+        stand_in = GeorefStandIn(limits={})
+        url = await stand_in.start()
+        self.addAsyncCleanup(stand_in.close)
+        self.addAsyncCleanup(georequests.close_async)
+        session = georequests.POOL.async_session()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            georequests.configure_cache(os.path.join(tmp_dir, 'cache.sqlite'))
+            try:
+                for _ in range(3):
+                    await get_json_async(session, url, 'provincias')
+                    await get_json_post_async(session, url, 'direcciones', {'direcciones': [{'direccion': 'Mitre 1'}]})
+            finally:
+                georequests.configure_cache(None)
+
+        snapshot = georequests.METRICS.snapshot()
+        self.assertEqual(1, snapshot['endpoints']['provincias']['requests'])
+        self.assertEqual(2, snapshot['endpoints']['provincias']['cached'])
+        self.assertEqual(4, snapshot['total']['cached'])
+
+
+if __name__ == '__main__':
+    unittest.main()
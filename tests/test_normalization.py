@@ -1,13 +1,20 @@
 import asyncio
+import io
 import logging
 import os.path
+import tempfile
+import time
 import unittest
+import weakref
 
 import aiohttp
+import pandas as pd
 
-from georef_ar_py import utils
+from georef_ar_py import georequests, utils
 from georef_ar_py.__main__ import get_logger
-from georef_ar_py.normalization import AddressNormalizer, Address, NORM_TEMPLATE
+from georef_ar_py.normalization import AddressNormalizer, Address, AddressBatch, BatchController, Checkpoint, \
+    CsvShard, NORM_TEMPLATE, canonicalize, csv_shards
+from georef_ar_py.server import GeorefStandIn
 
 
 class Test(unittest.IsolatedAsyncioTestCase):
@@ -64,3 +71,335 @@ class Test(unittest.IsolatedAsyncioTestCase):
     def test_flatten_dict(self):
         output = list(utils.flatten_dict(NORM_TEMPLATE).keys())
         self.assertIsNotNone(output)
+
+    def test_flattener(self):
+        flattener = utils.Flattener(NORM_TEMPLATE)
+        self.assertEqual(list(utils.flatten_dict(NORM_TEMPLATE).keys()), flattener.columns)
+
+        record = {'altura': {'valor': 10, 'unidad': None}, 'calle': None, 'ubicacion': {'lat': -34.6, 'lon': -58.4}}
+        flat = flattener.flatten(record)
+        self.assertEqual(10, flat['altura_valor'])
+        self.assertIsNone(flat['calle_nombre'])
+
+        df = flattener.to_df([record, None, {'altura': {'valor': 'x'}}])
+        self.assertEqual('Int64', str(df['altura_valor'].dtype))
+        self.assertEqual('float64', str(df['ubicacion_lat'].dtype))
+        self.assertEqual([10], df['altura_valor'].dropna().tolist())
+        self.assertEqual(2, df['altura_valor'].isna().sum())
+        self.assertEqual(-58.4, df['ubicacion_lon'][0])
+
+    def test_canonicalize(self):
+        variants = ['Av. San Martín 150', 'AVENIDA SAN MARTIN 150', 'av san  martin N° 0150', 'Avda.San Martin150']
+        self.assertEqual({'avenida san martin 150'}, set(canonicalize(variants)))
+        values = [None, '', 'Gral. Paz nro. 1.500 Dpto. 3', 'RUTA 3.5', 'Avellaneda 10', '06', '06028010']
+        self.assertEqual(
+            [None, '', 'general paz 1500 dpto 3', 'ruta 3.5', 'avellaneda 10', '06', '06028010'],
+            canonicalize(values).tolist()
+        )
+
+    def test_pending_rows(self):
+        normalizer = AddressNormalizer()
+        batch = AddressBatch.from_addresses([Address('Mitre 1'), Address('Mitre 2'), Address('Mitre 1')])
+        rows, keys, duplicates = normalizer._pending_rows(batch)
+        self.assertEqual([0, 1], rows.tolist())
+        self.assertEqual([(2, (batch, 0))], duplicates)
+        batch.set_normalization(0, [{'nomenclatura': 'MITRE 1'}])
+        batch.set_normalization(1, [])
+        normalizer._release_queries(batch, rows, keys)
+
+        # Las consultas guardan solo el resultado y el lote se puede liberar
+        reference = weakref.ref(batch)
+        del batch, duplicates
+        self.assertIsNone(reference())
+        other = AddressBatch.from_addresses([Address('Mitre 1')])
+        _, _, duplicates = normalizer._pending_rows(other)
+        normalizer._copy_results(other, duplicates)
+        self.assertEqual([{'nomenclatura': 'MITRE 1'}], other.results)
+
+    async def test_batch_controller(self):
+        controller = BatchController(size=100, concurrency=2, max_concurrency=4, target_latency=1.0)
+
+        def event(status=200, latency=0.1, error=None, method='POST'):
+            return {'endpoint': 'direcciones', 'method': method, 'status': status, 'latency': latency, 'error': error}
+
+        for _ in range(2):
+            controller.observe(event())
+        controller.observe(event(method='GET', status=503))
+        self.assertEqual((120, 3), (controller.size, controller.concurrency))
+
+        controller.observe(event(status=503))
+        self.assertEqual((60, 1), (controller.size, controller.concurrency))
+        # La misma congestión no se cuenta dos veces dentro de una latencia media
+        controller._last_decrease = time.monotonic() + 1
+        controller.observe(event(status=None, error=asyncio.TimeoutError()))
+        self.assertEqual((60, 1), (controller.size, controller.concurrency))
+        controller._last_decrease = 0.0
+        controller.observe(event(latency=2.0))
+        self.assertEqual((30, 1), (controller.size, controller.concurrency))
+
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        controller.observe(event())
+        await asyncio.sleep(0)
+        self.assertTrue(waiter.done())
+        self.assertEqual(2, controller.concurrency)
+        self.assertEqual(40, controller.take(50))
+        self.assertEqual({'increases': 3, 'decreases': 2}, {
+            key: value for key, value in controller.snapshot().items() if key in ['increases', 'decreases']
+        })
+
+
+class StandInNormalizationTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.stand_in = GeorefStandIn(limits={})
+        self.url = self.stand_in.start_in_thread()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.stand_in.stop_thread()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def _settled_queries(self, endpoint='direcciones', timeout=2.0):
+        """ Las consultas recibidas, una vez que el servidor terminó de leer las peticiones ya enviadas. """
+        queries = self.stand_in.stats['queries'][endpoint]
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            if queries == self.stand_in.stats['queries'][endpoint]:
+                break
+            queries = self.stand_in.stats['queries'][endpoint]
+        return queries
+
+    def test_csv2csv_dedup(self):
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        rows = [{'direccion': 'Mitre {}'.format(i % 10 + 1), 'provincia': 'Chaco'} for i in range(30)]
+        pd.DataFrame(rows).to_csv(source, index=False)
+
+        normalizer = AddressNormalizer(url=self.url, chunk_size=7, data_size=4)
+        normalizer.csv2csv(source, target)
+
+        # 10 direcciones únicas más la consulta de get_limits()
+        self.assertEqual(11, self.stand_in.stats['queries']['direcciones'])
+        # Por defecto la provincia se consulta como texto, sin resolverla antes a un ID
+        self.assertEqual(0, self.stand_in.stats['queries']['provincias'])
+        self.assertAlmostEqual(2 / 3, normalizer.dedup_ratio)
+        df = pd.read_csv(target)
+        self.assertEqual(30, len(df))
+        self.assertTrue((df['altura_valor'] == [i % 10 + 1 for i in range(30)]).all())
+        self.assertEqual(1, df.groupby('direccion')['nomenclatura'].nunique().max())
+
+    def test_csv2csv_dedup_size(self):
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        numbers = [i // 3 + 1 for i in range(15)] + [i % 5 + 1 for i in range(15)]
+        pd.DataFrame([{'direccion': 'Mitre {}'.format(n)} for n in numbers]).to_csv(source, index=False)
+
+        normalizer = AddressNormalizer(url=self.url, chunk_size=7, data_size=4, dedup_size=2)
+        normalizer.csv2csv(source, target)
+
+        # Las repeticiones seguidas se agrupan; en la segunda mitad cada dirección ya se olvidó al reaparecer
+        self.assertEqual(5 + 15 + 1, self.stand_in.stats['queries']['direcciones'])
+        df = pd.read_csv(target)
+        self.assertEqual(numbers, df['altura_valor'].tolist())
+
+    def test_csv2csv_canonical(self):
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        variants = ['Av. San Martín 150', 'AVENIDA SAN MARTIN 150', 'av san  martin N° 150', 'Mitre 10', 'MITRE 10']
+        pd.DataFrame([{'direccion': variant, 'provincia': 'CHACO'} for variant in variants]).to_csv(source, index=False)
+
+        AddressNormalizer(url=self.url).csv2csv(source, target)
+
+        # 2 direcciones canónicas más la consulta de get_limits()
+        self.assertEqual(3, self.stand_in.stats['queries']['direcciones'])
+        df = pd.read_csv(target)
+        self.assertEqual(variants, df['direccion'].tolist())
+        self.assertEqual(['AVENIDA SAN MARTIN 150'] * 3, df['nomenclatura'].str.split(',').str[0].tolist()[:3])
+        self.assertEqual(['22'] * 5, df['provincia_id'].astype(str).tolist())
+
+    def test_csv2csv_context(self):
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        department = next(
+            record for record in self.stand_in.records('departamentos') if record['provincia']['id'] == '22'
+        )
+        provinces = ['Chaco', 'CHACO', 'Santa Fe', '82'] * 3
+        rows = [{'direccion': 'Mitre {}'.format(i + 1), 'provincia': province,
+                 'departamento': department['nombre'] if province != 'Santa Fe' else None}
+                for i, province in enumerate(provinces)]
+        pd.DataFrame(rows).to_csv(source, index=False)
+
+        normalizer = AddressNormalizer(url=self.url, chunk_size=4, resolve_context=True)
+        normalizer.csv2csv(source, target)
+
+        # Un valor canónico por provincia y el departamento dentro de Chaco y de Santa Fe, una sola vez
+        self.assertEqual(2, self.stand_in.stats['queries']['provincias'])
+        self.assertEqual(2, self.stand_in.stats['queries']['departamentos'])
+        self.assertEqual({'values': 4, 'resolved': 4, 'requests': 2}, normalizer.summary['context'])
+        df = pd.read_csv(target, dtype=str)
+        self.assertEqual(provinces, df['provincia'].tolist())
+        self.assertEqual(['22', '22', '82', '82'] * 3, df['provincia_id'].tolist())
+        self.assertEqual(department['id'], df['departamento_id'][0])
+
+    def test_csv2csv_pipeline(self):
+        self.stand_in.latency = 0.02
+        self.stand_in.jitter = 0.02
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        pd.DataFrame([{'direccion': 'Mitre {}'.format(i + 1)} for i in range(200)]).to_csv(source, index=False)
+
+        normalizer = AddressNormalizer(url=self.url, chunk_size=20, data_size=5, concurrency=20, queue_size=2)
+        normalizer.csv2csv(source, target)
+
+        df = pd.read_csv(target)
+        self.assertEqual(list(range(1, 201)), df['altura_valor'].tolist())
+
+    def test_csv2csv_adaptive(self):
+        self.stand_in.latency = 0.05
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        pd.DataFrame([{'direccion': 'Mitre {}'.format(i + 1)} for i in range(300)]).to_csv(source, index=False)
+
+        normalizer = AddressNormalizer(url=self.url, chunk_size=100, data_size=40, adaptive=True, target_latency=0.01)
+        normalizer.csv2csv(source, target)
+
+        self.assertEqual(list(range(1, 301)), pd.read_csv(target)['altura_valor'].tolist())
+        batching, = normalizer.batching
+        self.assertGreater(batching['decreases'], 0)
+        self.assertLess(batching['size'], 40)
+        self.assertEqual(40, batching['max_size'])
+
+    def test_normalize_iter(self):
+        self.stand_in.latency = 0.02
+        self.stand_in.jitter = 0.02
+
+        async def source():
+            for i in range(25):
+                if i == 20:
+                    await asyncio.sleep(0.2)
+                direccion = 'Mitre {}'.format(i + 1)
+                yield direccion if i % 2 else {'direccion': direccion, 'provincia': 'Chaco'}
+
+        async def normalize(addresses, **kwargs):
+            return [(index, address) async for index, address in normalizer.normalize_iter(addresses, **kwargs)]
+
+        normalizer = AddressNormalizer(url=self.url, data_size=8, queue_size=2)
+        requests = self.stand_in.stats['requests']['direcciones']
+        results = asyncio.run(normalize(source(), max_wait=0.05))
+        self.assertEqual(list(range(25)), [index for index, _ in results])
+        self.assertEqual(list(range(1, 26)), [address.normalization['altura']['valor'] for _, address in results])
+        self.assertEqual('22', results[0][1].normalization['provincia']['id'])
+        # Lotes de 8, 8 y 4 (por tiempo, antes de la pausa) y de 5 al terminar, más la consulta de get_limits()
+        self.assertEqual(requests + 5, self.stand_in.stats['requests']['direcciones'])
+
+        addresses = [Address('Mitre {}'.format(i + 1)) for i in range(30)]
+        results = asyncio.run(normalize(iter(addresses), batch_size=3, ordered=False))
+        self.assertEqual(list(range(30)), sorted(index for index, _ in results))
+        self.assertTrue(all(address is addresses[index] for index, address in results))
+        self.assertTrue(all(address.normalization for address in addresses))
+
+    def test_normalize_batch_bisect(self):
+        normalize_address = self.stand_in.normalize_address
+
+        def reject_invalid(params):
+            if params.get('direccion') == 'invalida':
+                raise ValueError('Dirección inválida')
+            return normalize_address(params)
+        self.stand_in.normalize_address = reject_invalid
+
+        addresses = [Address('Mitre {}'.format(i + 1)) for i in range(16)]
+        addresses[5] = Address('inválida')
+        normalizer = AddressNormalizer(url=self.url, concurrency=4)
+
+        async def normalize():
+            async with aiohttp.ClientSession() as session:
+                await normalizer.normalize_batch_addresses(session, addresses)
+        asyncio.run(normalize())
+
+        self.assertEqual(400, addresses[5].error['error']['status_code'])
+        self.assertEqual(15, sum(1 for address in addresses if address.normalization))
+        # 16 -> 8 -> 4 -> 2 -> 1: un POST por cada lote con errores y por cada mitad válida y dos GET en las hojas,
+        # más la consulta de get_limits()
+        self.assertEqual(5, self.stand_in.stats['statuses'][400])
+        self.assertEqual(10, self.stand_in.stats['requests']['direcciones'])
+
+    def test_normalize_batch_server_error(self):
+        addresses = [Address('Mitre {}'.format(i + 1)) for i in range(16)]
+        normalizer = AddressNormalizer(url=self.url)
+        self.assertIsNotNone(normalizer.rate_limiter)
+        self.stand_in.error_rate = 1.0
+        requests = self.stand_in.stats['requests']['direcciones']
+
+        async def normalize():
+            async with aiohttp.ClientSession() as session:
+                await normalizer.normalize_batch_addresses(session, addresses)
+        asyncio.run(normalize())
+
+        # Un solo POST con sus reintentos: un error del servidor no se aísla dividiendo el lote
+        self.assertEqual(1 + georequests.RETRY_POLICY.max_retries,
+                         self.stand_in.stats['requests']['direcciones'] - requests)
+        self.assertTrue(all(address.error['error']['status_code'] in (500, 502, 503) for address in addresses))
+        self.assertEqual(16, normalizer._errors_count)
+
+    def test_csv_shards(self):
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        rows = [{'direccion': 'Mitre {}'.format(i + 1), 'id': i} for i in range(1000)]
+        pd.DataFrame(rows).to_csv(source, index=False)
+
+        shards = csv_shards(source, 4)
+        self.assertEqual(4, len(shards))
+        self.assertEqual(1000, sum(CsvShard.count_rows(source, *shard) for shard in shards))
+        dfs = [pd.read_csv(io.BufferedReader(CsvShard(source, *shard))) for shard in shards]
+        self.assertEqual(list(range(1000)), pd.concat(dfs)['id'].tolist())
+        self.assertEqual(1, len(csv_shards(source, 1)))
+
+    def test_csv2csv_workers(self):
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        pd.DataFrame([{'direccion': 'Mitre {}'.format(i + 1)} for i in range(300)]).to_csv(source, index=False)
+
+        normalizer = AddressNormalizer(url=self.url, chunk_size=25, data_size=10)
+        normalizer.csv2csv(source, target, workers=3)
+
+        df = pd.read_csv(target)
+        self.assertEqual(list(range(1, 301)), df['altura_valor'].tolist())
+        self.assertEqual(300, normalizer._normalized_count)
+        self.assertEqual(['direcciones.csv', 'normalizadas.csv'], sorted(os.listdir(self.tmp_dir.name)))
+
+    def test_csv2csv_resume(self):
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        pd.DataFrame([{'direccion': 'Mitre {}'.format(i + 1)} for i in range(100)]).to_csv(source, index=False)
+
+        class InterruptedNormalizer(AddressNormalizer):
+            def _append_chunk(self, writer, df):
+                if df['altura_valor'].iloc[0] > 40:
+                    raise KeyboardInterrupt
+                # Una escritura lenta deja terminar las consultas de los chunks siguientes
+                time.sleep(0.05)
+                return super()._append_chunk(writer, df)
+
+        with self.assertRaises(KeyboardInterrupt):
+            InterruptedNormalizer(url=self.url, chunk_size=10, data_size=5, queue_size=2).csv2csv(source, target)
+        checkpoint = Checkpoint.for_target(target)
+        # Los contadores del checkpoint son los de las filas escritas, sin los chunks en curso
+        self.assertEqual((40, 40, 0), tuple(checkpoint.load()[key] for key in ['rows', 'normalized', 'errors']))
+        with open(target, 'a') as f:
+            f.write('Mitre 41,41,in')
+
+        queries = self._settled_queries()
+        normalizer = AddressNormalizer(url=self.url, chunk_size=10, data_size=5)
+        normalizer.csv2csv(source, target, resume=True)
+
+        self.assertEqual(100, normalizer.summary['normalized'])
+        self.assertEqual(61, self.stand_in.stats['queries']['direcciones'] - queries)
+        self.assertFalse(checkpoint.exists())
+        df = pd.read_csv(target)
+        self.assertEqual(list(range(1, 101)), df['altura_valor'].tolist())
+
@@ -0,0 +1,88 @@
+import os
+import unittest
+
+from aiohttp import ClientResponseError
+import pytest as pytest
+
+from georef_ar_py import georequests
+from georef_ar_py.constants import ENTITIES
+from georef_ar_py.georequests import get_json_async, get_json_post_async
+from georef_ar_py.info import get_resume
+from georef_ar_py.server import GeorefStandIn
+
+
+class StandInTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.retry_policy = georequests.RETRY_POLICY
+        georequests.RETRY_POLICY = georequests.RetryPolicy(max_retries=0)
+
+    def tearDown(self) -> None:
+        georequests.RETRY_POLICY = self.retry_policy
+        super().tearDown()
+
+    async def _start(self, **kwargs):
+        stand_in = GeorefStandIn(**kwargs)
+        url = await stand_in.start()
+        self.addAsyncCleanup(stand_in.close)
+        self.addAsyncCleanup(georequests.close_async)
+        return stand_in, url, georequests.POOL.async_session()
+
+    async def test_get_resume(self):
+        stand_in, url, _ = await self._start(size=300)
+        resume = await get_resume(url)
+        self.assertEqual(24, resume['provincias']['total'])
+        for entity in ENTITIES[1:]:
+            self.assertEqual(300, resume[entity]['total'])
+        self.assertEqual(300, sum(province['calles'] for province in resume['provincias'].values()
+                                  if isinstance(province, dict) and 'calles' in province))
+
+    async def test_direcciones(self):
+        stand_in, url, session = await self._start()
+        response = await get_json_async(session, url, 'direcciones', direccion='Av. Corrientes 1234', provincia='22')
+        normalization = response['direcciones'][0]
+        self.assertEqual(1234, normalization['altura']['valor'])
+        self.assertEqual('Chaco', normalization['provincia']['nombre'])
+
+        data = {'direcciones': [{'direccion': 'San Martin 390', 'max': 1}, {'direccion': 'sin altura', 'max': 1}]}
+        response = await get_json_post_async(session, url, 'direcciones', data)
+        self.assertEqual(2, len(response['resultados']))
+        self.assertEqual(1, response['resultados'][0]['total'])
+        self.assertEqual([], response['resultados'][1]['direcciones'])
+        self.assertEqual(3, stand_in.stats['queries']['direcciones'])
+
+    async def test_ubicacion(self):
+        _, url, session = await self._start()
+        data = {'ubicaciones': [{'lat': -32.94, 'lon': -60.63, 'aplanar': True}]}
+        response = await get_json_post_async(session, url, 'ubicacion', data)
+        self.assertIn('provincia_id', response['resultados'][0]['ubicacion'])
+
+    async def test_fixtures(self):
+        fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'response_api')
+        _, url, session = await self._start(fixtures=fixtures)
+        response = await get_json_async(session, url, 'provincias', nombre='sant fe', max=1)
+        self.assertEqual('82', response['provincias'][0]['id'])
+        response = await get_json_async(session, url, 'calles', max=5000)
+        self.assertEqual(10, response['total'])
+
+    async def test_rate_limit(self):
+        _, url, session = await self._start(limits={'second': 2, 'minute': 100})
+        for _ in range(2):
+            async with session.get(url + 'provincias') as response:
+                self.assertEqual(200, response.status)
+        async with session.get(url + 'provincias') as response:
+            self.assertEqual(429, response.status)
+            self.assertEqual('0', response.headers['x-ratelimit-remaining-second'])
+            self.assertEqual('97', response.headers['x-ratelimit-remaining-minute'])
+            self.assertIn('Retry-After', response.headers)
+
+    async def test_errors(self):
+        stand_in, url, session = await self._start(error_rate=1, error_statuses=[503])
+        with pytest.raises(ClientResponseError):
+            await get_json_async(session, url, 'provincias')
+        self.assertEqual(1, stand_in.stats['statuses'][503])
+
+
+if __name__ == '__main__':
+    unittest.main()
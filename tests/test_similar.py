@@ -1,10 +1,12 @@
+import concurrent.futures
 import json
 import os
+import time
 import unittest
 from unittest import mock
 
 import georef_ar_py
-from georef_ar_py.similar import get_similar_bulk
+from georef_ar_py.similar import ContextResolver, get_similar_bulk
 
 
 def get_mocked_similar_san_juan():
@@ -42,3 +44,66 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(len(response[0]), 0)
         self.assertEqual(response[1]['id'], '82')
         self.assertEqual(response[1]['nombre'], 'Santa Fe')
+
+    @mock.patch('georef_ar_py.similar.get_json_post')
+    def test_context_resolver(self, mock_get_json):
+        def post(url, endpoint, data):
+            key = endpoint.replace('-', '_')
+            ids = {('sant fe', None): '82', ('rosario', '82'): '82084'}
+            return {'resultados': [
+                {key: [{'id': ids[query['nombre'], query.get('provincia')]}]
+                 if (query['nombre'], query.get('provincia')) in ids else []}
+                for query in data[key]
+            ]}
+
+        mock_get_json.side_effect = post
+        resolver = ContextResolver()
+        columns = {
+            'provincia': ['sant fe', 'sant fe', '06', None, 'pxa'],
+            'departamento': ['rosario', 'rosario', 'rosario', None, None],
+            'localidad_censal': [None] * 5,
+        }
+        resolved = resolver.resolve(columns)
+        self.assertEqual(['82', '82', '06', None, 'pxa'], resolved['provincia'])
+        self.assertEqual(['82084', '82084', 'rosario', None, None], resolved['departamento'])
+        self.assertEqual(
+            [{'nombre': 'rosario', 'max': 1, 'provincia': '82'}, {'nombre': 'rosario', 'max': 1, 'provincia': '06'}],
+            mock_get_json.call_args_list[1].args[2]['departamentos']
+        )
+
+        # Los valores ya consultados, encontrados o no, no se vuelven a pedir
+        self.assertEqual(resolved, resolver.resolve(columns))
+        self.assertEqual(2, mock_get_json.call_count)
+        self.assertEqual({'values': 4, 'resolved': 2, 'requests': 2}, resolver.snapshot())
+
+    @mock.patch('georef_ar_py.similar.MAX_BULK', 1)
+    @mock.patch('georef_ar_py.similar.get_json_post')
+    def test_context_resolver_error(self, mock_get_json):
+        mock_get_json.side_effect = [
+            ValueError('Error del servidor'), {'resultados': [{'provincias': [{'id': '82'}]}]}
+        ]
+        resolver = ContextResolver()
+        columns = {'provincia': ['chaco', 'sant fe'], 'departamento': [None] * 2, 'localidad_censal': [None] * 2}
+        resolved = resolver.resolve(columns)
+        self.assertEqual(['chaco', '82'], resolved['provincia'])
+
+        # El valor que falló no se vuelve a pedir
+        self.assertEqual(resolved, resolver.resolve(columns))
+        self.assertEqual(2, mock_get_json.call_count)
+        self.assertEqual({'values': 2, 'resolved': 1, 'requests': 2}, resolver.snapshot())
+
+    @mock.patch('georef_ar_py.similar.get_json_post')
+    def test_context_resolver_threads(self, mock_get_json):
+        def post(url, endpoint, data):
+            time.sleep(0.01)
+            return {'resultados': [{'provincias': [{'id': '82'}]} for _ in data['provincias']]}
+
+        mock_get_json.side_effect = post
+        resolver = ContextResolver()
+        columns = {'provincia': ['sant fe'] * 3, 'departamento': [None] * 3, 'localidad_censal': [None] * 3}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: resolver.resolve(columns), range(8)))
+
+        self.assertTrue(all(result['provincia'] == ['82'] * 3 for result in results))
+        self.assertEqual(1, mock_get_json.call_count)
+        self.assertEqual({'values': 1, 'resolved': 1, 'requests': 1}, resolver.snapshot())
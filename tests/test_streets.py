@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from georef_ar_py.normalization import AddressNormalizer
+from georef_ar_py.server import GeorefStandIn
+from georef_ar_py.streets import StreetIndex
+
+
+def street(street_id, name, start, end, locality, coordinates=None):
+    record = {
+        'id': street_id,
+        'nombre': name,
+        'categoria': 'AV',
+        'altura': {'inicio': {'derecha': start, 'izquierda': start + 1}, 'fin': {'derecha': end, 'izquierda': end - 1}},
+        'provincia': {'id': '06', 'nombre': 'Buenos Aires'},
+        'departamento': {'id': '06035', 'nombre': 'Avellaneda'},
+        'localidad_censal': {'id': locality, 'nombre': 'Localidad {}'.format(locality[-3:])},
+    }
+    if coordinates:
+        record['geometria'] = {'type': 'LineString', 'coordinates': coordinates}
+    return record
+
+
+class StreetIndexTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.index = StreetIndex.from_records([
+            street('1', 'SAN MARTIN', 0, 1000, '06035010', [[-58.0, -34.0], [-58.0, -34.1]]),
+            street('2', 'SAN MARTIN', 1000, 2000, '06035010', [[-58.0, -34.1], [-58.1, -34.1]]),
+            street('3', 'BELGRANO', 0, 500, '06035010'),
+            street('4', 'BELGRANO', 0, 500, '06035020'),
+        ])
+
+    def test_resolve(self):
+        normalization, score = self.index.normalize('Av. San Martín 1500', localidad_censal='06035010')
+        self.assertEqual(1.0, score)
+        self.assertEqual('2', normalization['calle']['id'])
+        self.assertEqual('SAN MARTIN 1500, Avellaneda, Buenos Aires', normalization['nomenclatura'])
+        self.assertAlmostEqual(-58.05, normalization['ubicacion']['lon'])
+
+        normalization, score = self.index.normalize('san martn 250', provincia='Buenos Aires')
+        self.assertLess(score, 1.0)
+        self.assertAlmostEqual(-34.025, normalization['ubicacion']['lat'])
+
+        normalization, score = self.index.normalize('Belgrano 100', localidad_censal='Localidad 020')
+        self.assertEqual('4', normalization['calle']['id'])
+        self.assertIsNone(normalization['ubicacion']['lat'])
+
+        # Ambigua sin localidad, altura fuera de rango y texto después de la altura
+        for direccion in ['Belgrano 100', 'San Martin 2500', 'San Martin 100 y Belgrano', 'Mitre 10']:
+            self.assertEqual((None, 0.0), self.index.normalize(direccion))
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'calles.npz')
+            self.index.save(filename)
+            index = StreetIndex.load(filename)
+        self.assertEqual(4, len(index))
+        self.assertEqual(
+            self.index.normalize('San Martin 10', localidad_censal='06035010'),
+            index.normalize('San Martin 10', localidad_censal='06035010')
+        )
+
+
+class StandInStreetIndexTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.stand_in = GeorefStandIn(limits={}, size=300)
+        self.url = self.stand_in.start_in_thread()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.stand_in.stop_thread()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def test_csv2csv(self):
+        index = StreetIndex.download(self.url)
+        self.assertEqual(300, len(index))
+
+        streets = self.stand_in.records('calles')[:20]
+        rows = [
+            {'direccion': '{} {}'.format(record['nombre'], 10), 'localidad_censal': record['localidad_censal']['id']}
+            for record in streets
+        ] + [{'direccion': 'Calle inexistente 10', 'localidad_censal': None}]
+        source = os.path.join(self.tmp_dir.name, 'direcciones.csv')
+        target = os.path.join(self.tmp_dir.name, 'normalizadas.csv')
+        pd.DataFrame(rows).to_csv(source, index=False)
+        queries = self.stand_in.stats['queries']['direcciones']
+
+        normalizer = AddressNormalizer(url=self.url, street_index=index)
+        normalizer.csv2csv(source, target)
+
+        # Solo la calle inexistente y la consulta de get_limits() llegan a la API
+        self.assertEqual(queries + 2, self.stand_in.stats['queries']['direcciones'])
+        df = pd.read_csv(target, dtype=str)
+        self.assertEqual([record['id'] for record in streets], df['calle_id'].tolist()[:20])
+        self.assertEqual(21, df['nomenclatura'].notna().sum())
+
+
+if __name__ == '__main__':
+    unittest.main()